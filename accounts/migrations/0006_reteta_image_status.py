@@ -0,0 +1,18 @@
+# Generated by Django 2.2.2 on 2026-10-17 06:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_reteta_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reteta',
+            name='image_status',
+            field=models.CharField(blank=True, choices=[('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], max_length=16),
+        ),
+    ]
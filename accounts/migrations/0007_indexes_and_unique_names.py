@@ -0,0 +1,73 @@
+# Generated by Django 2.2.2 on 2026-10-17 06:54
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_names(apps, schema_editor):
+    """Merge the tags/ingredients a user has more than once by name
+
+    The oldest row is kept and takes over the retete of the others.
+    """
+    Reteta = apps.get_model('accounts', 'Reteta')
+    db = schema_editor.connection.alias
+    for model_name, field, column in (('Tag', 'tags', 'tag_id'),
+                                      ('Ingredient', 'ingredients',
+                                       'ingredient_id')):
+        model = apps.get_model('accounts', model_name)
+        through = getattr(Reteta, field).through
+        duplicates = model.objects.using(db).values(
+            'user_id', 'name'
+        ).annotate(keep=Min('id'), count=Count('id')).filter(count__gt=1)
+        for group in duplicates:
+            others = list(model.objects.using(db).filter(
+                user_id=group['user_id'], name=group['name']
+            ).exclude(id=group['keep']).values_list('id', flat=True))
+            linked = set(through.objects.using(db).filter(
+                **{column: group['keep']}
+            ).values_list('reteta_id', flat=True))
+            moved = set(through.objects.using(db).filter(
+                **{column + '__in': others}
+            ).values_list('reteta_id', flat=True)) - linked
+            through.objects.using(db).bulk_create([
+                through(reteta_id=reteta_id, **{column: group['keep']})
+                for reteta_id in moved
+            ])
+            model.objects.using(db).filter(id__in=others).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_reteta_image_status'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reteta',
+            index=models.Index(fields=['user', '-id'], name='reteta_user_id_desc'),
+        ),
+        migrations.RunPython(
+            merge_duplicate_names, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('user', 'name'), name='unique_ingredient_name_per_user'),
+        ),
+        migrations.AddConstraint(
+            model_name='tag',
+            constraint=models.UniqueConstraint(fields=('user', 'name'), name='unique_tag_name_per_user'),
+        ),
+        # the auto-created through tables only index each column alone,
+        # these serve the tag/ingredient -> retete subqueries
+        migrations.RunSQL(
+            'CREATE INDEX accounts_reteta_tags_tag_reteta '
+            'ON accounts_reteta_tags (tag_id, reteta_id)',
+            'DROP INDEX accounts_reteta_tags_tag_reteta',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX accounts_reteta_ingredients_ingredient_reteta '
+            'ON accounts_reteta_ingredients (ingredient_id, reteta_id)',
+            'DROP INDEX accounts_reteta_ingredients_ingredient_reteta',
+        ),
+    ]
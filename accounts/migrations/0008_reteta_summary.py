@@ -0,0 +1,63 @@
+# Generated by Django 2.2.2 on 2026-10-17 07:15
+
+from django.db import migrations, models
+
+
+def _line(names):
+    return ' '.join(name.replace('\n', ' ') for name in names)
+
+
+def fill_summary(apps, schema_editor):
+    """Fill the summary columns of the existing retete
+
+    A frozen copy of reteta.summary.compute() as of this migration, the
+    app code follows the current models.
+    """
+    Reteta = apps.get_model('accounts', 'Reteta')
+    retete = Reteta.objects.using(schema_editor.connection.alias)
+    ids = list(retete.order_by('id').values_list('id', flat=True))
+    fields = ('ingredient_count', 'tag_names', 'search_text')
+    for start in range(0, len(ids), 500):
+        batch = list(retete.filter(id__in=ids[start:start + 500]).only(
+            'id', 'title'
+        ).prefetch_related('ingredients', 'tags'))
+        for reteta in batch:
+            ingredient_names = sorted(
+                obj.name for obj in reteta.ingredients.all()
+            )
+            tag_names = sorted(obj.name for obj in reteta.tags.all())
+            reteta.ingredient_count = len(ingredient_names)
+            reteta.tag_names = '\n'.join(
+                name.replace('\n', ' ') for name in tag_names
+            )
+            reteta.search_text = '\n'.join((
+                reteta.title.replace('\n', ' '), _line(ingredient_names),
+                _line(tag_names),
+            )).lower()
+        retete.bulk_update(batch, fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_indexes_and_unique_names'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reteta',
+            name='ingredient_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='reteta',
+            name='search_text',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='reteta',
+            name='tag_names',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.RunPython(fill_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 2.2.2 on 2026-10-17 07:27
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill(apps, schema_editor):
+    """Log the existing objects, the first sync of a client sends them"""
+    ChangeLog = apps.get_model('accounts', 'ChangeLog')
+    for model, name in (('Reteta', 'reteta'), ('Tag', 'tag'),
+                        ('Ingredient', 'ingredient')):
+        rows = apps.get_model('accounts', model).objects.order_by(
+            'id'
+        ).values_list('user_id', 'id')
+        ChangeLog.objects.bulk_create((
+            ChangeLog(user_id=user_id, model=name, object_id=pk)
+            for user_id, pk in rows.iterator()
+        ), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLog',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(choices=[('reteta', 'Reteta'), ('tag', 'Tag'), ('ingredient', 'Ingredient')], max_length=16)),
+                ('object_id', models.IntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='changelog',
+            index=models.Index(fields=['user', 'id'], name='changelog_user_id'),
+        ),
+        migrations.AddIndex(
+            model_name='changelog',
+            index=models.Index(fields=['model', 'object_id'], name='changelog_object'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
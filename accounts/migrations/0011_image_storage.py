@@ -0,0 +1,19 @@
+# Generated by Django 2.2.2 on 2026-10-17 07:42
+
+from django.db import migrations, models
+import reteta.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0010_changelog'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='reteta',
+            name='image',
+            field=models.ImageField(blank=True, storage=reteta.storage.ContentAddressedStorage(), upload_to='photos/'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+from django.db import migrations
+from django.db.models import Count, Min
+from django.db.models.functions import Lower
+
+
+def merge_case_duplicates(apps, schema_editor):
+    """Merge the tags/ingredients a user has in several letter cases
+
+    The oldest row is kept and takes over the retete of the others.
+    """
+    Reteta = apps.get_model('accounts', 'Reteta')
+    db = schema_editor.connection.alias
+    for model_name, field, column in (('Tag', 'tags', 'tag_id'),
+                                      ('Ingredient', 'ingredients',
+                                       'ingredient_id')):
+        model = apps.get_model('accounts', model_name)
+        through = getattr(Reteta, field).through
+        rows = model.objects.using(db).annotate(name_key=Lower('name'))
+        duplicates = rows.values('user_id', 'name_key').annotate(
+            keep=Min('id'), count=Count('id')
+        ).filter(count__gt=1)
+        for group in duplicates:
+            others = list(rows.filter(
+                user_id=group['user_id'], name_key=group['name_key']
+            ).exclude(id=group['keep']).values_list('id', flat=True))
+            linked = set(through.objects.using(db).filter(
+                **{column: group['keep']}
+            ).values_list('reteta_id', flat=True))
+            moved = set(through.objects.using(db).filter(
+                **{column + '__in': others}
+            ).values_list('reteta_id', flat=True)) - linked
+            through.objects.using(db).bulk_create([
+                through(reteta_id=reteta_id, **{column: group['keep']})
+                for reteta_id in moved
+            ])
+            model.objects.using(db).filter(id__in=others).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_image_storage'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_case_duplicates, migrations.RunPython.noop
+        ),
+        # names are unique per user regardless of case, the bulk create
+        # of reteta.bulk.get_or_create_named relies on it under
+        # concurrent requests; Django 2.2 has no expression indexes
+        migrations.RunSQL(
+            'CREATE UNIQUE INDEX accounts_tag_user_lower_name '
+            'ON accounts_tag (user_id, lower(name))',
+            'DROP INDEX accounts_tag_user_lower_name',
+        ),
+        migrations.RunSQL(
+            'CREATE UNIQUE INDEX accounts_ingredient_user_lower_name '
+            'ON accounts_ingredient (user_id, lower(name))',
+            'DROP INDEX accounts_ingredient_user_lower_name',
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 2.2.2 on 2026-10-17 07:48
+
+import accounts.models
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_usage(apps, schema_editor):
+    Reteta = apps.get_model('accounts', 'Reteta')
+    db = schema_editor.connection.alias
+    for model_name, field, column in (('Tag', 'tags', 'tag_id'),
+                                      ('Ingredient', 'ingredients',
+                                       'ingredient_id')):
+        through = getattr(Reteta, field).through
+        counts = through.objects.using(db).filter(
+            **{column: OuterRef('pk')}
+        ).values(column).annotate(count=Count('*')).values('count')
+        apps.get_model('accounts', model_name).objects.using(db).update(
+            usage_count=Coalesce(Subquery(counts), 0,
+                                 output_field=IntegerField())
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0012_unique_lower_names'),
+    ]
+
+    operations = [
+        # the indexes of 0012 are lost when SQLite rebuilds the tables
+        # below, they are declared on the models from now on
+        migrations.RunSQL(
+            'DROP INDEX IF EXISTS accounts_tag_user_lower_name',
+            'CREATE UNIQUE INDEX accounts_tag_user_lower_name '
+            'ON accounts_tag (user_id, lower(name))',
+        ),
+        migrations.RunSQL(
+            'DROP INDEX IF EXISTS accounts_ingredient_user_lower_name',
+            'CREATE UNIQUE INDEX accounts_ingredient_user_lower_name '
+            'ON accounts_ingredient (user_id, lower(name))',
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='usage_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='usage_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['user', '-usage_count', 'id'], name='ingredient_user_usage'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['user', '-usage_count', 'id'], name='tag_user_usage'),
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=accounts.models.UniqueLowerIndex(fields=['user', 'name'], name='ingredient_user_lower_name'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=accounts.models.UniqueLowerIndex(fields=['user', 'name'], name='tag_user_lower_name'),
+        ),
+        migrations.RunPython(count_usage, migrations.RunPython.noop),
+    ]
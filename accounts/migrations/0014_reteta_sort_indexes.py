@@ -0,0 +1,25 @@
+# Generated by Django 2.2.2 on 2026-10-17 08:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0013_usage_count'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reteta',
+            index=models.Index(fields=['user', 'time_minutes', 'id'], name='reteta_user_time_minutes'),
+        ),
+        migrations.AddIndex(
+            model_name='reteta',
+            index=models.Index(fields=['user', 'price', 'id'], name='reteta_user_price'),
+        ),
+        migrations.AddIndex(
+            model_name='reteta',
+            index=models.Index(fields=['user', 'title', 'id'], name='reteta_user_title'),
+        ),
+    ]
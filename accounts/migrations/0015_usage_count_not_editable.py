@@ -0,0 +1,27 @@
+# Generated by Django 2.2.2 on 2026-10-17 08:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0014_reteta_sort_indexes'),
+    ]
+
+    # editable is not in the schema, Django 2.2 would still rebuild the
+    # SQLite tables
+    operations = [
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.AlterField(
+                model_name='ingredient',
+                name='usage_count',
+                field=models.PositiveIntegerField(default=0, editable=False),
+            ),
+            migrations.AlterField(
+                model_name='tag',
+                name='usage_count',
+                field=models.PositiveIntegerField(default=0, editable=False),
+            ),
+        ]),
+    ]
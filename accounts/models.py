@@ -4,6 +4,8 @@ from django.contrib.auth.models import (
 )
 from django.conf import settings
 
+from reteta.storage import ContentAddressedStorage
+
 
 class UserManager(BaseUserManager):
 
@@ -47,25 +49,109 @@ class User(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = 'email'
 
 
-class Tag(models.Model):
+class UniqueLowerIndex(models.Index):
+    """UNIQUE index on the fields, the last one compared in lowercase
+
+    Django 2.2 has no expression indexes. Declared on the model, unlike
+    RunSQL, SQLite recreates it when a migration rebuilds the table.
+    """
+
+    def create_sql(self, model, schema_editor, using=''):
+        quote = schema_editor.quote_name
+        columns = [quote(model._meta.get_field(name).column)
+                   for name in self.fields]
+        columns[-1] = 'lower(%s)' % columns[-1]
+        return 'CREATE UNIQUE INDEX %s ON %s (%s)' % (
+            quote(self.name), quote(model._meta.db_table), ', '.join(columns)
+        )
+
+
+class UsageCountModelMixin:
+    """Leave usage_count out of the UPDATE of an existing row
+
+    The count only changes through UPDATEs relative to the stored value
+    (reteta.signals), the one loaded with the instance may be stale.
+    """
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            update_fields = kwargs.get('update_fields')
+            if update_fields is None:
+                deferred = self.get_deferred_fields()
+                update_fields = [
+                    field.attname for field in self._meta.concrete_fields
+                    if not field.primary_key
+                    and field.attname not in deferred
+                ]
+            kwargs['update_fields'] = [
+                name for name in update_fields if name != 'usage_count'
+            ]
+        super().save(*args, **kwargs)
+
+
+class Tag(UsageCountModelMixin, models.Model):
     """Tag to be used for reteta"""
     name = models.CharField(max_length=255)
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
     )
+    # also bumped when it is added to or removed from a reteta
+    updated_at = models.DateTimeField(auto_now=True)
+    # retete using it, kept up to date by reteta.signals
+    usage_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        constraints = [
+            # also the (user, name) index the lists are ordered on
+            models.UniqueConstraint(
+                fields=['user', 'name'],
+                name='unique_tag_name_per_user'
+            ),
+        ]
+        indexes = [
+            # names are unique per user regardless of case, see
+            # reteta.bulk.get_or_create_named
+            UniqueLowerIndex(fields=['user', 'name'],
+                             name='tag_user_lower_name'),
+            # ?ordering=-usage_count, ?min_usage= and ?assigned_only=1
+            models.Index(fields=['user', '-usage_count', 'id'],
+                         name='tag_user_usage'),
+        ]
 
     def __str__(self):
         return self.name
 
 
-class Ingredient(models.Model):
+class Ingredient(UsageCountModelMixin, models.Model):
     """Ingredient"""
     name = models.CharField(max_length=255)
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
     )
+    # also bumped when it is added to or removed from a reteta
+    updated_at = models.DateTimeField(auto_now=True)
+    # retete using it, kept up to date by reteta.signals
+    usage_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        constraints = [
+            # also the (user, name) index the lists are ordered on
+            models.UniqueConstraint(
+                fields=['user', 'name'],
+                name='unique_ingredient_name_per_user'
+            ),
+        ]
+        indexes = [
+            # names are unique per user regardless of case, see
+            # reteta.bulk.get_or_create_named
+            UniqueLowerIndex(fields=['user', 'name'],
+                             name='ingredient_user_lower_name'),
+            # ?ordering=-usage_count, ?min_usage= and ?assigned_only=1
+            models.Index(fields=['user', '-usage_count', 'id'],
+                         name='ingredient_user_usage'),
+        ]
 
     def __str__(self):
         return self.name
@@ -73,6 +159,17 @@ class Ingredient(models.Model):
 
 class Reteta(models.Model):
     """Reteta object"""
+    IMAGE_PENDING = 'pending'
+    IMAGE_PROCESSING = 'processing'
+    IMAGE_READY = 'ready'
+    IMAGE_FAILED = 'failed'
+    IMAGE_STATUS_CHOICES = (
+        (IMAGE_PENDING, 'Pending'),
+        (IMAGE_PROCESSING, 'Processing'),
+        (IMAGE_READY, 'Ready'),
+        (IMAGE_FAILED, 'Failed'),
+    )
+
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
@@ -83,7 +180,84 @@ class Reteta(models.Model):
     link = models.CharField(max_length=255, blank=True)
     ingredients = models.ManyToManyField('Ingredient')
     tags = models.ManyToManyField('Tag')
-    image = models.ImageField(upload_to='photos/', blank=True)
+    # named after their content and shared by identical uploads
+    image = models.ImageField(
+        upload_to='photos/', storage=ContentAddressedStorage(), blank=True
+    )
+    # state of the variants generated by reteta.images
+    image_status = models.CharField(
+        max_length=16,
+        choices=IMAGE_STATUS_CHOICES,
+        blank=True
+    )
+    # summary of the tags and ingredients, kept up to date by
+    # reteta.summary so that lists do not read the M2M tables
+    ingredient_count = models.PositiveIntegerField(default=0)
+    # sorted, one per line
+    tag_names = models.TextField(blank=True, default='')
+    # lowercase title, ingredient names and tag names, one line each
+    search_text = models.TextField(blank=True, default='')
+    # also bumped by the changes of its tags, ingredients and image,
+    # the Last-Modified/ETag of the API
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # the retete list: WHERE user_id = ? ORDER BY id DESC
+            models.Index(fields=['user', '-id'], name='reteta_user_id_desc'),
+            # MAX(updated_at) of the retete of a user
+            models.Index(fields=['user', 'updated_at'],
+                         name='reteta_user_updated_at'),
+            # ?ordering= and the range filters of the retete list, read
+            # forwards or backwards, see RetetaViewSet.orderings
+            models.Index(fields=['user', 'time_minutes', 'id'],
+                         name='reteta_user_time_minutes'),
+            models.Index(fields=['user', 'price', 'id'],
+                         name='reteta_user_price'),
+            models.Index(fields=['user', 'title', 'id'],
+                         name='reteta_user_title'),
+        ]
 
     def __str__(self):
         return self.title
+
+
+class ChangeLog(models.Model):
+    """Latest change of a reteta, tag or ingredient, see reteta.changelog
+
+    A change replaces the previous entry of the object, so the entries
+    after a sync checkpoint are the objects changed since, once each.
+    """
+    RETETA = 'reteta'
+    TAG = 'tag'
+    INGREDIENT = 'ingredient'
+    MODEL_CHOICES = (
+        (RETETA, 'Reteta'),
+        (TAG, 'Tag'),
+        (INGREDIENT, 'Ingredient'),
+    )
+
+    # no constraint, the tombstones outlive the rows of the user while
+    # it is deleted (see reteta.signals)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+',
+    )
+    model = models.CharField(max_length=16, choices=MODEL_CHOICES)
+    object_id = models.IntegerField()
+    deleted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # the sync: WHERE user_id = ? AND id > ? ORDER BY id
+            models.Index(fields=['user', 'id'], name='changelog_user_id'),
+            # replacing the entry of an object
+            models.Index(fields=['model', 'object_id'],
+                         name='changelog_object'),
+        ]
+
+    def __str__(self):
+        return '%s %s' % (self.model, self.object_id)
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class RetetaConfig(AppConfig):
     name = 'reteta'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,362 @@
+import itertools
+import math
+import random
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from accounts.models import Tag, Ingredient, Reteta
+from user.authentication import token_cache
+from . import images, search, similarity, summary
+
+
+@contextmanager
+def rolled_back():
+    """Run the block in a transaction that is always rolled back"""
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+def seed_dataset(users=1, retete=1000, tags=50, ingredients=200,
+                 tags_per_reteta=4, ingredients_per_reteta=8, seed=0):
+    """Create a synthetic catalog with bulk inserts and return its users
+
+    No model signals are sent, the derived data is filled afterwards:
+    the usage counts, the summary columns and the search index.
+    """
+    rng = random.Random(seed)
+    get_user_model().objects.bulk_create([
+        get_user_model()(
+            email='bench%d@bench.local' % i,
+            name='Bench %d' % i,
+            password=make_password(None)
+        )
+        for i in range(users)
+    ])
+    seeded = list(get_user_model().objects.filter(
+        email__endswith='@bench.local'
+    ).order_by('id'))
+
+    for user in seeded:
+        Tag.objects.bulk_create(
+            [Tag(user=user, name='Tag %d' % i) for i in range(tags)]
+        )
+        Ingredient.objects.bulk_create([
+            Ingredient(user=user, name='Ingredient %d' % i)
+            for i in range(ingredients)
+        ])
+        Reteta.objects.bulk_create([
+            Reteta(
+                user=user,
+                title='Reteta %d' % i,
+                time_minutes=rng.randint(5, 240),
+                price=rng.randint(100, 99999) / 100,
+            )
+            for i in range(retete)
+        ])
+
+        tag_ids = list(
+            Tag.objects.filter(user=user).values_list('id', flat=True)
+        )
+        ingredient_ids = list(
+            Ingredient.objects.filter(user=user).values_list('id', flat=True)
+        )
+        reteta_ids = list(
+            Reteta.objects.filter(user=user).values_list('id', flat=True)
+        )
+        Reteta.tags.through.objects.bulk_create([
+            Reteta.tags.through(reteta_id=reteta_id, tag_id=tag_id)
+            for reteta_id in reteta_ids
+            for tag_id in rng.sample(
+                tag_ids, min(tags_per_reteta, len(tag_ids))
+            )
+        ])
+        Reteta.ingredients.through.objects.bulk_create([
+            Reteta.ingredients.through(
+                reteta_id=reteta_id, ingredient_id=ingredient_id
+            )
+            for reteta_id in reteta_ids
+            for ingredient_id in rng.sample(
+                ingredient_ids,
+                min(ingredients_per_reteta, len(ingredient_ids))
+            )
+        ])
+        for model in (Tag, Ingredient):
+            summary.recount_usage(model, model.objects.filter(user=user))
+        search.index(summary.refresh(reteta_ids, touch=False))
+
+    return seeded
+
+
+def timed(func, repeat=5):
+    """Call `func` `repeat` times, return (median ms, last result)"""
+    durations = []
+    result = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        durations.append((time.perf_counter() - start) * 1000)
+    return statistics.median(durations), result
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of `values`"""
+    ordered = sorted(values)
+    rank = max(int(math.ceil(percent / 100 * len(ordered))), 1)
+    return ordered[rank - 1]
+
+
+class Scenario:
+    """One API call to measure
+
+    `prepare()` runs before every call, outside of the measurements, and
+    returns the (path, data, format) of the request. `cleanup()` runs once
+    after the last call.
+    """
+
+    def __init__(self, name, method, prepare, cleanup=None):
+        self.name = name
+        self.method = method
+        self.prepare = prepare
+        self.cleanup = cleanup
+
+
+def _jpeg():
+    output = BytesIO()
+    Image.new('RGB', (64, 64)).save(output, format='JPEG')
+    return SimpleUploadedFile('bench.jpg', output.getvalue(),
+                              content_type='image/jpeg')
+
+
+def api_scenarios(user, password):
+    """Return a Scenario for every route of the reteta and user APIs
+
+    `user` owns the catalog the read endpoints go through and must have
+    `password` for the token endpoint.
+    """
+    counter = itertools.count()
+    tag_ids = list(Tag.objects.filter(user=user).order_by('id')
+                   .values_list('id', flat=True)[:4])
+    ingredient_ids = list(Ingredient.objects.filter(user=user).order_by('id')
+                          .values_list('id', flat=True)[:8])
+    reteta_id = Reteta.objects.filter(user=user).order_by('-id') \
+        .values_list('id', flat=True).first()
+    created = []
+
+    def new_reteta():
+        reteta = Reteta.objects.create(
+            user=user, title='Bench', time_minutes=1, price=1
+        )
+        created.append(reteta.id)
+        return reteta.id
+
+    def reteta_payload():
+        return {'title': 'Bench %d' % next(counter), 'time_minutes': 5,
+                'price': '1.50', 'tags': tag_ids,
+                'ingredients': ingredient_ids}
+
+    def delete_images():
+        for reteta in Reteta.objects.filter(id__in=created):
+            if reteta.image:
+                images.delete_variants(reteta.image.name)
+                reteta.image.delete(save=False)
+
+    def get(url, params=None):
+        return lambda: (url, params, None)
+
+    tags_url = reverse('reteta:tag-list')
+    ingredients_url = reverse('reteta:ingredient-list')
+    retete_url = reverse('reteta:reteta-list')
+    detail_url = reverse('reteta:reteta-detail', args=[reteta_id])
+    ids = ','.join(str(pk) for pk in tag_ids)
+    pantry = ','.join(str(pk) for pk in ingredient_ids)
+    return [
+        Scenario('tags-list', 'get', get(tags_url)),
+        Scenario('tags-list-assigned', 'get',
+                 get(tags_url, {'assigned_only': 1})),
+        Scenario('tags-list-usage', 'get',
+                 get(tags_url, {'ordering': '-usage_count',
+                                'fields': 'id,name,usage_count'})),
+        Scenario('tags-create', 'post', lambda: (
+            tags_url, {'name': 'Bench tag %d' % next(counter)}, 'json'
+        )),
+        Scenario('tags-create-bulk', 'post', lambda: (
+            tags_url, [{'name': 'Tag %d' % i} for i in range(5)] + [
+                {'name': 'Bench tag %d' % next(counter)} for i in range(15)
+            ], 'json'
+        )),
+        Scenario('ingredients-list', 'get', get(ingredients_url)),
+        Scenario('ingredients-create', 'post', lambda: (
+            ingredients_url,
+            {'name': 'Bench ingredient %d' % next(counter)}, 'json'
+        )),
+        Scenario('retete-list', 'get', get(retete_url)),
+        Scenario('retete-list-fields', 'get',
+                 get(retete_url, {'fields': 'id,title,time_minutes'})),
+        Scenario('retete-list-tags-any', 'get',
+                 get(retete_url, {'tags': ids})),
+        Scenario('retete-list-tags-all', 'get',
+                 get(retete_url, {'tags': ids, 'match': 'all'})),
+        Scenario('retete-list-sorted', 'get',
+                 get(retete_url, {'ordering': '-price', 'max_time': 60})),
+        Scenario('retete-list-pantry', 'get',
+                 get(retete_url, {'pantry': pantry, 'max_missing': 2})),
+        Scenario('retete-list-search', 'get',
+                 get(retete_url, {'search': 'reteta 1'})),
+        Scenario('retete-create', 'post',
+                 lambda: (retete_url, reteta_payload(), 'json')),
+        Scenario('retete-retrieve', 'get', get(detail_url)),
+        Scenario('retete-update', 'put',
+                 lambda: (detail_url, reteta_payload(), 'json')),
+        Scenario('retete-partial-update', 'patch', lambda: (
+            detail_url, {'title': 'Bench %d' % next(counter)}, 'json'
+        )),
+        Scenario('retete-destroy', 'delete', lambda: (
+            reverse('reteta:reteta-detail', args=[new_reteta()]), None, None
+        )),
+        Scenario('retete-upload-image', 'post', lambda: (
+            reverse('reteta:reteta-upload-image', args=[new_reteta()]),
+            {'image': _jpeg()}, 'multipart'
+        ), cleanup=delete_images),
+        Scenario('retete-similar', 'get',
+                 get(reverse('reteta:reteta-similar', args=[reteta_id]))),
+        Scenario('retete-export', 'get',
+                 get(reverse('reteta:reteta-export'))),
+        Scenario('sync', 'get', get(reverse('reteta:sync'))),
+        Scenario('retete-bulk', 'post', lambda: (
+            reverse('reteta:reteta-bulk'),
+            [dict(reteta_payload(), tags=['Tag 1', 'Bench bulk'],
+                  ingredients=['Ingredient 1']) for i in range(10)],
+            'json'
+        )),
+        Scenario('user-create', 'post', lambda: (
+            reverse('user:create'), {
+                'email': 'bench-new%d@bench.local' % next(counter),
+                'password': 'benchpass', 'name': 'Bench',
+            }, 'json'
+        )),
+        Scenario('user-token', 'post', lambda: (
+            reverse('user:token'),
+            {'email': user.email, 'password': password}, 'json'
+        )),
+        Scenario('user-me', 'get', get(reverse('user:me'))),
+        Scenario('user-me-update', 'patch', lambda: (
+            reverse('user:me'), {'name': 'Bench %d' % next(counter)}, 'json'
+        )),
+    ]
+
+
+def _call(client, scenario):
+    path, data, fmt = scenario.prepare()
+    kwargs = {'format': fmt} if fmt else {}
+    response = getattr(client, scenario.method)(path, data, **kwargs)
+    if response.streaming:
+        b''.join(response.streaming_content)
+    if response.status_code >= 400:
+        raise AssertionError('%s answered %d: %s' % (
+            scenario.name, response.status_code, response.content[:200]
+        ))
+    return response
+
+
+def run_scenario(client, scenario, repeat=10):
+    """Measure `scenario`, return its metrics
+
+    The first call starts from empty caches and records the query count
+    and the peak of memory allocated while it runs, the next `repeat`
+    ones are timed.
+    """
+    cache.clear()
+    token_cache.clear()
+    similarity.clear()
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            _call(client, scenario)
+        # read now, the query log is reset when the next request starts
+        count = len(queries)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    durations = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        _call(client, scenario)
+        durations.append((time.perf_counter() - start) * 1000)
+    if scenario.cleanup is not None:
+        scenario.cleanup()
+
+    return {
+        'queries': count,
+        'p50_ms': round(percentile(durations, 50), 3),
+        'p95_ms': round(percentile(durations, 95), 3),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def run_api_benchmark(user, password, repeat=10, only=None):
+    """Run every API scenario as `user`, return {name: metrics}"""
+    # imported here, APIClient needs the settings to be configured
+    from rest_framework.test import APIClient
+
+    token, created = Token.objects.get_or_create(user=user)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+    results = {}
+    hosts = list(settings.ALLOWED_HOSTS) + ['testserver']
+    # the similarity indexes of the (rolled back) dataset
+    index_dir = tempfile.mkdtemp()
+    try:
+        with override_settings(ALLOWED_HOSTS=hosts,
+                               SIMILAR={'INDEX_DIR': index_dir}):
+            for scenario in api_scenarios(user, password):
+                if only and scenario.name not in only:
+                    continue
+                results[scenario.name] = run_scenario(
+                    client, scenario, repeat
+                )
+    finally:
+        shutil.rmtree(index_dir)
+        similarity.clear()
+    return results
+
+
+def regressions(results, baseline, threshold=0.5, min_ms=1.0):
+    """Describe the results worse than `baseline`
+
+    A scenario regresses when it runs more queries, or when its p95 grows
+    by more than `threshold` (0.5 = 50%) and at least `min_ms`.
+    """
+    found = []
+    for name, metrics in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if metrics['queries'] > base['queries']:
+            found.append('%s: %d queries, baseline %d' % (
+                name, metrics['queries'], base['queries']
+            ))
+        limit = max(base['p95_ms'] * (1 + threshold),
+                    base['p95_ms'] + min_ms)
+        if metrics['p95_ms'] > limit:
+            found.append('%s: p95 %.2f ms, baseline %.2f ms' % (
+                name, metrics['p95_ms'], base['p95_ms']
+            ))
+    return found
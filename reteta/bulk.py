@@ -0,0 +1,249 @@
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from accounts.models import Tag, Ingredient, Reteta
+from . import changelog
+from .cache import invalidate_lists
+from .serializers import RetetaBulkItemSerializer
+from .signals import bulk_saved, touch
+
+# Reteta columns written from a bulk item
+FIELDS = ('title', 'time_minutes', 'price', 'link')
+# (item key, related model, column of the M2M through table)
+RELATIONS = (
+    ('ingredients', Ingredient, 'ingredient_id'),
+    ('tags', Tag, 'tag_id'),
+)
+# names looked up per query, under the 999 parameters of SQLite
+NAME_BATCH_SIZE = 300
+
+
+def name_keys(names):
+    """Return {name: key} of the case-insensitive uniqueness of names
+
+    The keys are what lower() of the database gives, as the unique
+    (user, lower(name)) index: SQLite only folds the ASCII letters,
+    "Ăpa" and "ăpa" are two names there. Names in ASCII are folded here,
+    the others by the database.
+    """
+    keys = {}
+    others = []
+    for name in names:
+        if not name or max(name) <= '\x7f':
+            keys[name] = name.lower()
+        elif name not in keys:
+            keys[name] = None
+            others.append(name)
+    with connection.cursor() as cursor:
+        for start in range(0, len(others), NAME_BATCH_SIZE):
+            batch = others[start:start + NAME_BATCH_SIZE]
+            cursor.execute(
+                'SELECT %s' % ', '.join(['LOWER(%s)'] * len(batch)), batch
+            )
+            keys.update(zip(batch, cursor.fetchone()))
+    return keys
+
+
+def get_or_create_named(model, user, names):
+    """Return {name: row} of the tags/ingredients of a user by name
+
+    Names are matched case-insensitively, see name_keys(), the rows
+    missing for the user are created with the first spelling given.
+    Rows created at the same time by another request are picked up
+    instead: the unique (user, lower(name)) index of the table ignores
+    the duplicates. Returns (rows, the IDs of the rows created).
+    """
+    keys = name_keys(names)
+    spellings = {}
+    for name, key in keys.items():
+        spellings.setdefault(key, name)
+    if not spellings:
+        return {}, set()
+
+    rows = _named(model, user, spellings)
+    missing = [key for key in spellings if key not in rows]
+    created = set()
+    if missing:
+        model.objects.bulk_create(
+            [model(user=user, name=spellings[key]) for key in missing],
+            ignore_conflicts=True
+        )
+        # bulk_create only sets the PKs on some backends
+        new = _named(model, user, missing)
+        created = {row.id for row in new.values()}
+        rows.update(new)
+        # no post_save either
+        invalidate_lists(user.pk)
+        changelog.record(model, user.pk, created)
+    return {name: rows[key] for name, key in keys.items()}, created
+
+
+def _named(model, user, keys):
+    """Return {key: row} of the rows of a user whose name has the keys"""
+    keys = list(keys)
+    rows = {}
+    for start in range(0, len(keys), NAME_BATCH_SIZE):
+        rows.update(
+            (row.name_key, row)
+            for row in model.objects.filter(user=user).annotate(
+                name_key=Lower('name')
+            ).filter(name_key__in=keys[start:start + NAME_BATCH_SIZE])
+        )
+    return rows
+
+
+class References:
+    """Map the IDs and names used in a bulk request to rows of a user"""
+
+    def __init__(self, model, user, refs):
+        ids = {ref for ref in refs if isinstance(ref, int)}
+        names = {ref for ref in refs if isinstance(ref, str)}
+
+        self.by_id = model.objects.filter(
+            user=user, id__in=ids
+        ).in_bulk() if ids else {}
+        self.by_name, created = get_or_create_named(model, user, names)
+
+    def resolve(self, refs):
+        """Return (IDs, unknown IDs) for the references of one item"""
+        resolved, unknown = [], []
+        for ref in refs:
+            if isinstance(ref, str):
+                resolved.append(self.by_name[ref].id)
+            elif ref in self.by_id:
+                resolved.append(ref)
+            else:
+                unknown.append(ref)
+        # keep the first occurrence, through rows are unique
+        return list(dict.fromkeys(resolved)), unknown
+
+
+def bulk_upsert_retete(user, items, batch_size=500):
+    """Create or update many retete of a user in one transaction
+
+    Items with an `id` update that reteta, the others create a new one.
+    `ingredients` and `tags` may hold IDs or names, names missing for the
+    user are created. Invalid items are reported by their index and do not
+    stop the rest of the batch.
+    """
+    report = {'created': [], 'updated': [], 'errors': []}
+    valid = []
+    for index, item in enumerate(items):
+        serializer = RetetaBulkItemSerializer(data=item)
+        if serializer.is_valid():
+            valid.append((index, serializer.validated_data))
+        else:
+            report['errors'].append(
+                {'index': index, 'errors': serializer.errors}
+            )
+
+    with transaction.atomic():
+        references = {
+            key: References(
+                model, user,
+                [ref for index, data in valid for ref in data.get(key, ())]
+            )
+            for key, model, column in RELATIONS
+        }
+        existing = Reteta.objects.filter(
+            user=user,
+            id__in=[data['id'] for index, data in valid if 'id' in data]
+        ).in_bulk()
+
+        created, updated, related = [], [], {}
+        # IDs of the items above, only the first one of an ID is applied
+        seen = set()
+        for index, data in valid:
+            errors, links = {}, {}
+            for key, model, column in RELATIONS:
+                if key not in data:
+                    continue
+                links[key], unknown = references[key].resolve(data[key])
+                if unknown:
+                    errors[key] = ['Invalid pk "%s" - object does not exist.'
+                                   % pk for pk in unknown]
+            if 'id' in data:
+                if data['id'] not in existing:
+                    errors['id'] = ['Not found.']
+                elif data['id'] in seen:
+                    # the through rows of both would collide
+                    errors['id'] = ['Duplicate in this request.']
+                seen.add(data['id'])
+            if errors:
+                report['errors'].append({'index': index, 'errors': errors})
+                continue
+
+            if 'id' in data:
+                reteta = existing[data['id']]
+                for field in FIELDS:
+                    if field in data:
+                        setattr(reteta, field, data[field])
+                updated.append((index, reteta))
+            else:
+                reteta = Reteta(
+                    user=user,
+                    **{field: data[field] for field in FIELDS
+                       if field in data}
+                )
+                created.append((index, reteta))
+            related[index] = links
+
+        _save(created, updated, batch_size)
+        _link(user, created, updated, related, batch_size)
+        bulk_saved.send(
+            sender=Reteta, user=user,
+            retete=[reteta for index, reteta in created + updated]
+        )
+
+    report['created'] = [{'index': index, 'id': reteta.id}
+                         for index, reteta in created]
+    report['updated'] = [{'index': index, 'id': reteta.id}
+                         for index, reteta in updated]
+    report['errors'].sort(key=lambda error: error['index'])
+    return report
+
+
+def _save(created, updated, batch_size):
+    """Insert the new retete and update the existing ones in batches"""
+    new = [reteta for index, reteta in created]
+    if connection.features.can_return_ids_from_bulk_insert:
+        Reteta.objects.bulk_create(new, batch_size=batch_size)
+    else:
+        # the PKs are needed for the through rows
+        for reteta in new:
+            reteta.save(force_insert=True)
+    if updated:
+        # bulk_update() leaves the auto_now fields alone
+        now = timezone.now()
+        for index, reteta in updated:
+            reteta.updated_at = now
+        Reteta.objects.bulk_update(
+            [reteta for index, reteta in updated], FIELDS + ('updated_at',),
+            batch_size=batch_size
+        )
+
+
+def _link(user, created, updated, related, batch_size):
+    """Replace the through rows of the saved retete in batches"""
+    for key, model, column in RELATIONS:
+        through = getattr(Reteta, key).through
+        replaced = [reteta.id for index, reteta in updated
+                    if key in related[index]]
+        # no m2m_changed, bump and log the unlinked and linked rows and
+        # count their links here
+        usage = Counter()
+        if replaced:
+            links = through.objects.filter(reteta_id__in=replaced)
+            usage.subtract(links.values_list(column, flat=True))
+            links.delete()
+        rows = [
+            through(reteta_id=reteta.id, **{column: pk})
+            for index, reteta in created + updated
+            for pk in related[index].get(key, ())
+        ]
+        through.objects.bulk_create(rows, batch_size=batch_size)
+        usage.update(getattr(row, column) for row in rows)
+        touch(model, user.pk, usage, usage)
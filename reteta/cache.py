@@ -0,0 +1,171 @@
+import hashlib
+import uuid
+
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.utils.http import (
+    http_date, parse_etags, parse_http_date_safe, urlencode
+)
+from rest_framework import status
+from rest_framework.response import Response
+
+VERSION_KEY = 'reteta:lists:version:%s'
+LIST_KEY = 'reteta:lists:%s:%s'
+DELETED_KEY = 'reteta:deleted:%s'
+
+
+def list_version(user_id):
+    """Return the current version of the cached lists of a user"""
+    key = VERSION_KEY % user_id
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_lists(user_id):
+    """Make every cached list of a user stale"""
+    # old entries are never read again and simply expire
+    cache.set(VERSION_KEY % user_id, uuid.uuid4().hex, None)
+
+
+class CachedListMixin:
+    """Serve list responses from a per user cache with ETag support
+
+    Entries are keyed on the user, the list version of the user and the
+    query parameters. Writes bump the version (see reteta.signals), so an
+    unchanged version means the cached body and its ETag are still valid
+    and `If-None-Match` can be answered without touching the database.
+    """
+    list_cache_timeout = 60 * 5
+
+    def list(self, request, *args, **kwargs):
+        digest = self._list_digest(request)
+        etag = '"%s"' % digest
+        if _etag_matches(etag, request.META.get('HTTP_IF_NONE_MATCH')):
+            return Response(
+                status=status.HTTP_304_NOT_MODIFIED,
+                headers={'ETag': etag}
+            )
+
+        key = LIST_KEY % (request.user.pk, digest)
+        data = cache.get(key)
+        if data is None:
+            response = super().list(request, *args, **kwargs)
+            cache.set(key, response.data, self.list_cache_timeout)
+        else:
+            response = Response(data)
+        response['ETag'] = etag
+        return response
+
+    def _list_digest(self, request):
+        params = urlencode(sorted(request.query_params.lists()), doseq=True)
+        parts = (
+            request.path,
+            params,
+            str(request.user.pk),
+            list_version(request.user.pk),
+        )
+        return hashlib.md5('\n'.join(parts).encode()).hexdigest()
+
+
+def mark_deleted(user_id):
+    """Remember when a reteta of a user was last deleted
+
+    A deletion lowers no updated_at, this is the Last-Modified of the
+    lists from then on.
+    """
+    cache.set(DELETED_KEY % user_id, timezone.now(), None)
+
+
+class ConditionalGetMixin:
+    """Answer unchanged list and retrieve requests with 304 Not Modified
+
+    The validators come from one query on the updated_at of the rows of
+    the user: MAX(updated_at) and COUNT(*) for the lists (any filter and
+    page), the updated_at of the row for retrieve. They are checked
+    against If-None-Match, or If-Modified-Since, before anything is
+    serialized. Clients are asked to revalidate every time.
+    """
+
+    def list(self, request, *args, **kwargs):
+        state = self.queryset.filter(user=request.user).aggregate(
+            last_modified=Max('updated_at'), count=Count('id')
+        )
+        last_modified = max(
+            filter(None, (state['last_modified'],
+                          cache.get(DELETED_KEY % request.user.pk))),
+            default=None
+        )
+        return self._conditional(
+            (state['count'], last_modified), last_modified,
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            last_modified = self.queryset.filter(
+                user=request.user, pk=kwargs[self.lookup_field]
+            ).values_list('updated_at', flat=True).first()
+        except (TypeError, ValueError):
+            last_modified = None
+        if last_modified is None:
+            # the 404 of get_object()
+            return super().retrieve(request, *args, **kwargs)
+        return self._conditional(
+            (last_modified,), last_modified,
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def _conditional(self, state, last_modified, view, request, *args,
+                     **kwargs):
+        params = urlencode(sorted(request.query_params.lists()), doseq=True)
+        parts = (
+            request.get_host(),
+            request.path,
+            params,
+            request.accepted_media_type,
+            str(request.user.pk),
+        ) + tuple(str(value) for value in state)
+        etag = '"%s"' % hashlib.md5('\n'.join(parts).encode()).hexdigest()
+        headers = {'ETag': etag}
+        if last_modified is not None:
+            headers['Last-Modified'] = http_date(last_modified.timestamp())
+
+        if _not_modified(request, etag, last_modified):
+            response = Response(
+                status=status.HTTP_304_NOT_MODIFIED, headers=headers
+            )
+        else:
+            response = view(request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                for name, value in headers.items():
+                    response[name] = value
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+def _not_modified(request, etag, last_modified):
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if header:
+        # If-Modified-Since is ignored along with If-None-Match
+        return _etag_matches(etag, header)
+    since = parse_http_date_safe(
+        request.META.get('HTTP_IF_MODIFIED_SINCE', '')
+    )
+    return since is not None and last_modified is not None \
+        and int(last_modified.timestamp()) <= since
+
+
+def _etag_matches(etag, header):
+    """Weak comparison of `etag` with an If-None-Match header"""
+    if not header:
+        return False
+    etags = parse_etags(header)
+    if '*' in etags:
+        return True
+    return etag in [tag[2:] if tag.startswith('W/') else tag
+                    for tag in etags]
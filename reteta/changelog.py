@@ -0,0 +1,155 @@
+import base64
+import binascii
+import json
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from accounts.models import ChangeLog, Tag, Ingredient, Reteta
+
+# ChangeLog.model of the logged models
+MODELS = {
+    Reteta: ChangeLog.RETETA,
+    Tag: ChangeLog.TAG,
+    Ingredient: ChangeLog.INGREDIENT,
+}
+# objects replaced per DELETE/INSERT
+BATCH_SIZE = 500
+
+
+def _setting(name, default):
+    return getattr(settings, 'SYNC', {}).get(name, default)
+
+
+# (model, object ID) -> (user ID, deleted) of the open batch() of a thread
+_batch = threading.local()
+
+
+def record(model, user_id, ids, deleted=False):
+    """Log that objects of `model` owned by `user_id` changed
+
+    The previous entry of each object is replaced, `deleted` entries are
+    the tombstones sent to the clients that synced the objects before.
+    Inside batch() the entries are written when it ends.
+    """
+    entries = {(model, pk): (user_id, deleted) for pk in ids}
+    pending = getattr(_batch, 'pending', None)
+    if pending is None:
+        _write(entries)
+    else:
+        # the last change of an object wins, a deletion after a save
+        pending.update(entries)
+
+
+@contextmanager
+def batch():
+    """Log each object changed in the block once, when it ends
+
+    The block runs in a transaction, or in the one of the caller without
+    a savepoint, the entries are written at its end in the same
+    transaction. Nested batches join the outer one.
+    """
+    if getattr(_batch, 'pending', None) is not None:
+        yield
+        return
+    _batch.pending = {}
+    try:
+        with transaction.atomic(savepoint=False):
+            yield
+            pending, _batch.pending = _batch.pending, None
+            _write(pending)
+    finally:
+        _batch.pending = None
+
+
+def forget(user_id):
+    """Drop the entries of a deleted user from the open batch"""
+    pending = getattr(_batch, 'pending', None)
+    if pending:
+        for key, (owner, deleted) in list(pending.items()):
+            if owner == user_id:
+                del pending[key]
+
+
+def _write(entries):
+    groups = {}
+    for (model, pk), (user_id, deleted) in entries.items():
+        groups.setdefault((model, user_id, deleted), []).append(pk)
+    for (model, user_id, deleted), ids in groups.items():
+        name = MODELS[model]
+        ids = sorted(ids)
+        for start in range(0, len(ids), BATCH_SIZE):
+            batch = ids[start:start + BATCH_SIZE]
+            ChangeLog.objects.filter(model=name,
+                                     object_id__in=batch).delete()
+            ChangeLog.objects.bulk_create([
+                ChangeLog(user_id=user_id, model=name, object_id=pk,
+                          deleted=deleted)
+                for pk in batch
+            ])
+
+
+def encode_token(checkpoint):
+    payload = json.dumps({'c': checkpoint}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('ascii')).decode('ascii')
+
+
+def decode_token(token):
+    """Return the ChangeLog ID of a checkpoint token, 0 when empty"""
+    if not token:
+        return 0
+    try:
+        checkpoint = json.loads(
+            base64.urlsafe_b64decode(token.encode('ascii'))
+        )['c']
+    except (TypeError, ValueError, KeyError, UnicodeEncodeError,
+            binascii.Error):
+        checkpoint = None
+    if not isinstance(checkpoint, int) or checkpoint < 0:
+        raise ValidationError({'since': ['Invalid sync token.']})
+    return checkpoint
+
+
+def changes(user, since, limit=None):
+    """Return (entries, checkpoint, more) of a user after `since`
+
+    Entries of the last SETTLE_SECONDS are sent but not passed by the
+    checkpoint: a transaction that started earlier may still commit an
+    entry with a lower ID. Clients get those entries again with their
+    next sync, applying a change twice is harmless.
+    """
+    if limit is None:
+        limit = _setting('PAGE_SIZE', 500)
+    entries = list(ChangeLog.objects.filter(
+        user=user, id__gt=since
+    ).order_by('id')[:limit + 1])
+    more = len(entries) > limit
+    entries = entries[:limit]
+
+    cutoff = timezone.now() - timedelta(
+        seconds=_setting('SETTLE_SECONDS', 5)
+    )
+    checkpoint = since
+    for entry in entries:
+        if entry.created_at > cutoff:
+            # the next page starts at the same unsettled entry
+            more = False
+            break
+        checkpoint = entry.id
+    return entries, checkpoint, more
+
+
+def settled(user):
+    """Return the ID of the latest entry of a user older than
+    SETTLE_SECONDS, the changes logged up to it are all committed"""
+    cutoff = timezone.now() - timedelta(
+        seconds=_setting('SETTLE_SECONDS', 5)
+    )
+    return ChangeLog.objects.filter(
+        user=user, created_at__lte=cutoff
+    ).order_by('-id').values_list('id', flat=True).first() or 0
@@ -0,0 +1,65 @@
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from rest_framework.exceptions import ValidationError
+
+from accounts.models import Reteta
+
+MATCH_ANY = 'any'
+MATCH_ALL = 'all'
+
+
+def filter_related(queryset, field, ids, match=MATCH_ANY):
+    """Keep the retete linked to any or all of `ids` through `field`
+
+    The through table is only read in a subquery, so every reteta comes
+    back once, however many of the IDs it is linked to:
+
+        any: id IN (SELECT reteta_id ... WHERE tag_id IN ids)
+        all: id IN (SELECT reteta_id ... WHERE tag_id IN ids
+                    GROUP BY reteta_id HAVING COUNT(*) = len(ids))
+    """
+    if match not in (MATCH_ANY, MATCH_ALL):
+        raise ValidationError(
+            {'match': ['Expected "%s" or "%s".' % (MATCH_ANY, MATCH_ALL)]}
+        )
+    ids = set(ids)
+    through = getattr(Reteta, field).through
+    column = getattr(Reteta, field).field.m2m_reverse_name()
+    links = through.objects.filter(**{column + '__in': ids})
+    if match == MATCH_ALL:
+        links = links.values('reteta_id').annotate(
+            matched=Count(column)
+        ).filter(matched=len(ids))
+    return queryset.filter(id__in=links.values('reteta_id'))
+
+
+def filter_pantry(queryset, ids, max_missing=0):
+    """Keep the retete missing at most `max_missing` ingredients of `ids`
+
+    One grouped pass over the links of the pantry ingredients finds the
+    retete, comparing what they have with their ingredient_count
+    summary. The retete found are annotated with their `missing_count`:
+
+        WHERE id IN (SELECT reteta_id ... WHERE ingredient_id IN ids
+                     GROUP BY reteta_id
+                     HAVING ingredient_count - COUNT(*) <= max_missing)
+
+    Retete using none of the ingredients are left out.
+    """
+    ids = set(ids)
+    through = Reteta.ingredients.through
+    found = through.objects.filter(ingredient_id__in=ids).values(
+        'reteta_id'
+    ).annotate(
+        missing=F('reteta__ingredient_count') - Count('ingredient_id')
+    ).filter(missing__lte=max_missing)
+    # for the rows found only, reading their few links
+    have = through.objects.filter(reteta_id=OuterRef('pk')).order_by().values(
+        'reteta_id'
+    ).annotate(
+        count=Count('ingredient_id', filter=Q(ingredient_id__in=ids))
+    ).values('count')
+    return queryset.filter(id__in=found.values('reteta_id')).annotate(
+        missing_count=F('ingredient_count') - Subquery(
+            have, output_field=IntegerField()
+        )
+    )
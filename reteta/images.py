@@ -0,0 +1,212 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from accounts.models import Reteta
+from . import changelog
+
+logger = logging.getLogger(__name__)
+
+# variant -> (bounding box, Pillow format, file extension)
+VARIANTS = {
+    'thumbnail': ((200, 200), 'JPEG', 'jpg'),
+    'medium': ((800, 800), 'JPEG', 'jpg'),
+    'webp': ((800, 800), 'WEBP', 'webp'),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the pool processing the uploads of this process"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_PROCESSING_WORKERS', 2),
+                thread_name_prefix='reteta-images'
+            )
+        return _executor
+
+
+def variant_name(name, variant):
+    """'photos/a.jpg' -> 'photos/variants/a_thumbnail.jpg'"""
+    directory, base = os.path.split(os.path.splitext(name)[0])
+    extension = VARIANTS[variant][2]
+    return os.path.join(
+        directory, 'variants', '%s_%s.%s' % (base, variant, extension)
+    )
+
+
+def variant_urls(reteta):
+    """Return the URL of every variant once they are generated"""
+    if not reteta.image or reteta.image_status != Reteta.IMAGE_READY:
+        return {}
+    return {
+        variant: default_storage.url(variant_name(reteta.image.name, variant))
+        for variant in VARIANTS
+    }
+
+
+def delete_variants(name):
+    """Delete the variants generated for the image `name`"""
+    for variant in VARIANTS:
+        default_storage.delete(variant_name(name, variant))
+
+
+def schedule(reteta):
+    """Process the image of `reteta` in the background after commit"""
+    pk, name = reteta.pk, reteta.image.name
+    transaction.on_commit(lambda: get_executor().submit(run, pk, name))
+
+
+def run(pk, name):
+    """Worker entry point, the thread has its own DB connection"""
+    try:
+        process(pk, name)
+    except Exception:
+        logger.exception('Processing image %s of reteta %s failed', name, pk)
+    finally:
+        connection.close()
+
+
+def process(pk, name):
+    """Verify the image, strip its metadata and generate the variants
+
+    Does nothing if the reteta no longer has the image `name`, e.g. it
+    was replaced by a newer upload in the meantime.
+    """
+    current = Reteta.objects.filter(pk=pk, image=name)
+    if not current.update(
+        image_status=Reteta.IMAGE_PROCESSING, updated_at=timezone.now()
+    ):
+        return
+    if all(default_storage.exists(variant_name(name, variant))
+           for variant in VARIANTS):
+        # the same photo was uploaded and processed before, see
+        # reteta.storage.ContentAddressedStorage
+        current.update(
+            image_status=Reteta.IMAGE_READY, updated_at=timezone.now()
+        )
+        _log(pk)
+        return
+
+    try:
+        with default_storage.open(name) as f:
+            Image.open(f).verify()
+        with default_storage.open(name) as f:
+            image = Image.open(f)
+            image.load()
+    except Exception:
+        logger.warning('Reteta %s has an invalid image %s', pk, name)
+        current.update(
+            image_status=Reteta.IMAGE_FAILED, updated_at=timezone.now()
+        )
+        _log(pk)
+        return
+
+    fmt = image.format
+    # apply the EXIF orientation before the metadata is dropped
+    image = ImageOps.exif_transpose(image)
+    _replace(name, _encode(image, fmt))
+    for variant, (size, variant_fmt, extension) in VARIANTS.items():
+        resized = image.copy()
+        resized.thumbnail(size, Image.LANCZOS)
+        _replace(variant_name(name, variant), _encode(resized, variant_fmt))
+
+    current.update(
+        image_status=Reteta.IMAGE_READY, updated_at=timezone.now()
+    )
+    _log(pk)
+
+
+def _log(pk):
+    # update() sends no post_save, the clients sync the final status
+    user_id = Reteta.objects.filter(pk=pk).values_list(
+        'user_id', flat=True
+    ).first()
+    if user_id is not None:
+        changelog.record(Reteta, user_id, [pk])
+
+
+def _encode(image, fmt):
+    """Re-encode `image` without any of its metadata"""
+    if fmt == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    output = BytesIO()
+    image.save(output, format=fmt, quality=85)
+    return output.getvalue()
+
+
+def _replace(name, content):
+    # written aside and renamed over `name`, see reteta.storage
+    default_storage.save(name, ContentFile(content))
+
+
+def _grace_cutoff():
+    return timezone.now() - timedelta(
+        seconds=getattr(settings, 'IMAGE_ORPHAN_GRACE_SECONDS', 3600)
+    )
+
+
+def collect(names):
+    """Delete the images no reteta uses any more, after commit
+
+    Images are shared by the retete of identical uploads, a replaced or
+    deleted image is only deleted once no reteta has it. Files written
+    in the last IMAGE_ORPHAN_GRACE_SECONDS are left to collect_images,
+    an upload of the same photo may be about to use them.
+    """
+    names = {name for name in names if name}
+    if names:
+        transaction.on_commit(lambda: _collect(names))
+
+
+def _collect(names):
+    used = set(Reteta.objects.filter(image__in=names).values_list(
+        'image', flat=True
+    ))
+    cutoff = _grace_cutoff()
+    for name in names - used:
+        try:
+            if default_storage.get_modified_time(name) > cutoff:
+                continue
+        except OSError:
+            pass
+        default_storage.delete(name)
+        delete_variants(name)
+
+
+def orphans(directory='photos'):
+    """Yield the files of `directory` no reteta uses, past the grace"""
+    used = set()
+    for name in Reteta.objects.exclude(image='').values_list(
+            'image', flat=True).iterator():
+        used.add(name)
+        used.update(variant_name(name, variant) for variant in VARIANTS)
+    if not default_storage.exists(directory):
+        return
+    cutoff = _grace_cutoff()
+    for name in _walk(directory):
+        if name not in used and \
+                default_storage.get_modified_time(name) <= cutoff:
+            yield name
+
+
+def _walk(directory):
+    directories, files = default_storage.listdir(directory)
+    for name in files:
+        yield os.path.join(directory, name)
+    for name in directories:
+        yield from _walk(os.path.join(directory, name))
@@ -0,0 +1,81 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from reteta import benchmark
+
+BASELINE = os.path.join(settings.BASE_DIR, 'reteta', 'benchmark_baseline.json')
+PASSWORD = 'benchpass'
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure the query count, p50/p95 latency and peak memory of every '
+        'API endpoint on a seeded dataset that is rolled back afterwards, '
+        'and compare them to a JSON baseline'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2)
+        parser.add_argument('--retete', type=int, default=1000)
+        parser.add_argument('--tags', type=int, default=50)
+        parser.add_argument('--ingredients', type=int, default=200)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument(
+            '--only', default='',
+            help='Comma separated scenario names, all of them by default'
+        )
+        parser.add_argument('--baseline', default=BASELINE)
+        parser.add_argument(
+            '--save', action='store_true',
+            help='Write the results as the new baseline'
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=0.5,
+            help='Allowed p95 latency growth, 0.5 = 50%%'
+        )
+
+    def handle(self, *args, **options):
+        only = [name for name in options['only'].split(',') if name]
+        with benchmark.rolled_back():
+            user = benchmark.seed_dataset(
+                users=options['users'],
+                retete=options['retete'],
+                tags=options['tags'],
+                ingredients=options['ingredients'],
+            )[0]
+            user.set_password(PASSWORD)
+            user.save(update_fields=['password'])
+            results = benchmark.run_api_benchmark(
+                user, PASSWORD, options['repeat'], only
+            )
+
+        self.stdout.write('%-24s%9s%11s%11s%12s' % (
+            'scenario', 'queries', 'p50 ms', 'p95 ms', 'peak KiB'
+        ))
+        for name, metrics in results.items():
+            self.stdout.write('%-24s%9d%11.2f%11.2f%12.1f' % (
+                name, metrics['queries'], metrics['p50_ms'],
+                metrics['p95_ms'], metrics['peak_kb'],
+            ))
+
+        if options['save']:
+            with open(options['baseline'], 'w') as baseline:
+                json.dump(results, baseline, indent=2, sort_keys=True)
+                baseline.write('\n')
+            self.stdout.write('Baseline written to %s' % options['baseline'])
+            return
+
+        if not os.path.exists(options['baseline']):
+            self.stdout.write('No baseline at %s, run with --save'
+                              % options['baseline'])
+            return
+        with open(options['baseline']) as baseline:
+            found = benchmark.regressions(
+                results, json.load(baseline), options['threshold']
+            )
+        if found:
+            raise CommandError('Regressions:\n' + '\n'.join(found))
+        self.stdout.write('No regressions')
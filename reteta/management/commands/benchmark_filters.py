@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+
+from accounts.models import Tag, Reteta
+from reteta import benchmark, filters
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the tag filters of the retete list as the number of tags '
+        'grows, on a seeded dataset that is rolled back afterwards'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retete', type=int, default=5000)
+        parser.add_argument('--tags', type=int, default=64)
+        parser.add_argument('--tags-per-reteta', type=int, default=6)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument(
+            '--sizes', default='1,2,4,8,16,32',
+            help='Comma separated numbers of tags to filter on'
+        )
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        with benchmark.rolled_back():
+            user, = benchmark.seed_dataset(
+                retete=options['retete'],
+                tags=options['tags'],
+                tags_per_reteta=options['tags_per_reteta'],
+            )
+            tag_ids = list(
+                Tag.objects.filter(user=user).order_by('id')
+                .values_list('id', flat=True)
+            )
+            base = Reteta.objects.filter(user=user).order_by('-id')
+            modes = (
+                # what the list did before: one join row per matched tag
+                ('join', lambda ids: base.filter(tags__id__in=ids)),
+                ('any', lambda ids: filters.filter_related(
+                    base, 'tags', ids, filters.MATCH_ANY
+                )),
+                ('all', lambda ids: filters.filter_related(
+                    base, 'tags', ids, filters.MATCH_ALL
+                )),
+            )
+
+            self.stdout.write('%6s' % 'tags' + ''.join(
+                '%22s' % ('%s ms (rows)' % name) for name, query in modes
+            ))
+            for size in sizes:
+                ids = tag_ids[:size]
+                cells = []
+                for name, query in modes:
+                    ms, rows = benchmark.timed(
+                        lambda: list(query(ids).values_list('id', flat=True)),
+                        options['repeat']
+                    )
+                    cells.append('%22s' % ('%.2f (%d)' % (ms, len(rows))))
+                self.stdout.write('%6d' % size + ''.join(cells))
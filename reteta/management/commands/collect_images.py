@@ -0,0 +1,30 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from reteta import images
+
+
+class Command(BaseCommand):
+    help = ('Delete the uploaded images and variants no reteta uses, '
+            'older than IMAGE_ORPHAN_GRACE_SECONDS')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only list the files that would be deleted'
+        )
+
+    def handle(self, *args, **options):
+        count = 0
+        for name in images.orphans():
+            if options['dry_run'] or options['verbosity'] > 1:
+                self.stdout.write(name)
+            if not options['dry_run']:
+                default_storage.delete(name)
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            '%s %d unused files' % (
+                'Found' if options['dry_run'] else 'Deleted', count
+            )
+        ))
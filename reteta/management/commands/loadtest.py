@@ -0,0 +1,146 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+from reteta import benchmark
+
+PATHS = ('/api/reteta/retete/', '/api/reteta/tags/',
+         '/api/reteta/ingredients/')
+BENCH_EMAIL = 'bench0@bench.local'
+
+
+async def fetch(reader, writer, request):
+    """Send `request` on a keep-alive connection, return (status, close)"""
+    writer.write(request)
+    await writer.drain()
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('Connection closed')
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, value = line.decode('latin-1').split(':', 1)
+        headers[name.strip().lower()] = value.strip().lower()
+
+    close = headers.get('connection') == 'close'
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if not size:
+                break
+    else:
+        await reader.read()
+        close = True
+    return int(status_line.split()[1]), close
+
+
+async def client(url, paths, token, deadline, latencies, errors):
+    """Request `paths` in turn on one connection until `deadline`"""
+    parts = urlsplit(url)
+    requests = [(
+        'GET %s HTTP/1.1\r\nHost: %s\r\nAuthorization: Token %s\r\n'
+        'Connection: keep-alive\r\n\r\n'
+        % (parts.path.rstrip('/') + path, parts.netloc, token)
+    ).encode('latin-1') for path in paths]
+    writer = None
+    i = 0
+    while time.perf_counter() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(
+                    parts.hostname, parts.port or 80
+                )
+            start = time.perf_counter()
+            status, close = await fetch(
+                reader, writer, requests[i % len(requests)]
+            )
+            i += 1
+            if status >= 400:
+                errors.append(status)
+            else:
+                latencies.append((time.perf_counter() - start) * 1000)
+        except (ConnectionError, asyncio.IncompleteReadError, OSError):
+            errors.append('connection')
+            close = True
+        if close and writer is not None:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def load(url, paths, token, connections, duration):
+    latencies = []
+    errors = []
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*(
+        client(url, paths, token, deadline, latencies, errors)
+        for i in range(connections)
+    ))
+    return latencies, errors
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the throughput of running servers, typically the WSGI and '
+        'ASGI ones on the same database, with keep-alive connections. '
+        'Example: gunicorn setari.wsgi -b :8000 & '
+        'uvicorn setari.asgi:application --port 8001 & '
+        'manage.py loadtest --seed http://127.0.0.1:8000 '
+        'http://127.0.0.1:8001'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='+', help='Base URL of a server')
+        parser.add_argument(
+            '--path', action='append', dest='paths',
+            help='Path to request, repeatable, the API lists by default'
+        )
+        parser.add_argument('--connections', type=int, default=50)
+        parser.add_argument('--duration', type=float, default=10,
+                            help='Seconds per server')
+        parser.add_argument(
+            '--seed', action='store_true',
+            help='Create the %s catalog if missing (not rolled back)'
+            % BENCH_EMAIL
+        )
+        parser.add_argument('--retete', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        user = get_user_model().objects.filter(email=BENCH_EMAIL).first()
+        if user is None:
+            if not options['seed']:
+                raise CommandError(
+                    'No %s user, run with --seed' % BENCH_EMAIL
+                )
+            user, = benchmark.seed_dataset(retete=options['retete'])
+        token, created = Token.objects.get_or_create(user=user)
+        paths = options['paths'] or PATHS
+
+        self.stdout.write('%-32s%10s%8s%10s%10s%10s' % (
+            'server', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms'
+        ))
+        for url in options['urls']:
+            latencies, errors = asyncio.run(load(
+                url, paths, token.key,
+                options['connections'], options['duration']
+            ))
+            if not latencies:
+                raise CommandError('%s: no successful request (%s)' % (
+                    url, ', '.join(str(e) for e in set(errors))
+                ))
+            self.stdout.write('%-32s%10d%8d%10.1f%10.2f%10.2f' % (
+                url, len(latencies), len(errors),
+                len(latencies) / options['duration'],
+                benchmark.percentile(latencies, 50),
+                benchmark.percentile(latencies, 95),
+            ))
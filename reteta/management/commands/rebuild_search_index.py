@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from accounts.models import Reteta
+from reteta import search
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the full-text search index of the retete, from their '
+            'search_text (see repair_reteta_summary)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=search.BATCH_SIZE,
+            help='Retete indexed per transaction'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        backend = search.get_backend()
+        with connection.cursor() as cursor:
+            backend.create(cursor)
+            backend.clear(cursor)
+
+        total, last_id = 0, 0
+        while True:
+            ids = list(
+                Reteta.objects.filter(id__gt=last_id).order_by('id')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            with transaction.atomic():
+                search.reindex(ids)
+            total += len(ids)
+            last_id = ids[-1]
+            if options['verbosity'] > 1:
+                self.stdout.write('Indexed %d retete' % total)
+
+        self.stdout.write(self.style.SUCCESS('Indexed %d retete' % total))
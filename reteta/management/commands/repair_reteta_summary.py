@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from accounts.models import Reteta
+from reteta import search, summary
+
+
+class Command(BaseCommand):
+    help = ('Recompute the ingredient count, tag names and search text of '
+            'the retete, and the search index entries of the fixed ones')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=summary.BATCH_SIZE,
+            help='Retete checked per transaction'
+        )
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Only report the outdated retete, fail if there are any'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        total, stale, last_id = 0, [], 0
+        while True:
+            ids = list(
+                Reteta.objects.filter(id__gt=last_id).order_by('id')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            outdated = summary.check(ids)
+            if outdated and not options['check']:
+                with transaction.atomic():
+                    search.index(summary.refresh(outdated))
+            stale.extend(outdated)
+            total += len(ids)
+            last_id = ids[-1]
+            if options['verbosity'] > 1:
+                self.stdout.write('Checked %d retete' % total)
+
+        if options['check']:
+            if stale:
+                raise CommandError('%d of %d retete are outdated: %s' % (
+                    len(stale), total, ', '.join(map(str, stale))
+                ))
+            self.stdout.write(self.style.SUCCESS(
+                'Checked %d retete, none outdated' % total
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                'Checked %d retete, repaired %d' % (total, len(stale))
+            ))
@@ -0,0 +1,49 @@
+from django.db import migrations
+
+# a frozen copy of the SQL of reteta.search.SQLiteBackend and
+# PostgreSQLBackend as of this migration, the app code may change
+CREATE = {
+    'sqlite': [
+        'CREATE VIRTUAL TABLE IF NOT EXISTS reteta_search USING fts5('
+        'title, ingredients, tags, tokenize="unicode61")',
+    ],
+    'postgresql': [
+        'CREATE TABLE IF NOT EXISTS reteta_search ('
+        'reteta_id integer PRIMARY KEY REFERENCES accounts_reteta (id) '
+        'ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, '
+        'document tsvector NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS reteta_search_document ON reteta_search '
+        'USING gin(document)',
+    ],
+}
+# other databases search the summary without an index
+DROP = {
+    'sqlite': ['DROP TABLE IF EXISTS reteta_search'],
+    'postgresql': ['DROP TABLE IF EXISTS reteta_search'],
+}
+
+
+def _run(statements, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        for sql in statements.get(connection.vendor, []):
+            cursor.execute(sql)
+
+
+def create_index(apps, schema_editor):
+    _run(CREATE, schema_editor)
+
+
+def drop_index(apps, schema_editor):
+    _run(DROP, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_reteta_image_status'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
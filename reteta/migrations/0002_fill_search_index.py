@@ -0,0 +1,66 @@
+from django.db import migrations
+
+# a frozen copy of the SQL of reteta.search.SQLiteBackend and
+# PostgreSQLBackend as of this migration, the app code may change
+INSERT = {
+    'sqlite': 'INSERT INTO reteta_search (rowid, title, ingredients, tags) '
+              'VALUES (%s, %s, %s, %s)',
+    'postgresql': "INSERT INTO reteta_search (reteta_id, document) VALUES "
+                  "(%s, setweight(to_tsvector('simple', %s), 'A') || "
+                  "setweight(to_tsvector('simple', %s), 'B') || "
+                  "setweight(to_tsvector('simple', %s), 'C'))",
+}
+CLEAR = {
+    'sqlite': 'DELETE FROM reteta_search',
+    'postgresql': 'TRUNCATE reteta_search',
+}
+
+
+def _split(search_text):
+    """'title\\ningredients\\ntags' -> (title, ingredients, tags)"""
+    parts = search_text.split('\n', 2)
+    return tuple(parts + [''] * (3 - len(parts)))
+
+
+def fill_index(apps, schema_editor):
+    """Index the retete that existed before the search index
+
+    From the search_text filled by accounts 0008, in batches of 500.
+    """
+    connection = schema_editor.connection
+    if connection.vendor not in INSERT:
+        # searched without an index
+        return
+    Reteta = apps.get_model('accounts', 'Reteta')
+    retete = Reteta.objects.using(connection.alias).order_by('id')
+    ids = list(retete.values_list('id', flat=True))
+    with connection.cursor() as cursor:
+        cursor.execute(CLEAR[connection.vendor])
+        for start in range(0, len(ids), 500):
+            rows = retete.filter(id__in=ids[start:start + 500]).values_list(
+                'id', 'search_text'
+            )
+            cursor.executemany(INSERT[connection.vendor], [
+                (reteta_id,) + _split(search_text)
+                for reteta_id, search_text in rows
+            ])
+
+
+def clear_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor in CLEAR:
+        with connection.cursor() as cursor:
+            cursor.execute(CLEAR[connection.vendor])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reteta', '0001_search_index'),
+        # search_text of the existing retete
+        ('accounts', '0008_reteta_summary'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_index, clear_index),
+    ]
@@ -0,0 +1,194 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict, namedtuple
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from django.utils.translation import ugettext_lazy as _
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+Cursor = namedtuple('Cursor', ['reverse', 'position'])
+
+
+def _flip(field):
+    """'-name' -> 'name', 'id' -> '-id'"""
+    return field[1:] if field.startswith('-') else '-' + field
+
+
+class KeysetPagination(BasePagination):
+    """Paginate on the full ordering key instead of OFFSET scans
+
+    The view ordering must end with a unique field (usually 'id') so every
+    row has a distinct position. The cursor holds that position and each
+    page is fetched with a `WHERE (key) > (position) LIMIT n` predicate,
+    so deep pages cost the same as the first one.
+    """
+    cursor_query_param = 'cursor'
+    # None for REST_FRAMEWORK['PAGE_SIZE'], read when a page is asked for
+    page_size = None
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-id',)
+    invalid_cursor_message = _('Invalid cursor')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(view)
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is not None:
+            self.cursor = self.cursor._replace(
+                position=self._parse_position(queryset, self.cursor.position)
+            )
+
+        ordering = self.ordering
+        reverse = self.cursor is not None and self.cursor.reverse
+        if reverse:
+            ordering = tuple(_flip(field) for field in ordering)
+        queryset = queryset.order_by(*ordering)
+        if self.cursor is not None:
+            queryset = queryset.filter(
+                self._following(ordering, self.cursor.position)
+            )
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                page_size = int(
+                    request.query_params[self.page_size_query_param]
+                )
+            except (KeyError, ValueError):
+                pass
+            else:
+                if page_size > 0:
+                    return min(page_size, self.max_page_size)
+        if self.page_size is None:
+            return api_settings.PAGE_SIZE
+        return self.page_size
+
+    def get_ordering(self, view):
+        """Return the view ordering, falling back to the paginator one"""
+        if hasattr(view, 'get_ordering'):
+            ordering = view.get_ordering()
+        else:
+            ordering = getattr(view, 'ordering', None) or self.ordering
+        if isinstance(ordering, str):
+            ordering = (ordering,)
+        return tuple(ordering)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(
+            Cursor(reverse=False, position=self._position(self.page[-1]))
+        )
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(
+            Cursor(reverse=True, position=self._position(self.page[0]))
+        )
+
+    def decode_cursor(self, request):
+        """Return the Cursor passed in the request, or None"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            data = json.loads(
+                base64.urlsafe_b64decode(encoded.encode('ascii'))
+            )
+            position = data['p']
+            reverse = bool(data.get('r'))
+        except (TypeError, ValueError, KeyError, AttributeError,
+                binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+        if not isinstance(position, list) or \
+                len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return Cursor(reverse=reverse, position=position)
+
+    def encode_cursor(self, cursor):
+        """Return the URL of the page starting after `cursor`"""
+        data = {'p': cursor.position}
+        if cursor.reverse:
+            data['r'] = 1
+        # Decimals and datetimes go through str() and are parsed back by
+        # the model field when the cursor is used in a lookup
+        payload = json.dumps(data, default=str, separators=(',', ':'))
+        encoded = base64.urlsafe_b64encode(payload.encode('ascii'))
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, encoded.decode('ascii')
+        )
+
+    def _parse_position(self, queryset, position):
+        """Convert a decoded position to the values of the ordering
+
+        Model fields parse their value, annotations (search_rank...)
+        must be numbers, anything else is an invalid cursor.
+        """
+        values = []
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            if value is None or isinstance(value, (list, dict, bool)):
+                raise NotFound(self.invalid_cursor_message)
+            if name in queryset.query.annotations:
+                if not isinstance(value, (int, float)):
+                    raise NotFound(self.invalid_cursor_message)
+                values.append(value)
+                continue
+            try:
+                model_field = queryset.model._meta.get_field(name)
+                values.append(model_field.get_prep_value(
+                    model_field.to_python(value)
+                ))
+            except (FieldDoesNotExist, ValidationError, TypeError,
+                    ValueError):
+                raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def _position(self, instance):
+        return [getattr(instance, field.lstrip('-'))
+                for field in self.ordering]
+
+    def _following(self, ordering, position):
+        """Build the predicate matching rows after `position`"""
+        # (a, b) > (x, y)  ->  a > x OR (a = x AND b > y)
+        query = Q()
+        equal = {}
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            query |= Q(**{'%s__%s' % (name, lookup): value}, **equal)
+            equal[name] = value
+        return query
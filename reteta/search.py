@@ -0,0 +1,226 @@
+import re
+
+from django.db import connection
+from django.db.models import FloatField, Value
+from django.db.models.expressions import RawSQL
+
+from accounts.models import Reteta
+from . import summary
+
+# longest search accepted, in words
+MAX_TERMS = 10
+# retete (re)indexed per statement
+BATCH_SIZE = 500
+
+
+def terms(query):
+    """'Supa de pui!' -> ['supa', 'de', 'pui']"""
+    return re.findall(r'\w+', query.lower())[:MAX_TERMS]
+
+
+def documents(ids):
+    """Return the (id, search_text) of the given retete
+
+    See reteta.summary, the search text holds the title, ingredient names
+    and tag names of a reteta on a line each.
+    """
+    return list(
+        Reteta.objects.filter(id__in=ids).values_list('id', 'search_text')
+    )
+
+
+class SQLiteBackend:
+    """Index retete in an FTS5 virtual table keyed on the reteta ID"""
+    table = 'reteta_search'
+
+    def create(self, cursor):
+        cursor.execute(
+            'CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5('
+            'title, ingredients, tags, tokenize="unicode61")' % self.table
+        )
+
+    def drop(self, cursor):
+        cursor.execute('DROP TABLE IF EXISTS %s' % self.table)
+
+    def index(self, cursor, rows):
+        cursor.executemany(
+            'INSERT INTO %s (rowid, title, ingredients, tags) '
+            'VALUES (%%s, %%s, %%s, %%s)' % self.table,
+            rows
+        )
+
+    def remove(self, cursor, ids):
+        if ids:
+            cursor.execute(
+                'DELETE FROM %s WHERE rowid IN (%s)'
+                % (self.table, ', '.join(['%s'] * len(ids))),
+                list(ids)
+            )
+
+    def clear(self, cursor):
+        cursor.execute('DELETE FROM %s' % self.table)
+
+    def filter(self, queryset, words):
+        # every word must match as a prefix
+        match = ' '.join('"%s"*' % word for word in words)
+        # joined rather than read in a subquery per row: bm25() needs the
+        # row of a full-text query, and running the query again for every
+        # reteta is quadratic when most of them match
+        joined = '%s.rowid = %s.id' % (self.table, Reteta._meta.db_table)
+        # bm25() is lower for better matches, titles weigh the most
+        rank = RawSQL('bm25(%s, 4.0, 2.0, 1.0)' % self.table, [],
+                      output_field=FloatField())
+        return queryset.extra(
+            tables=[self.table],
+            where=[joined, '%s MATCH %%s' % self.table],
+            params=[match],
+        ).annotate(search_rank=rank)
+
+
+class PostgreSQLBackend:
+    """Index retete in a tsvector column with a GIN index"""
+    table = 'reteta_search'
+    config = 'simple'
+
+    def create(self, cursor):
+        cursor.execute(
+            'CREATE TABLE IF NOT EXISTS %s ('
+            'reteta_id integer PRIMARY KEY REFERENCES %s (id) '
+            'ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, '
+            'document tsvector NOT NULL)'
+            % (self.table, Reteta._meta.db_table)
+        )
+        cursor.execute(
+            'CREATE INDEX IF NOT EXISTS %s_document ON %s USING gin(document)'
+            % (self.table, self.table)
+        )
+
+    def drop(self, cursor):
+        cursor.execute('DROP TABLE IF EXISTS %s' % self.table)
+
+    def index(self, cursor, rows):
+        cursor.executemany(
+            'INSERT INTO %s (reteta_id, document) VALUES (%%s, '
+            "setweight(to_tsvector('%s', %%s), 'A') || "
+            "setweight(to_tsvector('%s', %%s), 'B') || "
+            "setweight(to_tsvector('%s', %%s), 'C'))"
+            % (self.table, self.config, self.config, self.config),
+            rows
+        )
+
+    def remove(self, cursor, ids):
+        if ids:
+            cursor.execute(
+                'DELETE FROM %s WHERE reteta_id = ANY(%%s)' % self.table,
+                [list(ids)]
+            )
+
+    def clear(self, cursor):
+        cursor.execute('TRUNCATE %s' % self.table)
+
+    def filter(self, queryset, words):
+        query = ' & '.join(word + ':*' for word in words)
+        matching = (
+            "%s.id IN (SELECT reteta_id FROM %s "
+            "WHERE document @@ to_tsquery('%s', %%s))"
+            % (Reteta._meta.db_table, self.table, self.config)
+        )
+        # negated so that, like bm25(), lower is better
+        rank = RawSQL(
+            "SELECT -ts_rank(document, to_tsquery('%s', %%s)) FROM %s "
+            'WHERE reteta_id = %s.id'
+            % (self.config, self.table, Reteta._meta.db_table),
+            [query], output_field=FloatField()
+        )
+        return queryset.extra(where=[matching], params=[query]) \
+            .annotate(search_rank=rank)
+
+
+class FallbackBackend:
+    """Unindexed LIKE search of the summary for the other databases"""
+
+    def create(self, cursor):
+        pass
+
+    def drop(self, cursor):
+        pass
+
+    def index(self, cursor, rows):
+        pass
+
+    def remove(self, cursor, ids):
+        pass
+
+    def clear(self, cursor):
+        pass
+
+    def filter(self, queryset, words):
+        # search_text holds the tag and ingredient names, no joins needed
+        for word in words:
+            queryset = queryset.filter(search_text__contains=word)
+        return queryset.annotate(
+            search_rank=Value(0.0, output_field=FloatField())
+        )
+
+
+BACKENDS = {
+    'sqlite': SQLiteBackend,
+    'postgresql': PostgreSQLBackend,
+}
+
+
+def get_backend(vendor=None):
+    return BACKENDS.get(vendor or connection.vendor, FallbackBackend)()
+
+
+def _batches(ids):
+    ids = sorted(set(ids))
+    for start in range(0, len(ids), BATCH_SIZE):
+        yield ids[start:start + BATCH_SIZE]
+
+
+def index(documents):
+    """Rewrite the index entries of the given (id, search_text)"""
+    backend = get_backend()
+    documents = sorted(documents)
+    with connection.cursor() as cursor:
+        for start in range(0, len(documents), BATCH_SIZE):
+            batch = documents[start:start + BATCH_SIZE]
+            backend.remove(cursor, [reteta_id for reteta_id, text in batch])
+            backend.index(cursor, [
+                (reteta_id,) + summary.split_search_text(text)
+                for reteta_id, text in batch
+            ])
+
+
+def reindex(ids):
+    """Rewrite the index entries of the given retete"""
+    backend = get_backend()
+    with connection.cursor() as cursor:
+        for batch in _batches(ids):
+            rows = documents(batch)
+            # retete that no longer exist are only removed
+            backend.remove(cursor, batch)
+            if rows:
+                backend.index(cursor, [
+                    (reteta_id,) + summary.split_search_text(text)
+                    for reteta_id, text in rows
+                ])
+
+
+def unindex(ids):
+    """Remove the index entries of the given retete"""
+    backend = get_backend()
+    with connection.cursor() as cursor:
+        for batch in _batches(ids):
+            backend.remove(cursor, batch)
+
+
+def search(queryset, query):
+    """Filter `queryset` on `query` and annotate it with `search_rank`"""
+    words = terms(query)
+    if not words:
+        return queryset.annotate(
+            search_rank=Value(0.0, output_field=FloatField())
+        )
+    return get_backend().filter(queryset, words)
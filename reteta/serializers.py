@@ -1,26 +1,96 @@
+from django.db.models import Value
+from django.db.models.functions import Lower
 from rest_framework import serializers
 from accounts.models import Tag, Ingredient, Reteta
+from . import images
 
 
-class TagSerializer(serializers.ModelSerializer):
+class UniqueNameMixin:
+    """Reject names the user already has in any letter case
+
+    See the model constraints and migration 0012.
+    """
+
+    def validate_name(self, value):
+        request = self.context.get('request')
+        if request is None:
+            return value
+        others = self.Meta.model.objects.filter(
+            user=request.user
+        ).annotate(name_key=Lower('name')).filter(
+            name_key=Lower(Value(value))
+        )
+        if self.instance is not None:
+            others = others.exclude(pk=self.instance.pk)
+        if others.exists():
+            raise serializers.ValidationError(
+                'You already have one named "%s".' % value
+            )
+        return value
+
+
+class DynamicFieldsMixin:
+    """Let the client pick the fields of the representation
+
+    `fields` keeps the given names only, including the Meta.optional_fields
+    left out by default. `expand` nests the Meta.expandable relations as
+    objects instead of their IDs. Unknown names are a validation error.
+    """
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        expandable = getattr(self.Meta, 'expandable', {})
+        _check_names('expand', expand or (), expandable)
+        for name in expand or ():
+            self.fields[name] = expandable[name](many=True, read_only=True)
+
+        if fields is None:
+            keep = set(self.fields) - set(
+                getattr(self.Meta, 'optional_fields', ())
+            )
+        else:
+            _check_names('fields', fields, self.fields)
+            keep = set(fields)
+        for name in list(self.fields):
+            if name not in keep:
+                self.fields.pop(name)
+
+
+def _check_names(param, names, known):
+    unknown = sorted(set(names) - set(known))
+    if unknown:
+        raise serializers.ValidationError(
+            {param: ['Unknown field(s): %s.' % ', '.join(unknown)]}
+        )
+
+
+class TagSerializer(DynamicFieldsMixin,
+                    UniqueNameMixin,
+                    serializers.ModelSerializer):
     """"Serializer for tag objects"""
 
     class Meta:
         model = Tag
-        fields = ('id', 'name')
-        read_only_fields = ('id',)
+        fields = ('id', 'name', 'usage_count')
+        read_only_fields = ('id', 'usage_count')
+        # only sent when asked for with ?fields=
+        optional_fields = ('usage_count',)
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(DynamicFieldsMixin,
+                           UniqueNameMixin,
+                           serializers.ModelSerializer):
     """"Serializer for ingredient objects"""
 
     class Meta:
         model = Ingredient
-        fields = ('id', 'name')
-        read_only_fields = ('id',)
+        fields = ('id', 'name', 'usage_count')
+        read_only_fields = ('id', 'usage_count')
+        # only sent when asked for with ?fields=
+        optional_fields = ('usage_count',)
 
 
-class RetetaSerializer(serializers.ModelSerializer):
+class RetetaSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """"Serializer for reteta objects"""
     ingredients = serializers.PrimaryKeyRelatedField(
         many=True,
@@ -30,19 +100,70 @@ class RetetaSerializer(serializers.ModelSerializer):
         many=True,
         queryset=Tag.objects.all()
     )
+    thumbnail = serializers.SerializerMethodField()
+    tag_names = serializers.SerializerMethodField()
+    has_image = serializers.SerializerMethodField()
+    missing_count = serializers.SerializerMethodField()
 
     class Meta:
         model = Reteta
         fields = ('id', 'title', 'ingredients', 'tags',
-                  'time_minutes', 'price', 'link'
+                  'time_minutes', 'price', 'link', 'thumbnail',
+                  'ingredient_count', 'tag_names', 'has_image',
+                  'missing_count'
                   )
-        read_only_fields = ('id',)
+        read_only_fields = ('id', 'ingredient_count')
+        # only sent when asked for with ?fields=, missing_count also
+        # with ?pantry=
+        optional_fields = ('thumbnail', 'ingredient_count', 'tag_names',
+                           'has_image', 'missing_count')
+        # sent as objects instead of IDs with ?expand=
+        expandable = {
+            'ingredients': IngredientSerializer,
+            'tags': TagSerializer,
+        }
+
+    def get_thumbnail(self, obj):
+        """Return the URL of the thumbnail once generated"""
+        return _absolute_urls(
+            self, images.variant_urls(obj)
+        ).get('thumbnail')
+
+    def get_tag_names(self, obj):
+        """Return the tag names from the summary, without a join"""
+        return obj.tag_names.split('\n') if obj.tag_names else []
+
+    def get_has_image(self, obj):
+        return bool(obj.image)
+
+    def get_missing_count(self, obj):
+        """Return the ingredients missing from the ?pantry=, if given"""
+        return getattr(obj, 'missing_count', None)
 
 
 class RetetaDetailSerializer(RetetaSerializer):
     """"Serializer for reteta details"""
     ingredients = IngredientSerializer(many=True, read_only=True)
     tags = TagSerializer(many=True, read_only=True)
+    image_variants = serializers.SerializerMethodField()
+
+    class Meta(RetetaSerializer.Meta):
+        fields = RetetaSerializer.Meta.fields + (
+            'image', 'image_status', 'image_variants'
+        )
+        read_only_fields = ('id', 'image', 'image_status')
+
+    def get_image_variants(self, obj):
+        """Return the URLs of the resized images"""
+        return _absolute_urls(self, images.variant_urls(obj))
+
+
+def _absolute_urls(serializer, urls):
+    request = serializer.context.get('request')
+    if request is None:
+        return urls
+    return {name: request.build_absolute_uri(url)
+            for name, url in urls.items()}
 
 
 class RetetaImageSerializer(serializers.ModelSerializer):
@@ -50,5 +171,48 @@ class RetetaImageSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Reteta
-        fields = ('id', 'image')
-        read_only_fields = ('id',)
+        fields = ('id', 'image', 'image_status')
+        read_only_fields = ('id', 'image_status')
+
+
+class NameOrIdField(serializers.Field):
+    """Reference a related object by its ID or by its name"""
+    default_error_messages = {
+        'invalid': 'Expected an ID or a non-empty name.',
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('invalid')
+        if isinstance(data, int):
+            return data
+        if isinstance(data, str) and data.strip():
+            return data.strip()
+        self.fail('invalid')
+
+    def to_representation(self, value):
+        return value
+
+
+class RetetaBulkItemSerializer(serializers.ModelSerializer):
+    """Serializer for one reteta of a bulk upsert"""
+    id = serializers.IntegerField(required=False)
+    ingredients = serializers.ListField(
+        child=NameOrIdField(),
+        required=False
+    )
+    tags = serializers.ListField(
+        child=NameOrIdField(),
+        required=False
+    )
+
+    class Meta:
+        model = Reteta
+        fields = ('id', 'title', 'ingredients', 'tags',
+                  'time_minutes', 'price', 'link'
+                  )
+
+
+class NameBulkItemSerializer(serializers.Serializer):
+    """Serializer for one tag/ingredient of a list body create"""
+    name = serializers.CharField(max_length=255)
@@ -0,0 +1,328 @@
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Greatest
+from django.db.models.signals import (
+    post_init, pre_save, post_save, pre_delete, post_delete, m2m_changed
+)
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from accounts.models import ChangeLog, Tag, Ingredient, Reteta
+from . import changelog, images, search, similarity, summary
+from .cache import invalidate_lists, mark_deleted
+
+# Sent by reteta.bulk after writes that bypass the model signals, with
+# the retete that were created or updated
+bulk_saved = Signal(providing_args=['user', 'retete'])
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_save, sender=Reteta)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_delete, sender=Reteta)
+def invalidate_on_write(sender, instance, **kwargs):
+    """Drop the cached lists of the owner of a changed object"""
+    invalidate_lists(instance.user_id)
+
+
+@receiver(post_delete, sender=Reteta)
+def mark_reteta_deleted(sender, instance, **kwargs):
+    """Move the Last-Modified of the retete lists, see reteta.cache"""
+    mark_deleted(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Reteta.tags.through)
+@receiver(m2m_changed, sender=Reteta.ingredients.through)
+def invalidate_on_m2m(sender, instance, action, **kwargs):
+    """Drop the cached lists when retete are (un)assigned"""
+    # instance is a Reteta, or a Tag/Ingredient for reverse changes
+    if action.startswith('post_'):
+        invalidate_lists(instance.user_id)
+
+
+@receiver(bulk_saved)
+def invalidate_on_bulk(sender, user, **kwargs):
+    invalidate_lists(user.pk)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_new_user(sender, instance, created, **kwargs):
+    """Never serve lists cached for a previous owner of a reused ID"""
+    if created:
+        invalidate_lists(instance.pk)
+
+
+# updated_at and usage_count of the tags and ingredients, the retete
+# follow their summary
+
+@receiver(m2m_changed, sender=Reteta.tags.through)
+@receiver(m2m_changed, sender=Reteta.ingredients.through)
+def touch_on_m2m(sender, instance, action, reverse, model, pk_set,
+                 **kwargs):
+    """Bump the tags/ingredients added to or removed from retete
+
+    remove() reports the given IDs, linked or not, so the links it
+    really deletes are counted before, for usage_count.
+    """
+    if reverse:
+        # instance is the Tag/Ingredient, not reloaded, pk_set retete
+        pk = instance.pk
+        if action in ('pre_remove', 'pre_clear'):
+            links = sender.objects.filter(**{_column(instance): pk})
+            if action == 'pre_remove':
+                links = links.filter(reteta_id__in=pk_set)
+            _stash(instance, sender, links.count())
+        elif action == 'post_add':
+            touch(type(instance), instance.user_id, [pk],
+                  {pk: len(pk_set)})
+        elif action in ('post_remove', 'post_clear'):
+            touch(type(instance), instance.user_id, [pk],
+                  {pk: -_unstash(instance, sender)})
+    elif action == 'pre_remove':
+        _stash(instance, sender, list(sender.objects.filter(**{
+            'reteta_id': instance.pk, _column(model) + '__in': pk_set
+        }).values_list(_column(model), flat=True)))
+    elif action == 'post_add':
+        touch(model, instance.user_id, pk_set, dict.fromkeys(pk_set, 1))
+    elif action == 'post_remove':
+        touch(model, instance.user_id, pk_set,
+              dict.fromkeys(_unstash(instance, sender), -1))
+    elif action == 'pre_clear':
+        ids = list(model.objects.filter(
+            reteta=instance
+        ).values_list('id', flat=True))
+        touch(model, instance.user_id, ids, dict.fromkeys(ids, -1))
+
+
+def _column(model):
+    """Tag -> 'tag_id', the column of the through tables"""
+    return model._meta.model_name + '_id'
+
+
+def _stash(instance, sender, value):
+    instance.__dict__.setdefault('_usage_removed', {})[sender] = value
+
+
+def _unstash(instance, sender):
+    return instance.__dict__.get('_usage_removed', {}).pop(sender)
+
+
+def touch(model, user_id, ids, usage=None):
+    """Bump updated_at of tags/ingredients and log their change
+
+    `usage` maps IDs to the change of their usage_count, in the same
+    UPDATE, relative to the current value and never below 0.
+    """
+    ids = list(ids)
+    if not ids:
+        return
+    values = {'updated_at': timezone.now()}
+    deltas = {}
+    for pk, delta in (usage or {}).items():
+        if delta:
+            deltas.setdefault(delta, []).append(pk)
+    if deltas:
+        values['usage_count'] = Greatest(
+            F('usage_count') + Case(
+                *[When(pk__in=pks, then=Value(delta))
+                  for delta, pks in deltas.items()],
+                default=Value(0), output_field=IntegerField()
+            ),
+            Value(0)
+        )
+    model.objects.filter(pk__in=ids).update(**values)
+    changelog.record(model, user_id, ids)
+
+
+@receiver(pre_delete, sender=Reteta)
+def release_usage(sender, instance, **kwargs):
+    """Count out a deleted reteta, its links go without m2m_changed"""
+    for model in (Tag, Ingredient):
+        model.objects.filter(reteta=instance).update(
+            usage_count=Greatest(F('usage_count') - 1, Value(0))
+        )
+
+
+# Summary columns and search index, derived from the tags and ingredients
+
+# reteta ID -> search_text of the open batch() of a thread, None when the
+# summary is to be refreshed
+_batch = threading.local()
+
+
+@contextmanager
+def batch():
+    """Refresh each reteta changed in the block once, when it ends
+
+    The summary and search entry of a reteta written by several saves
+    and m2m changes are brought up to date at the end of the block, in
+    its transaction. Runs in changelog.batch(), nested batches join the
+    outer one.
+    """
+    if getattr(_batch, 'pending', None) is not None:
+        yield
+        return
+    _batch.pending = {}
+    try:
+        with changelog.batch():
+            yield
+            pending, _batch.pending = _batch.pending, None
+            search.index(
+                [(pk, text) for pk, text in pending.items()
+                 if text is not None]
+                + summary.refresh(
+                    pk for pk, text in pending.items() if text is None
+                )
+            )
+    finally:
+        _batch.pending = None
+
+
+def refresh(ids, user_id=None):
+    """Update the summary, then the search documents built from it
+
+    The retete are logged as changed when `user_id` is given, callers
+    whose change is logged by the post_save of the reteta leave it out.
+    Inside batch() the refresh waits for its end.
+    """
+    ids = list(ids)
+    pending = getattr(_batch, 'pending', None)
+    if pending is None:
+        search.index(summary.refresh(ids))
+    else:
+        pending.update(dict.fromkeys(ids))
+    if user_id is not None:
+        changelog.record(Reteta, user_id, ids)
+
+
+@receiver(pre_save, sender=Reteta)
+def summarize_new_reteta(sender, instance, **kwargs):
+    # no tags or ingredients yet, inserted with the row
+    if instance._state.adding:
+        for name, value in summary.compute(instance.title, [], []).items():
+            setattr(instance, name, value)
+
+
+@receiver(post_save, sender=Reteta)
+def refresh_reteta(sender, instance, created, **kwargs):
+    if not created:
+        refresh([instance.pk])
+        return
+    # the summary was computed by summarize_new_reteta
+    pending = getattr(_batch, 'pending', None)
+    if pending is None:
+        search.index([(instance.pk, instance.search_text)])
+    else:
+        pending.setdefault(instance.pk, instance.search_text)
+
+
+@receiver(post_delete, sender=Reteta)
+def unindex_reteta(sender, instance, **kwargs):
+    pending = getattr(_batch, 'pending', None)
+    if pending is not None:
+        pending.pop(instance.pk, None)
+    search.unindex([instance.pk])
+
+
+@receiver(m2m_changed, sender=Reteta.tags.through)
+@receiver(m2m_changed, sender=Reteta.ingredients.through)
+def refresh_on_m2m(sender, instance, action, reverse, pk_set, **kwargs):
+    """Refresh the retete whose tags or ingredients changed"""
+    # reverse: instance is a Tag/Ingredient and pk_set holds retete
+    if action == 'pre_clear' and reverse:
+        instance._retete_cleared = list(
+            instance.reteta_set.values_list('id', flat=True)
+        )
+    elif action in ('post_add', 'post_remove'):
+        refresh(pk_set if reverse else [instance.pk], instance.user_id)
+    elif action == 'post_clear':
+        refresh(
+            instance.__dict__.pop('_retete_cleared', [])
+            if reverse else [instance.pk],
+            instance.user_id
+        )
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def refresh_on_rename(sender, instance, created, **kwargs):
+    """Fan a rename out to the retete using the tag/ingredient"""
+    if not created:
+        refresh(instance.reteta_set.values_list('id', flat=True),
+                instance.user_id)
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def collect_on_delete(sender, instance, **kwargs):
+    # the through rows are deleted without m2m_changed
+    instance._retete_deleted = list(
+        instance.reteta_set.values_list('id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def refresh_on_delete(sender, instance, **kwargs):
+    refresh(instance.__dict__.pop('_retete_deleted', []), instance.user_id)
+
+
+@receiver(bulk_saved)
+def refresh_on_bulk(sender, user, retete, **kwargs):
+    refresh([reteta.pk for reteta in retete], user.pk)
+
+
+# Change log of the sync endpoint, see reteta.changelog
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_save, sender=Reteta)
+def log_save(sender, instance, **kwargs):
+    changelog.record(sender, instance.user_id, [instance.pk])
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_delete, sender=Reteta)
+def log_delete(sender, instance, **kwargs):
+    changelog.record(sender, instance.user_id, [instance.pk], deleted=True)
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def drop_user_log(sender, instance, **kwargs):
+    """Drop the log of a deleted user, tombstones included"""
+    # after the retete, tags and ingredients deleted with the user
+    ChangeLog.objects.filter(user_id=instance.pk).delete()
+    changelog.forget(instance.pk)
+    # the index version was a checkpoint of this log
+    similarity.drop(instance.pk)
+
+
+# Image files, shared by the retete of identical uploads
+
+@receiver(post_init, sender=Reteta)
+def remember_image(sender, instance, **kwargs):
+    # not when the column is deferred, reading it would be a query
+    if 'image' in instance.__dict__:
+        instance._loaded_image = str(instance.__dict__['image'] or '')
+
+
+@receiver(post_save, sender=Reteta)
+def collect_replaced_image(sender, instance, **kwargs):
+    """Delete the previous image of a reteta if no reteta uses it"""
+    loaded = instance.__dict__.get('_loaded_image')
+    if 'image' in instance.__dict__:
+        instance._loaded_image = instance.image.name or ''
+    if loaded and loaded != instance._loaded_image:
+        images.collect([loaded])
+
+
+@receiver(post_delete, sender=Reteta)
+def collect_deleted_image(sender, instance, **kwargs):
+    if 'image' in instance.__dict__:
+        images.collect([instance.image.name])
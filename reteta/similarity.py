@@ -0,0 +1,245 @@
+import os
+import tempfile
+
+import numpy as np
+from django.conf import settings
+from scipy import sparse
+
+from accounts.models import ChangeLog, Reteta
+from user.authentication import LRUCache
+from . import changelog
+
+# layout of the index files, see Index.save()
+FORMAT = 1
+DTYPE = np.int32
+# (relation, column, kind) of the features, a tag or ingredient is the
+# column 2 * id + kind of the matrix
+FEATURES = (
+    ('tags', 'tag_id', 0),
+    ('ingredients', 'ingredient_id', 1),
+)
+# retete read per query when patching an index
+BATCH_SIZE = 500
+
+
+def _setting(name, default):
+    return getattr(settings, 'SIMILAR', {}).get(name, default)
+
+
+class Index:
+    """Sparse reteta x tag/ingredient matrix of the retete of a user
+
+    Rows are the retete having a tag or ingredient, in ID order, and
+    hold the feature columns of the reteta. `version` is the change log
+    checkpoint the rows are up to date with, see reteta.changelog.
+    """
+
+    def __init__(self, version, ids, indptr, keys):
+        self.version = version
+        self.ids = ids
+        self.indptr = indptr
+        self.keys = keys
+        self._matrix = None
+
+    @classmethod
+    def build(cls, version, rows, keys):
+        """Build an index from the (reteta ID, feature) pairs"""
+        order = np.lexsort((keys, rows))
+        ids, counts = np.unique(rows[order], return_counts=True)
+        indptr = np.zeros(len(ids) + 1, dtype=DTYPE)
+        np.cumsum(counts, out=indptr[1:])
+        return cls(version, ids.astype(DTYPE), indptr,
+                   keys[order].astype(DTYPE))
+
+    def patch(self, version, changed, rows, keys):
+        """Return a copy with the rows of the `changed` retete replaced
+
+        `rows` and `keys` are the current pairs of these retete, deleted
+        retete and retete left without features have none.
+        """
+        old_rows = np.repeat(self.ids, np.diff(self.indptr))
+        keep = ~np.isin(old_rows, changed)
+        return Index.build(
+            version,
+            np.concatenate((old_rows[keep], rows)),
+            np.concatenate((self.keys[keep], keys)),
+        )
+
+    @property
+    def matrix(self):
+        if self._matrix is None:
+            columns = int(self.keys.max()) + 1 if len(self.keys) else 1
+            self._matrix = sparse.csr_matrix(
+                (np.ones(len(self.keys)), self.keys, self.indptr),
+                shape=(len(self.ids), columns)
+            )
+        return self._matrix
+
+    def similar(self, reteta_id, limit):
+        """Return the (ID, Jaccard index) of the `limit` closest retete
+
+        Best first, the newest first among equals. Retete sharing no
+        feature with the reteta are left out.
+        """
+        row = int(np.searchsorted(self.ids, reteta_id))
+        if row == len(self.ids) or self.ids[row] != reteta_id:
+            return []
+        matrix = self.matrix
+        shared = matrix.dot(matrix[row].T).toarray().ravel()
+        sizes = np.diff(self.indptr)
+        scores = shared / (sizes + sizes[row] - shared)
+        scores[row] = 0
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > limit:
+            # the best `limit` scores, and whatever ties with the last
+            cut = np.partition(scores[candidates], -limit)[-limit]
+            candidates = candidates[scores[candidates] >= cut]
+        order = np.lexsort((-self.ids[candidates], -scores[candidates]))
+        picked = candidates[order[:limit]]
+        return list(zip(self.ids[picked].tolist(),
+                        scores[picked].tolist()))
+
+    def save(self, path):
+        """Write the index to `path` as a single array, atomically
+
+        [FORMAT, version, rows, nonzeros, ids..., indptr..., keys...],
+        readers that mapped the previous file keep reading it.
+        """
+        header = np.array([FORMAT, self.version, len(self.ids),
+                           len(self.keys)], dtype=DTYPE)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as output:
+                np.save(output, np.concatenate(
+                    (header, self.ids, self.indptr, self.keys)
+                ))
+            os.replace(temp, path)
+        except BaseException:
+            os.unlink(temp)
+            raise
+
+    @classmethod
+    def load(cls, path):
+        """Map the index saved at `path`, None when there is none"""
+        try:
+            data = np.load(path, mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+        if data.ndim != 1 or len(data) < 4 or data[0] != FORMAT:
+            return None
+        version, rows, nonzeros = (int(value) for value in data[1:4])
+        end = 5 + 2 * rows
+        if len(data) != end + nonzeros:
+            return None
+        return cls(version, data[4:4 + rows], data[4 + rows:end],
+                   data[end:])
+
+
+# user ID -> Index loaded by this process
+_indexes = LRUCache(
+    max_size=_setting('MAX_USERS', 1000),
+    ttl=_setting('TTL', 3600),
+)
+
+
+def index_path(user_id):
+    return os.path.join(
+        _setting('INDEX_DIR', os.path.join(settings.BASE_DIR, 'similar')),
+        '%d.npy' % user_id
+    )
+
+
+def pairs(user_id, ids=None):
+    """Return the (reteta IDs, features) arrays of the links of a user
+
+    Only for the retete `ids` when given.
+    """
+    batches = [None] if ids is None else [
+        ids[start:start + BATCH_SIZE]
+        for start in range(0, len(ids), BATCH_SIZE)
+    ]
+    links = []
+    for relation, column, kind in FEATURES:
+        through = getattr(Reteta, relation).through.objects.filter(
+            reteta__user_id=user_id
+        )
+        for batch in batches:
+            queryset = through
+            if batch is not None:
+                queryset = queryset.filter(reteta_id__in=batch)
+            rows = np.array(
+                list(queryset.values_list('reteta_id', column)),
+                dtype=np.int64
+            ).reshape(-1, 2)
+            rows[:, 1] = rows[:, 1] * 2 + kind
+            links.append(rows)
+    links = np.concatenate(links)
+    return links[:, 0], links[:, 1]
+
+
+def rebuild(user):
+    """Build the index of a user from the tables and save it"""
+    # the version first, whatever is read after is at least as recent
+    index = Index.build(changelog.settled(user), *pairs(user.pk))
+    index.save(index_path(user.pk))
+    return index
+
+
+def update(user, index):
+    """Bring an index up to date with the change log of its user
+
+    Only the retete logged after the version of the index are read
+    again, past SIMILAR['PATCH_LIMIT'] changes it is rebuilt.
+    """
+    entries, checkpoint, more = changelog.changes(
+        user, index.version, limit=_setting('PATCH_LIMIT', 500)
+    )
+    if more:
+        return rebuild(user)
+    changed = sorted({entry.object_id for entry in entries
+                      if entry.model == ChangeLog.RETETA})
+    version = index.version
+    if changed:
+        index = index.patch(checkpoint, changed, *pairs(user.pk, changed))
+    elif checkpoint != version:
+        index = Index(checkpoint, index.ids, index.indptr, index.keys)
+    # changes not settled yet are applied again by the next update
+    if checkpoint != version:
+        index.save(index_path(user.pk))
+    return index
+
+
+def get_index(user):
+    """Return the up to date index of a user
+
+    Loaded indexes are kept per process, the others are mapped from
+    their file or built when there is none.
+    """
+    index = _indexes.get(user.pk)
+    if index is None:
+        index = Index.load(index_path(user.pk))
+    index = rebuild(user) if index is None else update(user, index)
+    _indexes.set(user.pk, index)
+    return index
+
+
+def similar(user, reteta_id, limit):
+    """Return the (ID, Jaccard index) of the retete of `user` sharing
+    the most tags and ingredients with the reteta `reteta_id`"""
+    return get_index(user).similar(reteta_id, limit)
+
+
+def drop(user_id):
+    """Forget the index of a deleted user"""
+    _indexes.delete(user_id)
+    try:
+        os.unlink(index_path(user_id))
+    except FileNotFoundError:
+        pass
+
+
+def clear():
+    """Forget the indexes loaded by this process"""
+    _indexes.clear()
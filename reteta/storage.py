@@ -0,0 +1,77 @@
+import hashlib
+import os
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class MediaStorage(FileSystemStorage):
+    """FileSystemStorage writing atomically, in place
+
+    Files are written in chunks to a temporary file of the same
+    directory, then renamed over `name`: readers see the previous file
+    or the new one, never a partial write. Saving an existing name
+    replaces it, the names of this project are derived from the content
+    (see ContentAddressedStorage and reteta.images.variant_name).
+    """
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in content.chunks():
+                    f.write(chunk)
+            # mkstemp() creates the file readable by its owner only
+            os.chmod(tmp_path, self.file_permissions_mode or 0o644)
+            os.replace(tmp_path, full_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return name
+
+
+@deconstructible
+class ContentAddressedStorage(MediaStorage):
+    """Store files under the SHA-256 of their content
+
+    'photos/IMG_1.JPG' is saved as 'photos/<2 hex>/<sha256>.jpg', so the
+    same photo uploaded by many users is stored once. The file of a name
+    is never changed afterwards, except by reteta.images which rewrites
+    it without its metadata. Files no reteta uses any more are deleted
+    by reteta.images.collect().
+    """
+
+    def content_name(self, name, content):
+        """Return the name of `content`, read in chunks"""
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        hexdigest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(
+            os.path.dirname(name), hexdigest[:2], hexdigest + extension
+        )
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        if self.exists(name):
+            # already stored, keep it out of the grace period of
+            # reteta.images.collect()
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length)
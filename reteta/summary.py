@@ -0,0 +1,115 @@
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from accounts.models import Reteta
+
+# retete refreshed per UPDATE
+BATCH_SIZE = 500
+FIELDS = ('ingredient_count', 'tag_names', 'search_text')
+
+
+def _line(names):
+    return ' '.join(name.replace('\n', ' ') for name in names)
+
+
+def compute(title, ingredient_names, tag_names):
+    """Return the summary columns of a reteta as a dict"""
+    ingredient_names = sorted(ingredient_names)
+    tag_names = sorted(tag_names)
+    return {
+        'ingredient_count': len(ingredient_names),
+        'tag_names': '\n'.join(name.replace('\n', ' ') for name in tag_names),
+        'search_text': '\n'.join((
+            title.replace('\n', ' '), _line(ingredient_names),
+            _line(tag_names),
+        )).lower(),
+    }
+
+
+def split_search_text(search_text):
+    """'title\\ningredients\\ntags' -> (title, ingredients, tags)"""
+    parts = search_text.split('\n', 2)
+    return tuple(parts + [''] * (3 - len(parts)))
+
+
+def _refresh_batch(ids, queryset, save=True, touch=True):
+    retete = queryset.filter(id__in=ids).only(
+        'id', 'title', *FIELDS
+    ).prefetch_related('ingredients', 'tags')
+    changed = []
+    for reteta in retete:
+        values = compute(
+            reteta.title,
+            [obj.name for obj in reteta.ingredients.all()],
+            [obj.name for obj in reteta.tags.all()],
+        )
+        if any(getattr(reteta, name) != value
+               for name, value in values.items()):
+            for name, value in values.items():
+                setattr(reteta, name, value)
+            changed.append(reteta)
+    if changed and save:
+        fields = FIELDS
+        if touch:
+            # a new summary means new tags or ingredients
+            now = timezone.now()
+            for reteta in changed:
+                reteta.updated_at = now
+            fields += ('updated_at',)
+        # bulk_update() sends no post_save, nothing is refreshed twice
+        queryset.bulk_update(changed, fields)
+    return retete, changed
+
+
+def refresh(ids, queryset=None, touch=True):
+    """Bring the summary of the given retete up to date
+
+    Rows are read and written in batches, only the outdated ones are
+    updated, along with their updated_at unless `touch` is false.
+    Returns the (id, search_text) of the retete, for
+    reteta.search.index(). `queryset` defaults to all the retete,
+    migrations pass the one of their historical model.
+    """
+    if queryset is None:
+        queryset = Reteta.objects.all()
+    ids = sorted(set(ids))
+    documents = []
+    for start in range(0, len(ids), BATCH_SIZE):
+        retete, changed = _refresh_batch(
+            ids[start:start + BATCH_SIZE], queryset, touch=touch
+        )
+        documents.extend((reteta.id, reteta.search_text)
+                         for reteta in retete)
+    return documents
+
+
+def check(ids, queryset=None):
+    """Return the IDs among `ids` whose summary is out of date"""
+    if queryset is None:
+        queryset = Reteta.objects.all()
+    ids = sorted(set(ids))
+    stale = []
+    for start in range(0, len(ids), BATCH_SIZE):
+        retete, changed = _refresh_batch(
+            ids[start:start + BATCH_SIZE], queryset, save=False
+        )
+        stale.extend(reteta.id for reteta in changed)
+    return stale
+
+
+def recount_usage(model, queryset=None):
+    """Recompute usage_count of the tags or ingredients in one UPDATE
+
+    For rows linked without m2m_changed, which keeps it up to date
+    otherwise (see reteta.signals).
+    """
+    if queryset is None:
+        queryset = model.objects.all()
+    column = model._meta.model_name + '_id'
+    counts = model.reteta_set.through.objects.filter(
+        **{column: OuterRef('pk')}
+    ).values(column).annotate(count=Count('*')).values('count')
+    queryset.update(usage_count=Coalesce(
+        Subquery(counts), 0, output_field=IntegerField()
+    ))
@@ -0,0 +1,127 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command, CommandError
+from django.test import TestCase
+from accounts.models import Reteta
+from reteta import benchmark
+from reteta.management.commands.benchmark_api import BASELINE
+
+
+class SeedDatasetTests(TestCase):
+    """Test seeding the benchmark datasets"""
+
+    def test_seed_dataset(self):
+        """Test the requested catalog is created for every user"""
+        users = benchmark.seed_dataset(
+            users=2, retete=5, tags=4, ingredients=6,
+            tags_per_reteta=2, ingredients_per_reteta=3
+        )
+
+        self.assertEqual(len(users), 2)
+        for user in users:
+            retete = Reteta.objects.filter(user=user)
+            self.assertEqual(retete.count(), 5)
+            for reteta in retete:
+                self.assertEqual(reteta.tags.count(), 2)
+                self.assertEqual(reteta.ingredients.count(), 3)
+                self.assertEqual(
+                    {tag.user_id for tag in reteta.tags.all()}, {user.id}
+                )
+
+
+class BenchmarkFiltersCommandTests(TestCase):
+    """Test the tag filter benchmark"""
+
+    def test_benchmark_filters(self):
+        """Test a row is printed per size and the data is rolled back"""
+        out = StringIO()
+
+        call_command(
+            'benchmark_filters', retete=20, tags=8, sizes='1,4',
+            repeat=1, stdout=out
+        )
+
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertIn('any ms', lines[0])
+        self.assertEqual(Reteta.objects.count(), 0)
+
+
+class ApiBenchmarkTests(TestCase):
+    """Test the API benchmark"""
+
+    def test_query_counts_within_baseline(self):
+        """Test no endpoint runs more queries than in the baseline"""
+        user, = benchmark.seed_dataset(retete=30, tags=10, ingredients=20)
+        user.set_password('benchpass')
+        user.save()
+
+        results = benchmark.run_api_benchmark(user, 'benchpass', repeat=1)
+
+        with open(BASELINE) as baseline:
+            baseline = json.load(baseline)
+        self.assertEqual(set(results), set(baseline))
+        self.assertEqual(
+            benchmark.regressions(results, baseline, float('inf')), []
+        )
+
+    def test_regressions(self):
+        """Test more queries or a slower p95 are regressions"""
+        baseline = {
+            'a': {'queries': 2, 'p95_ms': 10.0},
+            'b': {'queries': 2, 'p95_ms': 10.0},
+            'c': {'queries': 2, 'p95_ms': 0.1},
+        }
+        results = {
+            'a': {'queries': 3, 'p95_ms': 10.0},
+            'b': {'queries': 1, 'p95_ms': 16.0},
+            'c': {'queries': 2, 'p95_ms': 0.5},
+            'new': {'queries': 9, 'p95_ms': 99.0},
+        }
+
+        self.assertEqual(benchmark.regressions(results, baseline, 0.5), [
+            'a: 3 queries, baseline 2',
+            'b: p95 16.00 ms, baseline 10.00 ms',
+        ])
+
+    def test_percentile(self):
+        """Test the nearest-rank percentile"""
+        values = list(range(1, 21))
+
+        self.assertEqual(benchmark.percentile(values, 50), 10)
+        self.assertEqual(benchmark.percentile(values, 95), 19)
+        self.assertEqual(benchmark.percentile([7], 95), 7)
+
+
+class BenchmarkApiCommandTests(TestCase):
+    """Test the API benchmark command"""
+
+    def setUp(self):
+        handle, self.baseline = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        self.addCleanup(os.remove, self.baseline)
+
+    def benchmark(self, **options):
+        call_command(
+            'benchmark_api', retete=5, tags=3, ingredients=3, repeat=1,
+            only='tags-list,retete-retrieve', baseline=self.baseline,
+            stdout=StringIO(), **options
+        )
+
+    def test_save_and_compare(self):
+        """Test the baseline is written and regressions fail the run"""
+        self.benchmark(save=True)
+
+        with open(self.baseline) as baseline:
+            saved = json.load(baseline)
+        self.assertEqual(set(saved), {'tags-list', 'retete-retrieve'})
+        self.assertEqual(Reteta.objects.count(), 0)
+
+        saved['tags-list']['queries'] = 0
+        with open(self.baseline, 'w') as baseline:
+            json.dump(saved, baseline)
+        with self.assertRaisesMessage(CommandError, 'tags-list'):
+            self.benchmark(threshold=100)
@@ -0,0 +1,152 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.urls import reverse
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APIClient
+from accounts.models import Reteta, Tag, Ingredient
+
+BULK_URL = reverse('reteta:reteta-bulk')
+
+
+def item(**params):
+    """Return a bulk item payload"""
+    defaults = {
+        'title': 'Sample reteta',
+        'time_minutes': 10,
+        'price': '5.00'
+    }
+    defaults.update(params)
+    return defaults
+
+
+class RetetaBulkApiTests(TestCase):
+    """Test creating and updating retete in bulk"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@chris.com',
+            'password123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, items):
+        return self.client.post(BULK_URL, items, format='json')
+
+    def test_bulk_create_by_name_and_id(self):
+        """Test creating retete referencing new and existing objects"""
+        onion = Ingredient.objects.create(user=self.user, name='Onion')
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+
+        res = self.post([
+            item(title='Ciorba', ingredients=[onion.id, 'Carrot'],
+                 tags=['Vegan', 'Soup']),
+            item(title='Salata', ingredients=['Onion', 'Carrot']),
+        ])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['errors'], [])
+        self.assertEqual([c['index'] for c in res.data['created']], [0, 1])
+        ciorba = Reteta.objects.get(id=res.data['created'][0]['id'])
+        salata = Reteta.objects.get(id=res.data['created'][1]['id'])
+        carrot = Ingredient.objects.get(user=self.user, name='Carrot')
+        self.assertEqual(set(ciorba.ingredients.all()), {onion, carrot})
+        self.assertEqual(set(salata.ingredients.all()), {onion, carrot})
+        self.assertIn(vegan, ciorba.tags.all())
+        self.assertEqual(ciorba.tags.count(), 2)
+        self.assertEqual(
+            Ingredient.objects.filter(user=self.user).count(), 2
+        )
+
+    def test_bulk_reports_item_errors(self):
+        """Test invalid items are reported without aborting the batch"""
+        user2 = get_user_model().objects.create_user(
+            'other@chris.com',
+            'testpass'
+        )
+        foreign = Tag.objects.create(user=user2, name='Foreign')
+
+        res = self.post([
+            item(title=''),
+            item(title='Valid'),
+            item(title='Foreign tag', tags=[foreign.id]),
+            item(id=123456),
+        ])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([c['index'] for c in res.data['created']], [1])
+        self.assertEqual(
+            [error['index'] for error in res.data['errors']], [0, 2, 3]
+        )
+        self.assertIn('title', res.data['errors'][0]['errors'])
+        self.assertIn('tags', res.data['errors'][1]['errors'])
+        self.assertIn('id', res.data['errors'][2]['errors'])
+        self.assertEqual(
+            list(Reteta.objects.values_list('title', flat=True)), ['Valid']
+        )
+
+    def test_bulk_update(self):
+        """Test items with an id update the existing reteta"""
+        reteta = Reteta.objects.create(
+            user=self.user, title='Old', time_minutes=1, price=1
+        )
+        reteta.tags.add(Tag.objects.create(user=self.user, name='Old'))
+
+        res = self.post([item(id=reteta.id, title='New', tags=['New'])])
+
+        self.assertEqual(res.data['updated'], [{'index': 0, 'id': reteta.id}])
+        reteta.refresh_from_db()
+        self.assertEqual(reteta.title, 'New')
+        self.assertEqual(
+            list(reteta.tags.values_list('name', flat=True)), ['New']
+        )
+
+    def test_bulk_duplicate_id(self):
+        """Test a reteta updated twice in one body is an item error"""
+        reteta = Reteta.objects.create(
+            user=self.user, title='Old', time_minutes=1, price=1
+        )
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+
+        res = self.post([item(id=reteta.id, title='New', tags=[tag.id]),
+                         item(id=reteta.id, title='Newer', tags=[tag.id])])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['updated'], [{'index': 0, 'id': reteta.id}])
+        self.assertEqual(res.data['errors'], [{
+            'index': 1, 'errors': {'id': ['Duplicate in this request.']},
+        }])
+        reteta.refresh_from_db()
+        self.assertEqual(reteta.title, 'New')
+        self.assertEqual(list(reteta.tags.all()), [tag])
+
+    def test_bulk_requires_list(self):
+        """Test the bulk payload must be a list"""
+        res = self.post(item())
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_queries_do_not_grow_with_references(self):
+        """Test names are resolved with set based queries"""
+        def run(count):
+            names = ['Ingredient %d' % i for i in range(count)]
+            with CaptureQueriesContext(connection) as queries:
+                self.post([item(ingredients=names, tags=names)
+                           for i in range(3)])
+            return len(queries)
+
+        self.assertEqual(run(2), run(20))
+
+    def test_bulk_many_names(self):
+        """Test more names than fit in one query are created and linked"""
+        res = self.post([item(title='Reteta %d' % i, tags=['Tag %d' % i])
+                         for i in range(1200)])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['created']), 1200)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 1200)
+        reteta = Reteta.objects.get(title='Reteta 1100')
+        self.assertEqual([tag.name for tag in reteta.tags.all()],
+                         ['Tag 1100'])
@@ -0,0 +1,157 @@
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from accounts.models import Tag, Ingredient, Reteta
+
+TAGS_URL = reverse('reteta:tag-list')
+INGREDIENTS_URL = reverse('reteta:ingredient-list')
+BULK_URL = reverse('reteta:reteta-bulk')
+
+
+class BulkNameCreateTests(TestCase):
+    """Test creating tags and ingredients from a list of names"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@chris.com',
+            'password123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, url, names):
+        return self.client.post(url, [{'name': name} for name in names],
+                                format='json')
+
+    def test_mapping_in_order(self):
+        """Test every name is mapped to its row, existing in any case"""
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+
+        res = self.post(TAGS_URL, ['Soup', 'VEGAN', 'soup', 'Quick'])
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        soup = Tag.objects.get(user=self.user, name='Soup')
+        quick = Tag.objects.get(user=self.user, name='Quick')
+        self.assertEqual(res.data, [
+            {'id': soup.id, 'name': 'Soup', 'created': True},
+            {'id': vegan.id, 'name': 'Vegan', 'created': False},
+            {'id': soup.id, 'name': 'Soup', 'created': True},
+            {'id': quick.id, 'name': 'Quick', 'created': True},
+        ])
+        self.assertEqual(Tag.objects.count(), 3)
+
+    def test_all_existing(self):
+        """Test a list of known names creates nothing"""
+        onion = Ingredient.objects.create(user=self.user, name='Onion')
+
+        res = self.post(INGREDIENTS_URL, ['onion'])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data,
+                         [{'id': onion.id, 'name': 'Onion', 'created': False}])
+
+    def test_other_users_names(self):
+        """Test the names of other users are not matched"""
+        other = get_user_model().objects.create_user(
+            'other@chris.com',
+            'password123'
+        )
+        Ingredient.objects.create(user=other, name='Salt')
+
+        res = self.post(INGREDIENTS_URL, ['Salt'])
+
+        self.assertTrue(res.data[0]['created'])
+        self.assertEqual(Ingredient.objects.filter(name='Salt').count(), 2)
+
+    def test_queries_do_not_grow_with_names(self):
+        """Test the names are matched and created with set based queries"""
+        def run(prefix, count):
+            with CaptureQueriesContext(connection) as queries:
+                self.post(TAGS_URL,
+                          ['%s %d' % (prefix, i) for i in range(count)])
+            return len(queries)
+
+        self.assertEqual(run('a', 2), run('b', 20))
+
+    def test_invalid_items(self):
+        """Test an invalid name rejects the whole list"""
+        res = self.client.post(TAGS_URL, [{'name': 'Ok'}, {'name': ''}],
+                               format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertIn('name', res.data[1])
+        self.assertFalse(Tag.objects.exists())
+
+    def test_too_many_items(self):
+        """Test lists past bulk_max_items are rejected"""
+        res = self.post(TAGS_URL, ['Tag %d' % i for i in range(501)])
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_cache_invalidated(self):
+        """Test the created names show up in the cached list"""
+        self.client.get(TAGS_URL)
+
+        self.post(TAGS_URL, ['Soup'])
+
+        res = self.client.get(TAGS_URL)
+        self.assertEqual([tag['name'] for tag in res.data['results']],
+                         ['Soup'])
+
+
+class CaseInsensitiveNamesTests(TestCase):
+    """Test the names are unique per user regardless of case"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@chris.com',
+            'password123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.vegan = Tag.objects.create(user=self.user, name='Vegan')
+
+    def test_unique_index(self):
+        """Test the database refuses a name in another case"""
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Tag.objects.create(user=self.user, name='vEgAn')
+
+    def test_create_rejected(self):
+        """Test creating one tag in another case is a validation error"""
+        res = self.client.post(TAGS_URL, {'name': 'vegan'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_reference(self):
+        """Test the bulk action resolves names in any case"""
+        res = self.client.post(BULK_URL, [{
+            'title': 'Salata', 'time_minutes': 5, 'price': '2.00',
+            'tags': ['vegan'],
+        }], format='json')
+
+        reteta = Reteta.objects.get(id=res.data['created'][0]['id'])
+        self.assertEqual(list(reteta.tags.all()), [self.vegan])
+
+    def test_non_ascii_case(self):
+        """Test names outside ASCII are folded as the unique index does"""
+        apa = Tag.objects.create(user=self.user, name='Ăpa')
+        # lower() of SQLite leaves the letters outside ASCII as they are
+        folds = connection.vendor != 'sqlite'
+
+        res = self.client.post(TAGS_URL, [
+            {'name': 'ĂPA'}, {'name': 'ăpa'}, {'name': 'ăPA'},
+        ], format='json')
+        created = self.client.post(TAGS_URL, {'name': 'ĂPa'})
+
+        ids = [item['id'] for item in res.data]
+        self.assertEqual(ids[0], apa.id)
+        self.assertEqual(ids[1] == apa.id, folds)
+        self.assertEqual(ids[2], ids[1])
+        self.assertEqual(created.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(),
+                         2 if folds else 3)
@@ -0,0 +1,125 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.urls import reverse
+from django.test import TestCase
+from rest_framework import status
+from rest_framework.test import APIClient
+from accounts.models import Tag, Ingredient, Reteta
+
+TAGS_URL = reverse('reteta:tag-list')
+INGREDIENTS_URL = reverse('reteta:ingredient-list')
+BULK_URL = reverse('reteta:reteta-bulk')
+
+
+class CachedListApiTests(TestCase):
+    """Test caching the tag and ingredient lists"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'test@chris.com',
+            'password123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def names(self, url, **params):
+        res = self.client.get(url, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [item['name'] for item in res.data['results']]
+
+    def test_list_served_from_cache(self):
+        """Test a repeated list does not query the database"""
+        Tag.objects.create(user=self.user, name='Vegan')
+        self.client.get(TAGS_URL)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.data['results'][0]['name'], 'Vegan')
+
+    def test_query_params_cached_separately(self):
+        """Test each set of query params has its own entry"""
+        tag = Tag.objects.create(user=self.user, name='Breakfast')
+        Tag.objects.create(user=self.user, name='Lunch')
+        reteta = Reteta.objects.create(
+            user=self.user, title='Pancakes', time_minutes=5, price=3
+        )
+        reteta.tags.add(tag)
+
+        self.assertEqual(self.names(TAGS_URL), ['Lunch', 'Breakfast'])
+        self.assertEqual(self.names(TAGS_URL, assigned_only=1),
+                         ['Breakfast'])
+
+    def test_create_invalidates(self):
+        """Test creating a tag through the API invalidates the list"""
+        self.names(TAGS_URL)
+
+        self.client.post(TAGS_URL, {'name': 'Vegan'})
+
+        self.assertEqual(self.names(TAGS_URL), ['Vegan'])
+
+    def test_rename_and_delete_invalidate(self):
+        """Test renaming or deleting an ingredient invalidates the list"""
+        ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+        self.names(INGREDIENTS_URL)
+
+        ingredient.name = 'Pepper'
+        ingredient.save()
+        self.assertEqual(self.names(INGREDIENTS_URL), ['Pepper'])
+
+        ingredient.delete()
+        self.assertEqual(self.names(INGREDIENTS_URL), [])
+
+    def test_m2m_change_invalidates(self):
+        """Test assigning a tag to a reteta invalidates assigned_only"""
+        tag = Tag.objects.create(user=self.user, name='Dinner')
+        reteta = Reteta.objects.create(
+            user=self.user, title='Tocana', time_minutes=50, price=9
+        )
+        self.assertEqual(self.names(TAGS_URL, assigned_only=1), [])
+
+        reteta.tags.add(tag)
+        self.assertEqual(self.names(TAGS_URL, assigned_only=1), ['Dinner'])
+
+        tag.reteta_set.clear()
+        self.assertEqual(self.names(TAGS_URL, assigned_only=1), [])
+
+    def test_bulk_invalidates(self):
+        """Test the bulk reteta import invalidates the lists"""
+        self.names(TAGS_URL)
+
+        self.client.post(BULK_URL, [{
+            'title': 'Ciorba', 'time_minutes': 60, 'price': '4.00',
+            'tags': ['Soup'],
+        }], format='json')
+
+        self.assertEqual(self.names(TAGS_URL), ['Soup'])
+
+    def test_lists_cached_per_user(self):
+        """Test users never see each other's cached lists"""
+        user2 = get_user_model().objects.create_user(
+            'other@chris.com',
+            'testpass'
+        )
+        Tag.objects.create(user=user2, name='Foreign')
+        self.names(TAGS_URL)
+
+        self.client.force_authenticate(user2)
+
+        self.assertEqual(self.names(TAGS_URL), ['Foreign'])
+
+    def test_if_none_match(self):
+        """Test an unchanged list answers 304 to its ETag"""
+        Tag.objects.create(user=self.user, name='Vegan')
+        etag = self.client.get(TAGS_URL)['ETag']
+
+        with self.assertNumQueries(0):
+            res = self.client.get(TAGS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], etag)
+
+        Tag.objects.create(user=self.user, name='Dessert')
+        res = self.client.get(TAGS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
@@ -0,0 +1,200 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.urls import reverse
+from django.test import TestCase
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.test import APIClient
+from accounts.models import Reteta, Tag, Ingredient
+
+RETETA_URL = reverse('reteta:reteta-list')
+BULK_URL = reverse('reteta:reteta-bulk')
+
+
+def detail_url(reteta_id):
+    """"Return reteta detail URL"""
+    return reverse('reteta:reteta-detail', args=[reteta_id])
+
+
+class ConditionalGetTests(TestCase):
+    """Test the Last-Modified/ETag of the retete list and detail"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'test@chris.com',
+            'password123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.reteta = Reteta.objects.create(
+            user=self.user, title='Ciorba', time_minutes=30, price=5
+        )
+        self.tag = Tag.objects.create(user=self.user, name='Supe')
+
+    def revalidate(self, url, res, **params):
+        return self.client.get(url, params,
+                               HTTP_IF_NONE_MATCH=res['ETag'])
+
+    def test_list_not_modified(self):
+        """Test an unchanged list is one query and no body"""
+        res = self.client.get(RETETA_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('no-cache', res['Cache-Control'])
+
+        with self.assertNumQueries(1):
+            res2 = self.revalidate(RETETA_URL, res)
+
+        self.assertEqual(res2.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res2['ETag'], res['ETag'])
+        self.assertEqual(res2.content, b'')
+
+    def test_list_params_in_etag(self):
+        """Test the ETag differs per page and fields"""
+        res = self.client.get(RETETA_URL)
+
+        res2 = self.revalidate(RETETA_URL, res, fields='id')
+
+        self.assertEqual(res2.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res2['ETag'], res['ETag'])
+
+    def test_list_modified(self):
+        """Test M2M changes, edits and deletions change the list ETag"""
+        other = Reteta.objects.create(
+            user=self.user, title='Supa', time_minutes=5, price=1
+        )
+        changes = (
+            lambda: self.reteta.tags.add(self.tag),
+            lambda: self.tag.reteta_set.remove(self.reteta),
+            lambda: Reteta.objects.get(pk=other.pk).save(),
+            lambda: other.delete(),
+        )
+        for change in changes:
+            res = self.client.get(RETETA_URL)
+            change()
+
+            res2 = self.revalidate(RETETA_URL, res)
+
+            self.assertEqual(res2.status_code, status.HTTP_200_OK)
+            self.assertNotEqual(res2['ETag'], res['ETag'])
+
+    def test_if_modified_since(self):
+        """Test If-Modified-Since is answered from updated_at"""
+        res = self.client.get(detail_url(self.reteta.id))
+        self.assertEqual(res['Last-Modified'],
+                         http_date(self.reteta.updated_at.timestamp()))
+
+        res = self.client.get(detail_url(self.reteta.id),
+                              HTTP_IF_MODIFIED_SINCE=res['Last-Modified'])
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        earlier = self.reteta.updated_at - timedelta(seconds=10)
+        res = self.client.get(detail_url(self.reteta.id),
+                              HTTP_IF_MODIFIED_SINCE=http_date(
+                                  earlier.timestamp()
+                              ))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_list_deleted_since(self):
+        """Test a deletion moves the Last-Modified of the list"""
+        other = Reteta.objects.create(
+            user=self.user, title='Supa', time_minutes=5, price=1
+        )
+        Reteta.objects.filter(pk__in=[self.reteta.pk, other.pk]).update(
+            updated_at=self.reteta.updated_at - timedelta(seconds=10)
+        )
+        res = self.client.get(RETETA_URL)
+
+        other.delete()
+        res = self.client.get(RETETA_URL,
+                              HTTP_IF_MODIFIED_SINCE=res['Last-Modified'])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_retrieve_not_modified(self):
+        """Test an unchanged reteta is one query and no body"""
+        res = self.client.get(detail_url(self.reteta.id))
+
+        with self.assertNumQueries(1):
+            res2 = self.revalidate(detail_url(self.reteta.id), res)
+        self.assertEqual(res2.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.tag.reteta_set.add(self.reteta)
+        res2 = self.revalidate(detail_url(self.reteta.id), res)
+        self.assertEqual(res2.status_code, status.HTTP_200_OK)
+
+    def test_retrieve_missing(self):
+        """Test the retete of other users are still not found"""
+        other = get_user_model().objects.create_user(
+            'other@chris.com',
+            'password123'
+        )
+        reteta = Reteta.objects.create(
+            user=other, title='Supa', time_minutes=5, price=1
+        )
+
+        res = self.client.get(detail_url(reteta.id), HTTP_IF_NONE_MATCH='*')
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class UpdatedAtTests(TestCase):
+    """Test updated_at follows the M2M changes"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@chris.com',
+            'password123'
+        )
+        self.reteta = Reteta.objects.create(
+            user=self.user, title='Ciorba', time_minutes=30, price=5
+        )
+        self.tag = Tag.objects.create(user=self.user, name='Supe')
+        self.ingredient = Ingredient.objects.create(
+            user=self.user, name='Smantana'
+        )
+        self.past = self.reteta.updated_at - timedelta(days=1)
+        for model in (Reteta, Tag, Ingredient):
+            model.objects.update(updated_at=self.past)
+
+    def assertTouched(self, *objects):
+        for obj in objects:
+            obj.refresh_from_db()
+            self.assertGreater(obj.updated_at, self.past, obj)
+
+    def test_add_and_clear(self):
+        """Test adding and clearing bump both sides"""
+        self.reteta.tags.add(self.tag)
+        self.assertTouched(self.reteta, self.tag)
+
+        Tag.objects.update(updated_at=self.past)
+        Reteta.objects.update(updated_at=self.past)
+        self.reteta.tags.clear()
+        self.assertTouched(self.reteta, self.tag)
+
+    def test_reverse_remove(self):
+        """Test removing from the ingredient side bumps both sides"""
+        self.reteta.ingredients.add(self.ingredient)
+        Ingredient.objects.update(updated_at=self.past)
+        Reteta.objects.update(updated_at=self.past)
+
+        self.ingredient.reteta_set.remove(self.reteta)
+
+        self.assertTouched(self.reteta, self.ingredient)
+
+    def test_bulk(self):
+        """Test the bulk action bumps what it updates and links"""
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        res = client.post(BULK_URL, [{
+            'id': self.reteta.id, 'title': 'Ciorba', 'time_minutes': 30,
+            'price': '6.00', 'tags': [self.tag.id],
+        }], format='json')
+
+        self.assertEqual(res.data['updated'], [
+            {'index': 0, 'id': self.reteta.id}
+        ])
+        self.assertTouched(self.reteta, self.tag)
@@ -0,0 +1,130 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.test import TestCase
+from rest_framework import status
+from rest_framework.test import APIClient
+from accounts.models import Reteta, Tag, Ingredient
+
+RETETA_URL = reverse('reteta:reteta-list')
+EXPORT_URL = reverse('reteta:reteta-export')
+TAGS_URL = reverse('reteta:tag-list')
+
+
+def detail_url(reteta_id):
+    """"Return reteta detail URL"""
+    return reverse('reteta:reteta-detail', args=[reteta_id])
+
+
+class SparseFieldsTests(TestCase):
+    """Test choosing the fields of the API representations"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@chris.com',
+            'password123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.reteta = Reteta.objects.create(
+            user=self.user, title='Ciorba', time_minutes=30, price=5
+        )
+        self.tag = Tag.objects.create(user=self.user, name='Supe')
+        self.ingredient = Ingredient.objects.create(
+            user=self.user, name='Smantana'
+        )
+        self.reteta.tags.add(self.tag)
+        self.reteta.ingredients.add(self.ingredient)
+
+    def test_list_fields(self):
+        """Test a narrow list is one query without the M2M"""
+        # and the one of the Last-Modified/ETag
+        with self.assertNumQueries(2):
+            res = self.client.get(RETETA_URL, {'fields': 'id,title'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'], [
+            {'id': self.reteta.id, 'title': 'Ciorba'}
+        ])
+
+    def test_list_default_fields(self):
+        """Test the optional fields are left out by default"""
+        res = self.client.get(RETETA_URL)
+
+        reteta = res.data['results'][0]
+        self.assertNotIn('thumbnail', reteta)
+        self.assertEqual(reteta['tags'], [self.tag.id])
+        self.assertEqual(reteta['ingredients'], [self.ingredient.id])
+
+    def test_list_expand(self):
+        """Test expanded relations are nested objects"""
+        with self.assertNumQueries(3):
+            res = self.client.get(
+                RETETA_URL, {'fields': 'id,tags', 'expand': 'tags'}
+            )
+
+        self.assertEqual(res.data['results'], [{
+            'id': self.reteta.id,
+            'tags': [{'id': self.tag.id, 'name': 'Supe'}],
+        }])
+
+    def test_thumbnail(self):
+        """Test the thumbnail is sent once generated"""
+        res = self.client.get(RETETA_URL, {'fields': 'id,thumbnail'})
+        self.assertIsNone(res.data['results'][0]['thumbnail'])
+
+        self.reteta.image = 'photos/ciorba.jpg'
+        self.reteta.image_status = Reteta.IMAGE_READY
+        self.reteta.save()
+        res = self.client.get(RETETA_URL, {'fields': 'id,thumbnail'})
+
+        self.assertTrue(res.data['results'][0]['thumbnail'].endswith(
+            'photos/variants/ciorba_thumbnail.jpg'
+        ))
+
+    def test_unknown_fields(self):
+        """Test unknown names are rejected"""
+        res = self.client.get(RETETA_URL, {'fields': 'id,secret'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('fields', res.data)
+
+        res = self.client.get(RETETA_URL, {'expand': 'title'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('expand', res.data)
+
+    def test_retrieve_fields(self):
+        """Test the detail can be narrowed"""
+        with self.assertNumQueries(3):
+            res = self.client.get(detail_url(self.reteta.id),
+                                  {'fields': 'title,ingredients'})
+
+        self.assertEqual(res.data, {
+            'title': 'Ciorba',
+            'ingredients': [{'id': self.ingredient.id, 'name': 'Smantana'}],
+        })
+
+    def test_export_fields(self):
+        """Test the export lines follow ?fields="""
+        res = self.client.get(EXPORT_URL, {'fields': 'id,price'})
+
+        lines = b''.join(res.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], [
+            {'id': self.reteta.id, 'price': '5.00'}
+        ])
+
+    def test_tags_fields(self):
+        """Test the tag list can be narrowed"""
+        res = self.client.get(TAGS_URL, {'fields': 'name'})
+
+        self.assertEqual(res.data['results'], [{'name': 'Supe'}])
+
+    def test_writes_full_representation(self):
+        """Test ?fields= does not apply to writes"""
+        res = self.client.patch(
+            detail_url(self.reteta.id) + '?fields=id', {'title': 'Supa'}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['title'], 'Supa')
+        self.assertIn('tags', res.data)
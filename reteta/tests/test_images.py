@@ -0,0 +1,238 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.urls import reverse
+from django.test import TestCase, override_settings
+from rest_framework import status
+from rest_framework.test import APIClient
+from PIL import Image
+from accounts.models import Reteta
+from reteta import images
+
+
+def image_upload_url(reteta_id):
+    """Return URL for reteta image upload"""
+    return reverse('reteta:reteta-upload-image', args=[reteta_id])
+
+
+def detail_url(reteta_id):
+    """"Return reteta detail URL"""
+    return reverse('reteta:reteta-detail', args=[reteta_id])
+
+
+class ImageProcessingTests(TestCase):
+    """Test processing uploaded images in the background"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@chris.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.reteta = Reteta.objects.create(
+            user=self.user, title='Ciorba', time_minutes=10, price=5
+        )
+
+    def tearDown(self):
+        self.reteta.refresh_from_db()
+        if self.reteta.image:
+            images.delete_variants(self.reteta.image.name)
+            self.reteta.image.delete()
+
+    def upload(self, size=(1200, 900), exif=None):
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            img = Image.new('RGB', size)
+            if exif is not None:
+                img.save(ntf, format='JPEG', exif=exif)
+            else:
+                img.save(ntf, format='JPEG')
+            ntf.seek(0)
+            with mock.patch('reteta.images.schedule') as schedule:
+                res = self.client.post(
+                    image_upload_url(self.reteta.id),
+                    {'image': ntf},
+                    format='multipart'
+                )
+        self.reteta.refresh_from_db()
+        return res, schedule
+
+    def test_upload_schedules_processing(self):
+        """Test the upload returns before the image is processed"""
+        res, schedule = self.upload()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['image_status'], Reteta.IMAGE_PENDING)
+        schedule.assert_called_once_with(self.reteta)
+
+    def test_process_generates_variants(self):
+        """Test processing resizes the image into every variant"""
+        self.upload()
+
+        images.process(self.reteta.id, self.reteta.image.name)
+
+        self.reteta.refresh_from_db()
+        self.assertEqual(self.reteta.image_status, Reteta.IMAGE_READY)
+        for variant, (size, fmt, ext) in images.VARIANTS.items():
+            name = images.variant_name(self.reteta.image.name, variant)
+            with default_storage.open(name) as f:
+                img = Image.open(f)
+                self.assertEqual(img.format, fmt)
+                self.assertLessEqual(img.size[0], size[0])
+                self.assertLessEqual(img.size[1], size[1])
+
+    def test_process_strips_exif(self):
+        """Test the stored original has no EXIF metadata left"""
+        exif = Image.Exif()
+        exif[0x010f] = 'Camera maker'
+        self.upload(exif=exif.tobytes())
+        with self.reteta.image.open() as f:
+            self.assertIn('exif', Image.open(f).info)
+
+        images.process(self.reteta.id, self.reteta.image.name)
+
+        with self.reteta.image.open() as f:
+            self.assertNotIn('exif', Image.open(f).info)
+
+    def test_process_invalid_image(self):
+        """Test a file Pillow cannot read is marked as failed"""
+        name = default_storage.save('photos/bad.jpg', ContentFile(b'nope'))
+        Reteta.objects.filter(id=self.reteta.id).update(image=name)
+
+        with self.assertLogs('reteta.images', 'WARNING'):
+            images.process(self.reteta.id, name)
+
+        self.reteta.refresh_from_db()
+        self.assertEqual(self.reteta.image_status, Reteta.IMAGE_FAILED)
+
+    def test_process_replaced_image_skipped(self):
+        """Test an image replaced before processing is left alone"""
+        self.upload()
+
+        images.process(self.reteta.id, 'photos/older.jpg')
+
+        self.reteta.refresh_from_db()
+        self.assertEqual(self.reteta.image_status, Reteta.IMAGE_PENDING)
+
+    def test_detail_exposes_variants(self):
+        """Test the detail lists the variant URLs once ready"""
+        self.upload()
+        res = self.client.get(detail_url(self.reteta.id))
+        self.assertEqual(res.data['image_variants'], {})
+
+        images.process(self.reteta.id, self.reteta.image.name)
+        res = self.client.get(detail_url(self.reteta.id))
+
+        self.assertEqual(res.data['image_status'], Reteta.IMAGE_READY)
+        self.assertEqual(set(res.data['image_variants']),
+                         set(images.VARIANTS))
+        self.assertRegex(res.data['image_variants']['thumbnail'],
+                         r'^http://testserver/media/photos/[0-9a-f]{2}/'
+                         r'variants/[0-9a-f]{64}_thumbnail\.jpg$')
+
+
+def jpeg(color=(0, 0, 0)):
+    """Return an uploadable JPEG file"""
+    ntf = tempfile.NamedTemporaryFile(suffix='.JPG')
+    Image.new('RGB', (64, 64), color).save(ntf, format='JPEG')
+    ntf.seek(0)
+    return ntf
+
+
+@mock.patch('reteta.images.transaction.on_commit', lambda func: func())
+class ImageStorageTests(TestCase):
+    """Test the content addressed storage of the images"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root,
+                                     IMAGE_ORPHAN_GRACE_SECONDS=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@chris.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.reteta = Reteta.objects.create(
+            user=self.user, title='Ciorba', time_minutes=10, price=5
+        )
+        self.other = Reteta.objects.create(
+            user=get_user_model().objects.create_user(
+                'other@chris.com', 'testpass'
+            ), title='Supa', time_minutes=10, price=5
+        )
+
+    def upload(self, reteta, color=(0, 0, 0)):
+        if reteta.user_id != self.user.id:
+            self.client.force_authenticate(reteta.user)
+        with jpeg(color) as f, mock.patch('reteta.images.schedule'):
+            res = self.client.post(
+                image_upload_url(reteta.id), {'image': f},
+                format='multipart'
+            )
+        self.client.force_authenticate(self.user)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        reteta.refresh_from_db()
+        return reteta.image.name
+
+    def test_content_name(self):
+        """Test an upload is named after the SHA-256 of its content"""
+        name = self.upload(self.reteta)
+
+        self.assertRegex(name, r'^photos/([0-9a-f]{2})/\1[0-9a-f]{62}\.jpg$')
+        self.assertEqual(
+            [n for n in os.listdir(os.path.dirname(default_storage.path(name)))
+             if n.startswith('.upload-')], []
+        )
+
+    def test_identical_uploads_shared(self):
+        """Test the same photo of two users is stored and processed once"""
+        name = self.upload(self.reteta)
+        images.process(self.reteta.id, name)
+
+        self.assertEqual(self.upload(self.other), name)
+        with mock.patch('reteta.images._encode') as encode:
+            images.process(self.other.id, name)
+
+        encode.assert_not_called()
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.image_status, Reteta.IMAGE_READY)
+
+    def test_replaced_image_collected(self):
+        """Test a replaced image is deleted once no reteta uses it"""
+        name = self.upload(self.reteta)
+        self.upload(self.other)
+        images.process(self.reteta.id, name)
+
+        self.upload(self.reteta, color=(255, 0, 0))
+        self.assertTrue(default_storage.exists(name))
+
+        self.other.delete()
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(default_storage.exists(
+            images.variant_name(name, 'thumbnail')
+        ))
+
+    def test_collect_images_command(self):
+        """Test the command deletes the files no reteta uses"""
+        name = self.upload(self.reteta)
+        orphan = default_storage.save('photos/orphan.jpg', ContentFile(b'x'))
+
+        out = StringIO()
+        call_command('collect_images', '--dry-run', stdout=out)
+        self.assertIn(orphan, out.getvalue())
+        self.assertTrue(default_storage.exists(orphan))
+
+        call_command('collect_images', stdout=StringIO())
+        self.assertFalse(default_storage.exists(orphan))
+        self.assertTrue(default_storage.exists(name))
@@ -0,0 +1,164 @@
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, IntegrityError, transaction
+from django.urls import reverse
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APIClient
+from accounts.models import Tag, Ingredient, Reteta
+
+TAGS_URL = reverse('reteta:tag-list')
+INGREDIENTS_URL = reverse('reteta:ingredient-list')
+RETETA_URL = reverse('reteta:reteta-list')
+
+
+def query_plan(sql):
+    """Return the details of the SQLite query plan of `sql`"""
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        return [row[3] for row in cursor.fetchall()]
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN is SQLite')
+class QueryPlanTests(TestCase):
+    """Test the queries run by the API lists are served by indexes"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@chris.com',
+            'password123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.tags = [Tag.objects.create(user=self.user, name=name)
+                     for name in ('Soup', 'Vegan')]
+        self.ingredients = [
+            Ingredient.objects.create(user=self.user, name=name)
+            for name in ('Onion', 'Salt')
+        ]
+        for title, minutes, price in (('Ciorba', 10, 5), ('Supa', 20, 8)):
+            reteta = Reteta.objects.create(
+                user=self.user, title=title, time_minutes=minutes,
+                price=price
+            )
+            reteta.tags.add(*self.tags)
+            reteta.ingredients.add(*self.ingredients)
+
+    def page_query(self, url, params=None):
+        """Return the SQL of the page query of a list request, and the
+        response"""
+        # the tag and ingredient lists are cached
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(url, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        pages = [query['sql'] for query in queries.captured_queries
+                 if ' LIMIT ' in query['sql']]
+        self.assertEqual(len(pages), 1, pages)
+        return pages[0], res
+
+    def assertIndexed(self, url, params, *indexes):
+        """Assert the first and the next page of a list scan and sort
+        no table and use `indexes`"""
+        params = dict(params, page_size=1)
+        sql, res = self.page_query(url, params)
+        self.assertIsNotNone(res.data['next'])
+        for sql in (sql, self.page_query(res.data['next'])[0]):
+            plan = query_plan(sql)
+            text = '\n'.join(plan)
+            self.assertNotIn('SCAN', text, plan)
+            self.assertNotIn('TEMP B-TREE FOR ORDER BY', text, plan)
+            for index in indexes:
+                self.assertIn(index, text, plan)
+
+    def test_tag_list(self):
+        """Test the tag list reads the (user, name) index in order"""
+        self.assertIndexed(TAGS_URL, {}, 'COVERING INDEX')
+
+    def test_ingredient_list(self):
+        """Test the ingredient list reads the (user, name) index"""
+        self.assertIndexed(INGREDIENTS_URL, {}, 'COVERING INDEX')
+
+    def test_reteta_list(self):
+        """Test the reteta list reads the (user, -id) index"""
+        self.assertIndexed(RETETA_URL, {}, 'reteta_user_id_desc')
+
+    def test_filter_subqueries(self):
+        """Test the tag/ingredient filters read the reverse indexes"""
+        self.assertIndexed(
+            RETETA_URL, {'tags': '%d,%d' % tuple(t.id for t in self.tags)},
+            'COVERING INDEX accounts_reteta_tags_tag_reteta'
+        )
+        self.assertIndexed(
+            RETETA_URL, {
+                'ingredients': ','.join(
+                    str(ingredient.id) for ingredient in self.ingredients
+                ),
+                'match': 'all',
+            },
+            'COVERING INDEX accounts_reteta_ingredients_ingredient_reteta'
+        )
+
+    def test_usage_count(self):
+        """Test ?ordering=-usage_count and ?min_usage= read the index"""
+        for url, index in ((TAGS_URL, 'tag_user_usage'),
+                           (INGREDIENTS_URL, 'ingredient_user_usage')):
+            self.assertIndexed(url, {'ordering': '-usage_count'}, index)
+            self.assertIndexed(
+                url, {'ordering': 'usage_count', 'min_usage': 1}, index
+            )
+
+    def test_reteta_sort_keys(self):
+        """Test ?ordering= and the range filters read the sort indexes"""
+        for key, index, ranges in (
+                ('time_minutes', 'reteta_user_time_minutes',
+                 {'max_time': 30}),
+                ('price', 'reteta_user_price',
+                 {'min_price': 1, 'max_price': 10}),
+                ('title', 'reteta_user_title', {})):
+            for ordering in (key, '-' + key):
+                self.assertIndexed(RETETA_URL, {'ordering': ordering},
+                                   index)
+                self.assertIndexed(RETETA_URL,
+                                   dict(ranges, ordering=ordering), index)
+
+
+class UniqueNameTests(TestCase):
+    """Test tag and ingredient names are unique per user"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@chris.com',
+            'password123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_unique_per_user(self):
+        """Test a user cannot store the same name twice"""
+        Tag.objects.create(user=self.user, name='Vegan')
+        user2 = get_user_model().objects.create_user(
+            'other@chris.com',
+            'testpass'
+        )
+        Tag.objects.create(user=user2, name='Vegan')
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Tag.objects.create(user=self.user, name='Vegan')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Ingredient.objects.bulk_create([
+                Ingredient(user=self.user, name='Salt'),
+                Ingredient(user=self.user, name='Salt'),
+            ])
+
+    def test_create_duplicate_rejected(self):
+        """Test creating a duplicate name through the API is invalid"""
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        res = self.client.post(TAGS_URL, {'name': 'Vegan'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('name', res.data)
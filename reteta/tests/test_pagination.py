@@ -0,0 +1,153 @@
+import base64
+import json
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.urls import reverse
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APIClient
+from accounts.models import Tag
+from reteta.tests.test_reteta import sample_reteta
+
+RETETA_URL = reverse('reteta:reteta-list')
+TAGS_URL = reverse('reteta:tag-list')
+
+
+class KeysetPaginationTests(TestCase):
+    """Test paginating the reteta API lists"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@chris.com',
+            'password123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def walk(self, url, params):
+        """Follow the next links and return all results and pages"""
+        pages = []
+        res = self.client.get(url, params)
+        while True:
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            pages.append(res.data)
+            if not res.data['next']:
+                break
+            res = self.client.get(res.data['next'])
+        results = [item for page in pages for item in page['results']]
+        return results, pages
+
+    def test_page_size(self):
+        """Test the page size can be chosen by the client"""
+        for i in range(5):
+            sample_reteta(user=self.user)
+
+        res = self.client.get(RETETA_URL, {'page_size': 2})
+
+        self.assertEqual(len(res.data['results']), 2)
+        self.assertIsNotNone(res.data['next'])
+        self.assertIsNone(res.data['previous'])
+
+    def test_default_page_size_setting(self):
+        """Test the default page size follows REST_FRAMEWORK['PAGE_SIZE']"""
+        for i in range(3):
+            sample_reteta(user=self.user)
+
+        rest_framework = dict(settings.REST_FRAMEWORK, PAGE_SIZE=2)
+        with override_settings(REST_FRAMEWORK=rest_framework):
+            res = self.client.get(RETETA_URL)
+
+        self.assertEqual(len(res.data['results']), 2)
+        self.assertIsNotNone(res.data['next'])
+
+    def test_page_size_capped(self):
+        """Test the page size cannot exceed the maximum"""
+        for i in range(3):
+            sample_reteta(user=self.user)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(RETETA_URL, {'page_size': 10 ** 6})
+
+        self.assertEqual(len(res.data['results']), 3)
+        self.assertIn('LIMIT 101', queries.captured_queries[1]['sql'])
+
+    def test_walk_retete(self):
+        """Test following next links returns every reteta once"""
+        retete = [sample_reteta(user=self.user) for i in range(7)]
+
+        results, pages = self.walk(RETETA_URL, {'page_size': 3})
+
+        self.assertEqual(len(pages), 3)
+        self.assertEqual(
+            [item['id'] for item in results],
+            sorted((reteta.id for reteta in retete), reverse=True)
+        )
+
+    def test_walk_tags(self):
+        """Test tags are paged through in name order"""
+        tags = [Tag.objects.create(user=self.user, name=name)
+                for name in ('Vegan', 'Dessert', 'Brunch', 'Soup', 'Lunch')]
+
+        results, pages = self.walk(TAGS_URL, {'page_size': 2})
+
+        expected = Tag.objects.filter(
+            id__in=[tag.id for tag in tags]
+        ).order_by('-name', 'id')
+        self.assertEqual(
+            [item['id'] for item in results],
+            [tag.id for tag in expected]
+        )
+
+    def test_previous_link(self):
+        """Test the previous link returns the page before"""
+        for i in range(6):
+            sample_reteta(user=self.user)
+        first = self.client.get(RETETA_URL, {'page_size': 2})
+        second = self.client.get(first.data['next'])
+
+        res = self.client.get(second.data['previous'])
+
+        self.assertEqual(res.data['results'], first.data['results'])
+        self.assertIsNone(res.data['previous'])
+        self.assertEqual(res.data['next'], first.data['next'])
+
+    def test_deep_page_does_not_offset(self):
+        """Test a deep page is fetched with a keyset predicate"""
+        for i in range(6):
+            sample_reteta(user=self.user)
+        results, pages = self.walk(RETETA_URL, {'page_size': 2})
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(pages[-2]['next'])
+
+        # after the Last-Modified/ETag aggregate
+        sql = queries.captured_queries[1]['sql']
+        self.assertIn('LIMIT 3', sql)
+        self.assertNotIn('OFFSET', sql)
+
+    def test_invalid_cursor(self):
+        """Test a malformed cursor is rejected"""
+        res = self.client.get(RETETA_URL, {'cursor': 'not-a-cursor'})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_invalid_cursor_position(self):
+        """Test positions that are not values of the ordering are rejected"""
+        sample_reteta(user=self.user)
+        for params, position in (({}, ['abc']),
+                                 ({}, [None]),
+                                 ({}, [{}]),
+                                 ({}, [[1]]),
+                                 ({'ordering': 'price'}, ['x', 1]),
+                                 ({'search': 'sample'}, ['high', 1]),
+                                 ({'search': 'sample'}, [0.5, 'x'])):
+            cursor = base64.urlsafe_b64encode(
+                json.dumps({'p': position}).encode()
+            ).decode()
+            res = self.client.get(RETETA_URL, dict(params, cursor=cursor))
+
+            self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND,
+                             (params, position))
@@ -0,0 +1,112 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from accounts.models import Ingredient, Reteta
+
+RETETA_URL = reverse('reteta:reteta-list')
+
+
+class PantryApiTests(TestCase):
+    """Test listing the retete cooked with a pantry of ingredients"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@chris.com',
+            'password123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.ingredients = {
+            name: Ingredient.objects.create(user=self.user, name=name)
+            for name in ('Oua', 'Lapte', 'Faina', 'Zahar', 'Sare')
+        }
+        self.reteta('Omleta', 'Oua', 'Sare')
+        self.reteta('Clatite', 'Oua', 'Lapte', 'Faina', 'Zahar')
+        self.reteta('Paine', 'Faina', 'Sare')
+        self.reteta('Apa')
+
+    def reteta(self, title, *names):
+        reteta = Reteta.objects.create(
+            user=self.user, title=title, time_minutes=10, price=5
+        )
+        reteta.ingredients.add(*[self.ingredients[name] for name in names])
+        return reteta
+
+    def pantry(self, *names, **params):
+        params['pantry'] = ','.join(
+            str(self.ingredients[name].id) for name in names
+        )
+        res = self.client.get(RETETA_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data['results']
+
+    def titles(self, *names, **params):
+        return [item['title'] for item in self.pantry(*names, **params)]
+
+    def test_fully_covered(self):
+        """Test only the retete whose ingredients are all there"""
+        self.assertEqual(self.titles('Oua', 'Sare', 'Lapte'), ['Omleta'])
+        self.assertEqual(self.titles('Sare', 'Faina', 'Oua'),
+                         ['Paine', 'Omleta'])
+        self.assertEqual(self.titles('Zahar'), [])
+
+    def test_max_missing(self):
+        """Test retete missing a few ingredients, fewest missing first"""
+        results = self.pantry('Oua', 'Lapte', 'Sare', max_missing=2,
+                              fields='title,missing_count')
+
+        self.assertEqual(results, [
+            {'title': 'Omleta', 'missing_count': 0},
+            {'title': 'Paine', 'missing_count': 1},
+            {'title': 'Clatite', 'missing_count': 2},
+        ])
+
+    def test_missing_count_sent_by_default(self):
+        """Test a pantry list sends missing_count with the default fields"""
+        results = self.pantry('Oua', 'Sare', 'Lapte', max_missing=1)
+
+        self.assertEqual([(item['title'], item['missing_count'])
+                          for item in results],
+                         [('Omleta', 0), ('Paine', 1)])
+        self.assertIn('price', results[0])
+        self.assertNotIn('has_image', results[0])
+        self.assertNotIn('missing_count',
+                         self.client.get(RETETA_URL).data['results'][0])
+
+    def test_pages(self):
+        """Test the pages follow the missing count ordering"""
+        res = self.client.get(RETETA_URL, {
+            'pantry': self.ingredients['Oua'].id,
+            'max_missing': 3,
+            'page_size': 1,
+        })
+        titles = [res.data['results'][0]['title']]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            titles += [item['title'] for item in res.data['results']]
+
+        self.assertEqual(titles, ['Omleta', 'Clatite'])
+
+    def test_queries_do_not_grow_with_pantry(self):
+        """Test the pantry is matched in the list query, whatever its size"""
+        def run(size):
+            ids = ','.join(str(pk) for pk in range(1, size + 1))
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(RETETA_URL, {'pantry': ids, 'max_missing': 1})
+            return len(queries)
+
+        self.assertEqual(run(2), run(300))
+
+    def test_invalid_params(self):
+        """Test malformed pantries and counts are rejected"""
+        for params in ({'pantry': 'a,b'},
+                       {'pantry': ','.join(['1'] * 401)},
+                       {'pantry': '1', 'max_missing': '-1'},
+                       {'pantry': '1', 'max_missing': 'all'}):
+            res = self.client.get(RETETA_URL, params)
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -1,15 +1,21 @@
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.test import TestCase
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 from rest_framework.test import APIClient
 from accounts.models import Reteta, Tag, Ingredient
 from reteta.serializers import RetetaSerializer, RetetaDetailSerializer
+from reteta.views import RetetaViewSet
+from unittest import mock
+import json
 import tempfile
 import os
 from PIL import Image
 
 RETETA_URL = reverse('reteta:reteta-list')
+EXPORT_URL = reverse('reteta:reteta-export')
 # /api/reteta/retete
 # /api/reteta/retete/1/
 
@@ -79,7 +85,7 @@ class PrivateRetetaApiTests(TestCase):
         retete = Reteta.objects.all().order_by('-id')
         serializer = RetetaSerializer(retete, many=True)  # return list
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_reteta_limited_to_user(self):
         """Test that reteta returned are for the authenticated user"""
@@ -94,8 +100,8 @@ class PrivateRetetaApiTests(TestCase):
         rete = Reteta.objects.filter(user=self.user)
         serializer = RetetaSerializer(rete, many=True)  # return list
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_view_reteta_detail(self):
         """"Test viewinng a reteta detail"""
@@ -193,6 +199,45 @@ class PrivateRetetaApiTests(TestCase):
         tags = recipe.tags.all()
         self.assertEqual(len(tags), 0)
 
+    def test_reteta_list_query_count_fixed(self):
+        """Test listing retete does not query once per reteta"""
+        tag = sample_tag(user=self.user)
+        ingredient = sample_ingredient(user=self.user)
+        for i in range(2):
+            reteta = sample_reteta(user=self.user)
+            reteta.tags.add(tag)
+            reteta.ingredients.add(ingredient)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(RETETA_URL)
+
+        for i in range(10):
+            reteta = sample_reteta(user=self.user)
+            reteta.tags.add(tag)
+            reteta.ingredients.add(ingredient)
+        with CaptureQueriesContext(connection) as many:
+            res = self.client.get(RETETA_URL)
+
+        self.assertEqual(len(res.data['results']), 12)
+        self.assertEqual(len(few), len(many))
+        # validators + retete + ingredients + tags
+        self.assertEqual(len(many), 4)
+
+    def test_reteta_detail_query_count_fixed(self):
+        """Test viewing a reteta detail prefetches nested objects"""
+        reteta = sample_reteta(user=self.user)
+        for name in ('Salt', 'Pepper', 'Oil'):
+            reteta.ingredients.add(
+                sample_ingredient(user=self.user, name=name)
+            )
+            reteta.tags.add(sample_tag(user=self.user, name=name))
+
+        # validator + reteta + ingredients + tags
+        with self.assertNumQueries(4):
+            res = self.client.get(detail_url(reteta.id))
+
+        self.assertEqual(len(res.data['ingredients']), 3)
+        self.assertEqual(len(res.data['tags']), 3)
+
 
 class RetetaImageUploadTests(TestCase):
 
@@ -247,9 +292,9 @@ class RetetaImageUploadTests(TestCase):
         serializer1 = RetetaSerializer(recipe1)
         serializer2 = RetetaSerializer(recipe2)
         # serializer3 = RetetaSerializer(recipe3)
-        self.assertIn(serializer1.data, res.data)
-        self.assertIn(serializer2.data, res.data)
-        # self.assertNotIn(serializer3.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertIn(serializer2.data, res.data['results'])
+        # self.assertNotIn(serializer3.data, res.data['results'])
 
     def test_filter_reteta_by_ingredients(self):
         """Test returning retete with specific ingredients"""
@@ -269,6 +314,189 @@ class RetetaImageUploadTests(TestCase):
         serializer1 = RetetaSerializer(reteta1)
         serializer2 = RetetaSerializer(reteta2)
         # serializer3 = RetetaSerializer(reteta3)
-        self.assertIn(serializer1.data, res.data)
-        self.assertIn(serializer2.data, res.data)
-        # self.assertNotIn(serializer3.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertIn(serializer2.data, res.data['results'])
+        # self.assertNotIn(serializer3.data, res.data['results'])
+
+
+class RetetaExportTests(TestCase):
+    """Test streaming the retete of a user"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@chris.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def export(self):
+        res = self.client.get(EXPORT_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        content = b''.join(res.streaming_content).decode()
+        return [json.loads(line) for line in content.splitlines()]
+
+    def test_export_nested_retete(self):
+        """Test every reteta is exported with nested names"""
+        reteta1 = sample_reteta(user=self.user, title='Ciorba')
+        reteta1.tags.add(sample_tag(user=self.user, name='Soup'))
+        reteta1.ingredients.add(sample_ingredient(user=self.user))
+        reteta2 = sample_reteta(user=self.user, title='Sarmale')
+        user2 = get_user_model().objects.create_user(
+            'other@chris.com',
+            'testpass'
+        )
+        sample_reteta(user=user2)
+
+        lines = self.export()
+
+        self.assertEqual([line['id'] for line in lines],
+                         [reteta2.id, reteta1.id])
+        self.assertEqual(
+            lines[1],
+            json.loads(json.dumps(RetetaDetailSerializer(reteta1).data))
+        )
+        self.assertEqual(lines[1]['tags'][0]['name'], 'Soup')
+
+    def test_export_reads_in_chunks(self):
+        """Test the export queries per chunk, not per reteta"""
+        tag = sample_tag(user=self.user)
+        for i in range(5):
+            sample_reteta(user=self.user).tags.add(tag)
+
+        with mock.patch.object(RetetaViewSet, 'export_chunk_size', 2):
+            with CaptureQueriesContext(connection) as queries:
+                lines = self.export()
+
+        self.assertEqual(len(lines), 5)
+        # 3 chunks of retete + ingredients + tags, then an empty chunk
+        self.assertEqual(len(queries), 3 * 3 + 1)
+
+
+class RetetaFilterTests(TestCase):
+    """Test filtering retete by tags and ingredients"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@chris.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.vegan = sample_tag(user=self.user, name='Vegan')
+        self.quick = sample_tag(user=self.user, name='Quick')
+        self.salt = sample_ingredient(user=self.user, name='Salt')
+        self.both = sample_reteta(user=self.user, title='Both')
+        self.both.tags.add(self.vegan, self.quick)
+        self.both.ingredients.add(self.salt)
+        self.vegan_only = sample_reteta(user=self.user, title='Vegan only')
+        self.vegan_only.tags.add(self.vegan)
+        sample_reteta(user=self.user, title='None')
+
+    def titles(self, **params):
+        res = self.client.get(RETETA_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [item['title'] for item in res.data['results']]
+
+    def test_match_any_without_duplicates(self):
+        """Test a reteta having several of the tags is returned once"""
+        tags = f'{self.vegan.id},{self.quick.id}'
+
+        self.assertEqual(self.titles(tags=tags), ['Vegan only', 'Both'])
+        self.assertEqual(self.titles(tags=tags, match='any'),
+                         ['Vegan only', 'Both'])
+
+    def test_match_all(self):
+        """Test match=all keeps the retete having every tag"""
+        tags = f'{self.vegan.id},{self.quick.id}'
+
+        self.assertEqual(self.titles(tags=tags, match='all'), ['Both'])
+        self.assertEqual(
+            self.titles(tags=f'{self.vegan.id},{self.vegan.id}',
+                        match='all'),
+            ['Vegan only', 'Both']
+        )
+
+    def test_match_all_tags_and_ingredients(self):
+        """Test the tag and ingredient filters are combined"""
+        res = self.titles(
+            tags=f'{self.vegan.id}',
+            ingredients=f'{self.salt.id}',
+            match='all'
+        )
+
+        self.assertEqual(res, ['Both'])
+
+    def test_match_invalid(self):
+        """Test an unknown match mode is rejected"""
+        res = self.client.get(
+            RETETA_URL, {'tags': f'{self.vegan.id}', 'match': 'some'}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RetetaSortTests(TestCase):
+    """Test the range filters and sort keys of the reteta list"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@chris.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        for title, time_minutes, price in (('Ciorba', 60, '12.50'),
+                                           ('Omleta', 10, '4.00'),
+                                           ('Salata', 10, '7.25'),
+                                           ('Friptura', 90, '30.00')):
+            sample_reteta(user=self.user, title=title,
+                          time_minutes=time_minutes, price=price)
+
+    def titles(self, **params):
+        res = self.client.get(RETETA_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [item['title'] for item in res.data['results']]
+
+    def test_range_filters(self):
+        """Test ?max_time=, ?min_price= and ?max_price="""
+        self.assertEqual(self.titles(max_time=10), ['Salata', 'Omleta'])
+        self.assertEqual(self.titles(min_price='7.25', max_price='20'),
+                         ['Salata', 'Ciorba'])
+        self.assertEqual(self.titles(max_time=60, min_price=5),
+                         ['Salata', 'Ciorba'])
+
+    def test_ordering(self):
+        """Test ?ordering= on the time, the price and the title"""
+        self.assertEqual(self.titles(ordering='time_minutes'),
+                         ['Omleta', 'Salata', 'Ciorba', 'Friptura'])
+        self.assertEqual(self.titles(ordering='-time_minutes'),
+                         ['Friptura', 'Ciorba', 'Salata', 'Omleta'])
+        self.assertEqual(self.titles(ordering='-price'),
+                         ['Friptura', 'Ciorba', 'Salata', 'Omleta'])
+        self.assertEqual(self.titles(ordering='title', max_price=10),
+                         ['Omleta', 'Salata'])
+
+    def test_ordering_pages(self):
+        """Test the pages follow every sort key, ties included"""
+        for ordering in ('time_minutes', '-time_minutes', 'price', '-price',
+                         'title', '-title'):
+            expected = self.titles(ordering=ordering)
+            res = self.client.get(RETETA_URL,
+                                  {'ordering': ordering, 'page_size': 1})
+            titles = [item['title'] for item in res.data['results']]
+            while res.data['next']:
+                res = self.client.get(res.data['next'])
+                titles += [item['title'] for item in res.data['results']]
+
+            self.assertEqual(titles, expected, ordering)
+
+    def test_invalid_params(self):
+        """Test unknown orderings and malformed bounds are rejected"""
+        for params in ({'ordering': 'link'}, {'max_time': 'soon'},
+                       {'min_price': 'cheap'}, {'max_price': '1e9'}):
+            res = self.client.get(RETETA_URL, params)
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn(list(params)[0], res.data)
@@ -0,0 +1,123 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.urls import reverse
+from django.test import TestCase
+from rest_framework.test import APIClient
+from accounts.models import Tag, Ingredient
+from reteta import search
+from reteta.tests.test_reteta import sample_reteta
+
+RETETA_URL = reverse('reteta:reteta-list')
+
+
+class RetetaSearchApiTests(TestCase):
+    """Test the full-text search of retete"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@chris.com',
+            'password123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def search(self, query, **params):
+        params['search'] = query
+        res = self.client.get(RETETA_URL, params)
+        return [item['title'] for item in res.data['results']]
+
+    def test_search_title_prefix(self):
+        """Test words of the query match title prefixes"""
+        sample_reteta(user=self.user, title='Supa de pui')
+        sample_reteta(user=self.user, title='Tocana de porc')
+
+        self.assertEqual(self.search('sup'), ['Supa de pui'])
+        self.assertEqual(self.search('DE pu'), ['Supa de pui'])
+        self.assertEqual(self.search('vita'), [])
+
+    def test_search_ingredients_and_tags(self):
+        """Test retete are found by ingredient and tag names"""
+        ciorba = sample_reteta(user=self.user, title='Ciorba')
+        ciorba.ingredients.add(
+            Ingredient.objects.create(user=self.user, name='Smantana')
+        )
+        salata = sample_reteta(user=self.user, title='Salata')
+        salata.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+
+        self.assertEqual(self.search('smantana'), ['Ciorba'])
+        self.assertEqual(self.search('vegan'), ['Salata'])
+
+    def test_search_ranked(self):
+        """Test better matches come first"""
+        pui = Ingredient.objects.create(user=self.user, name='Pui')
+        sample_reteta(user=self.user, title='Tocana').ingredients.add(pui)
+        sample_reteta(user=self.user, title='Pui cu smantana') \
+            .ingredients.add(pui)
+
+        self.assertEqual(self.search('pui'), ['Pui cu smantana', 'Tocana'])
+
+    def test_search_limited_to_user(self):
+        """Test other users' retete are never returned"""
+        user2 = get_user_model().objects.create_user(
+            'other@chris.com',
+            'testpass'
+        )
+        sample_reteta(user=user2, title='Sarmale')
+
+        self.assertEqual(self.search('sarmale'), [])
+
+    def test_search_paginated(self):
+        """Test the search results can be paged through"""
+        for i in range(5):
+            sample_reteta(user=self.user, title='Clatite %d' % i)
+
+        res = self.client.get(RETETA_URL, {'search': 'clatite',
+                                           'page_size': 2})
+        titles = [item['title'] for item in res.data['results']]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            titles += [item['title'] for item in res.data['results']]
+
+        self.assertEqual(sorted(titles),
+                         ['Clatite %d' % i for i in range(5)])
+
+    def test_index_follows_renames_and_deletes(self):
+        """Test the index is kept up to date incrementally"""
+        tag = Tag.objects.create(user=self.user, name='Desert')
+        reteta = sample_reteta(user=self.user, title='Papanasi')
+        tag.reteta_set.add(reteta)
+        self.assertEqual(self.search('desert'), ['Papanasi'])
+
+        tag.name = 'Dulce'
+        tag.save()
+        self.assertEqual(self.search('desert'), [])
+        self.assertEqual(self.search('dulce'), ['Papanasi'])
+
+        tag.delete()
+        self.assertEqual(self.search('dulce'), [])
+
+        reteta.title = 'Cozonac'
+        reteta.save()
+        self.assertEqual(self.search('papanasi'), [])
+        self.assertEqual(self.search('cozonac'), ['Cozonac'])
+
+        reteta.delete()
+        self.assertEqual(self.search('cozonac'), [])
+
+    def test_rebuild_command(self):
+        """Test the index can be rebuilt from scratch in batches"""
+        for title in ('Mici', 'Mamaliga', 'Zacusca'):
+            sample_reteta(user=self.user, title=title)
+        with connection.cursor() as cursor:
+            search.get_backend().clear(cursor)
+        self.assertEqual(self.search('mici'), [])
+
+        out = StringIO()
+        call_command('rebuild_search_index', batch_size=2, stdout=out)
+
+        self.assertIn('Indexed 3 retete', out.getvalue())
+        self.assertEqual(self.search('mici'), ['Mici'])
+        self.assertEqual(self.search('ma'), ['Mamaliga'])
@@ -0,0 +1,173 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from accounts.models import Tag, Ingredient, Reteta
+from reteta import similarity
+
+
+def similar_url(reteta_id):
+    return reverse('reteta:reteta-similar', args=[reteta_id])
+
+
+def index(*retete, version=0):
+    """Index of the (reteta ID, feature keys) given"""
+    rows = [pk for pk, keys in retete for key in keys]
+    keys = [key for pk, keys in retete for key in keys]
+    return similarity.Index.build(version, np.array(rows, dtype=np.int64),
+                                  np.array(keys, dtype=np.int64))
+
+
+class IndexTests(TestCase):
+    """Test the similarity index"""
+
+    def test_jaccard_ranking(self):
+        """Test retete are ranked on shared / distinct features"""
+        idx = index((1, [2, 4, 6, 8]), (2, [2, 4, 6]), (3, [2, 10]),
+                    (4, [12]), (5, [8, 6, 4, 2]))
+
+        self.assertEqual(idx.similar(1, 10),
+                         [(5, 1.0), (2, 0.75), (3, 0.2)])
+        self.assertEqual(idx.similar(1, 2), [(5, 1.0), (2, 0.75)])
+        self.assertEqual(idx.similar(4, 10), [])
+        self.assertEqual(idx.similar(6, 10), [])
+
+    def test_ties_newest_first(self):
+        """Test equal scores cut at the limit keep the newest retete"""
+        idx = index((1, [2]), *[(pk, [2, pk * 2 + 1]) for pk in range(2, 8)])
+
+        self.assertEqual([pk for pk, score in idx.similar(1, 3)], [7, 6, 5])
+
+    def test_patch(self):
+        """Test the rows of changed retete are replaced or dropped"""
+        idx = index((1, [2, 4]), (2, [2]), (3, [4]))
+
+        idx = idx.patch(7, [2, 3, 9], np.array([3, 9]), np.array([2, 2]))
+
+        self.assertEqual(idx.version, 7)
+        self.assertEqual(idx.ids.tolist(), [1, 3, 9])
+        self.assertEqual(idx.similar(1, 10), [(9, 0.5), (3, 0.5)])
+
+    def test_save_load(self):
+        """Test a saved index is mapped back from its file"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, '1.npy')
+        index((1, [2, 4]), (3, [4]), version=12).save(path)
+
+        idx = similarity.Index.load(path)
+
+        self.assertIsInstance(idx.keys, np.memmap)
+        self.assertEqual(idx.version, 12)
+        self.assertEqual(idx.similar(3, 10), [(1, 0.5)])
+        self.assertIsNone(similarity.Index.load(path + '.missing'))
+
+
+class SimilarApiTests(TestCase):
+    """Test the similar retete of a reteta"""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings = override_settings(SIMILAR={'INDEX_DIR': directory})
+        settings.enable()
+        self.addCleanup(settings.disable)
+        similarity.clear()
+        self.addCleanup(similarity.clear)
+
+        self.user = get_user_model().objects.create_user(
+            'test@chris.com',
+            'password123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.soup = Tag.objects.create(user=self.user, name='Soup')
+        self.onion = Ingredient.objects.create(user=self.user, name='Onion')
+        self.salt = Ingredient.objects.create(user=self.user, name='Salt')
+        self.ciorba = self.reteta('Ciorba', [self.soup], [self.onion])
+        self.supa = self.reteta('Supa', [self.soup], [self.onion, self.salt])
+        self.salata = self.reteta('Salata', [], [self.salt])
+
+    def reteta(self, title, tags, ingredients):
+        reteta = Reteta.objects.create(
+            user=self.user, title=title, time_minutes=10, price=5
+        )
+        reteta.tags.add(*tags)
+        reteta.ingredients.add(*ingredients)
+        return reteta
+
+    def similar(self, reteta, **params):
+        res = self.client.get(similar_url(reteta.id), params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [(item['title'], item['similarity']) for item in res.data]
+
+    def test_similar(self):
+        """Test the retete sharing tags or ingredients, best first"""
+        self.assertEqual(self.similar(self.ciorba),
+                         [('Supa', 0.6667)])
+        self.assertEqual(self.similar(self.supa),
+                         [('Ciorba', 0.6667), ('Salata', 0.3333)])
+        self.assertEqual(self.similar(self.supa, limit=1),
+                         [('Ciorba', 0.6667)])
+
+    def test_follows_changes(self):
+        """Test changed and deleted retete are seen by the next call"""
+        self.similar(self.supa)
+
+        self.salata.ingredients.add(self.onion)
+        self.ciorba.delete()
+        self.supa.tags.clear()
+
+        self.assertEqual(self.similar(self.supa), [('Salata', 1.0)])
+
+    @override_settings(SYNC={'SETTLE_SECONDS': 0})
+    def test_index_saved(self):
+        """Test a process maps the saved index and applies the log"""
+        self.similar(self.ciorba)
+        similarity.clear()
+        self.salata.tags.add(self.soup)
+
+        self.assertEqual(self.similar(self.ciorba),
+                         [('Supa', 0.6667), ('Salata', 0.3333)])
+        saved = similarity.Index.load(similarity.index_path(self.user.id))
+        self.assertEqual(saved.ids.tolist(),
+                         [self.ciorba.id, self.supa.id, self.salata.id])
+
+    def test_other_users(self):
+        """Test the retete of other users are neither read nor listed"""
+        other = get_user_model().objects.create_user(
+            'other@chris.com',
+            'password123'
+        )
+        reteta = Reteta.objects.create(
+            user=other, title='Ciorba', time_minutes=10, price=5
+        )
+        reteta.tags.add(Tag.objects.create(user=other, name='Soup'))
+
+        self.assertEqual(self.similar(self.ciorba), [('Supa', 0.6667)])
+        res = self.client.get(similar_url(reteta.id))
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_invalid_limit(self):
+        """Test the limit is an integer up to similar_max_limit"""
+        for limit in ('many', 0, 51):
+            res = self.client.get(similar_url(self.ciorba.id),
+                                  {'limit': limit})
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_user_deleted(self):
+        """Test the index file of a deleted user is removed"""
+        self.similar(self.ciorba)
+        path = similarity.index_path(self.user.id)
+        self.assertTrue(os.path.exists(path))
+
+        self.user.delete()
+
+        self.assertFalse(os.path.exists(path))
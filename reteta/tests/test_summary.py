@@ -0,0 +1,176 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.urls import reverse
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from accounts.models import Reteta, Tag, Ingredient
+from reteta import search, summary
+from reteta.tests.test_reteta import sample_reteta
+
+RETETA_URL = reverse('reteta:reteta-list')
+BULK_URL = reverse('reteta:reteta-bulk')
+
+
+class RetetaSummaryTests(TestCase):
+    """Test the summary columns follow the tags and ingredients"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@chris.com',
+            'password123'
+        )
+        self.reteta = sample_reteta(user=self.user, title='Ciorba')
+        self.vegan = Tag.objects.create(user=self.user, name='Vegan')
+        self.soup = Tag.objects.create(user=self.user, name='Soup')
+        self.onion = Ingredient.objects.create(user=self.user, name='Onion')
+
+    def summary(self):
+        self.reteta.refresh_from_db()
+        return (self.reteta.ingredient_count, self.reteta.tag_names,
+                self.reteta.search_text)
+
+    def test_new_reteta(self):
+        """Test a new reteta is summarized when inserted"""
+        self.assertEqual(self.summary(), (0, '', 'ciorba\n\n'))
+
+    def test_add_remove_clear(self):
+        """Test the summary follows the M2M changes"""
+        self.reteta.tags.add(self.vegan, self.soup)
+        self.reteta.ingredients.add(self.onion)
+        self.assertEqual(self.summary(),
+                         (1, 'Soup\nVegan', 'ciorba\nonion\nsoup vegan'))
+
+        self.reteta.tags.remove(self.soup)
+        self.assertEqual(self.summary(),
+                         (1, 'Vegan', 'ciorba\nonion\nvegan'))
+
+        self.reteta.ingredients.clear()
+        self.assertEqual(self.summary(), (0, 'Vegan', 'ciorba\n\nvegan'))
+
+    def test_reverse_add_and_clear(self):
+        """Test changes from the tag side refresh the retete"""
+        self.vegan.reteta_set.add(self.reteta)
+        self.assertEqual(self.summary()[1], 'Vegan')
+
+        self.vegan.reteta_set.clear()
+        self.assertEqual(self.summary()[1], '')
+
+    def test_rename(self):
+        """Test renaming a tag updates the retete using it"""
+        other = sample_reteta(user=self.user, title='Supa')
+        self.vegan.reteta_set.add(self.reteta, other)
+
+        self.vegan.name = 'Plant based'
+        self.vegan.save()
+
+        self.assertEqual(self.summary()[1], 'Plant based')
+        other.refresh_from_db()
+        self.assertEqual(other.search_text, 'supa\n\nplant based')
+
+    def test_delete(self):
+        """Test deleting an ingredient updates the retete using it"""
+        self.reteta.ingredients.add(self.onion)
+
+        self.onion.delete()
+
+        self.assertEqual(self.summary(), (0, '', 'ciorba\n\n'))
+
+    def test_bulk(self):
+        """Test retete written by the bulk action are summarized"""
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        res = client.post(BULK_URL, [{
+            'title': 'Salata', 'time_minutes': 5, 'price': '2.00',
+            'ingredients': ['Onion', 'Tomato'], 'tags': ['Vegan'],
+        }], format='json')
+
+        salata = Reteta.objects.get(id=res.data['created'][0]['id'])
+        self.assertEqual(salata.ingredient_count, 2)
+        self.assertEqual(salata.search_text, 'salata\nonion tomato\nvegan')
+
+    def test_request_refreshes_once(self):
+        """Test a create with tags and ingredients refreshes it once"""
+        client = APIClient()
+        client.force_authenticate(self.user)
+        payload = {'title': 'Salata', 'time_minutes': 5, 'price': '2.00',
+                   'tags': [self.vegan.id], 'ingredients': [self.onion.id]}
+
+        with CaptureQueriesContext(connection) as queries:
+            res = client.post(RETETA_URL, payload, format='json')
+
+        statements = [query['sql'] for query in queries.captured_queries]
+        # the summary UPDATE and the rewrite of the search entry
+        for prefix in ('UPDATE "accounts_reteta"',
+                       'DELETE FROM reteta_search'):
+            self.assertEqual(
+                len([sql for sql in statements if sql.startswith(prefix)]),
+                1, prefix
+            )
+        salata = Reteta.objects.get(id=res.data['id'])
+        self.assertEqual(salata.search_text, 'salata\nonion\nvegan')
+        self.assertEqual(search.search(Reteta.objects.all(), 'vegan')
+                         .get().id, salata.id)
+
+    def test_fields(self):
+        """Test the summary is sent with ?fields= from the row alone"""
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.reteta.tags.add(self.vegan, self.soup)
+        self.reteta.ingredients.add(self.onion)
+
+        # and the Last-Modified/ETag aggregate
+        with self.assertNumQueries(2):
+            res = client.get(RETETA_URL, {
+                'fields': 'id,ingredient_count,tag_names,has_image'
+            })
+
+        self.assertEqual(res.data['results'], [{
+            'id': self.reteta.id,
+            'ingredient_count': 1,
+            'tag_names': ['Soup', 'Vegan'],
+            'has_image': False,
+        }])
+
+
+class RepairSummaryCommandTests(TestCase):
+    """Test the repair_reteta_summary command"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@chris.com',
+            'password123'
+        )
+        self.reteta = sample_reteta(user=self.user, title='Ciorba')
+        self.reteta.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+        # as left by writes that bypass the signals
+        Reteta.objects.filter(id=self.reteta.id).update(
+            tag_names='', search_text='ciorba\n\n'
+        )
+
+    def test_check(self):
+        """Test --check reports the outdated retete"""
+        self.assertEqual(summary.check([self.reteta.id]), [self.reteta.id])
+
+        with self.assertRaisesMessage(CommandError, '1 of 1 retete'):
+            call_command('repair_reteta_summary', '--check',
+                         stdout=StringIO())
+
+    def test_repair(self):
+        """Test the outdated retete and their search entries are fixed"""
+        out = StringIO()
+        call_command('repair_reteta_summary', stdout=out)
+
+        self.assertIn('repaired 1', out.getvalue())
+        self.reteta.refresh_from_db()
+        self.assertEqual(self.reteta.tag_names, 'Vegan')
+        self.assertEqual(
+            [r.id for r in search.search(Reteta.objects.all(), 'vegan')],
+            [self.reteta.id]
+        )
+        call_command('repair_reteta_summary', '--check', stdout=StringIO())
@@ -0,0 +1,203 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from accounts.models import ChangeLog, Reteta, Tag, Ingredient
+from reteta import changelog
+
+SYNC_URL = reverse('reteta:sync')
+BULK_URL = reverse('reteta:reteta-bulk')
+
+
+@override_settings(SYNC={'PAGE_SIZE': 500, 'SETTLE_SECONDS': 0})
+class SyncApiTests(TestCase):
+    """Test the delta sync of the retete, tags and ingredients"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@chris.com',
+            'password123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.reteta = Reteta.objects.create(
+            user=self.user, title='Ciorba', time_minutes=30, price=5
+        )
+        self.tag = Tag.objects.create(user=self.user, name='Supe')
+        self.ingredient = Ingredient.objects.create(
+            user=self.user, name='Smantana'
+        )
+
+    def sync(self, since=None):
+        params = {} if since is None else {'since': since}
+        res = self.client.get(SYNC_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data
+
+    def test_login_required(self):
+        """Test the sync needs an authenticated user"""
+        res = APIClient().get(SYNC_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_initial_sync(self):
+        """Test a sync without checkpoint sends everything of the user"""
+        other = get_user_model().objects.create_user(
+            'other@chris.com',
+            'password123'
+        )
+        Tag.objects.create(user=other, name='Desert')
+
+        data = self.sync()
+
+        self.assertFalse(data['more'])
+        self.assertEqual([r['id'] for r in data['retete']], [self.reteta.id])
+        self.assertEqual(data['tags'], [{'id': self.tag.id, 'name': 'Supe'}])
+        self.assertEqual([i['id'] for i in data['ingredients']],
+                         [self.ingredient.id])
+        self.assertEqual(data['deleted'],
+                         {'retete': [], 'tags': [], 'ingredients': []})
+
+    def test_delta(self):
+        """Test only the changes since the checkpoint are sent"""
+        checkpoint = self.sync()['checkpoint']
+
+        self.reteta.tags.add(self.tag)
+        ingredient_id = self.ingredient.id
+        self.ingredient.delete()
+
+        data = self.sync(checkpoint)
+
+        self.assertEqual(data['retete'][0]['tags'], [self.tag.id])
+        self.assertEqual([t['id'] for t in data['tags']], [self.tag.id])
+        self.assertEqual(data['ingredients'], [])
+        self.assertEqual(data['deleted']['ingredients'], [ingredient_id])
+
+        data = self.sync(data['checkpoint'])
+        self.assertEqual((data['retete'], data['tags'], data['ingredients']),
+                         ([], [], []))
+
+    def test_bulk_and_rename(self):
+        """Test writes that bypass post_save are logged"""
+        checkpoint = self.sync()['checkpoint']
+
+        self.client.post(BULK_URL, [{
+            'title': 'Salata', 'time_minutes': 5, 'price': '2.00',
+            'tags': ['Salate'],
+        }], format='json')
+        salata = Reteta.objects.get(title='Salata')
+        data = self.sync(checkpoint)
+        self.assertEqual([r['id'] for r in data['retete']], [salata.id])
+        self.assertEqual([t['name'] for t in data['tags']], ['Salate'])
+
+        self.reteta.tags.add(self.tag)
+        checkpoint = self.sync()['checkpoint']
+        self.tag.name = 'Ciorbe'
+        self.tag.save()
+        data = self.sync(checkpoint)
+        self.assertEqual([r['id'] for r in data['retete']], [self.reteta.id])
+        self.assertEqual([t['name'] for t in data['tags']], ['Ciorbe'])
+
+    def test_one_entry_per_object(self):
+        """Test an object changed many times is logged once"""
+        for price in range(3):
+            self.reteta.price = price
+            self.reteta.save()
+
+        self.assertEqual(ChangeLog.objects.filter(
+            model=ChangeLog.RETETA, object_id=self.reteta.id
+        ).count(), 1)
+
+    def test_request_logged_once(self):
+        """Test an update logs its objects once, at the end of the request"""
+        url = reverse('reteta:reteta-detail', args=[self.reteta.id])
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.put(url, {
+                'title': 'Ciorba', 'time_minutes': 30, 'price': '5.00',
+                'tags': [self.tag.id], 'ingredients': [self.ingredient.id],
+            }, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        inserts = [
+            query for query in queries.captured_queries
+            if query['sql'].startswith('INSERT INTO "accounts_changelog"')
+        ]
+        # one per model: the reteta, its tag and its ingredient
+        self.assertEqual(len(inserts), 3)
+        data = self.sync()
+        self.assertEqual([t['id'] for t in data['tags']], [self.tag.id])
+
+    def test_batch_rolled_back(self):
+        """Test the entries of a failed batch are not written"""
+        checkpoint = self.sync()['checkpoint']
+        with self.assertRaises(ValueError):
+            with transaction.atomic(), changelog.batch():
+                self.tag.name = 'Ciorbe'
+                self.tag.save()
+                raise ValueError
+
+        self.assertEqual(self.sync(checkpoint)['tags'], [])
+        self.tag.refresh_from_db()
+        self.assertEqual(self.tag.name, 'Supe')
+
+    def test_pages(self):
+        """Test a sync past PAGE_SIZE entries is sent in pages"""
+        with override_settings(SYNC={'PAGE_SIZE': 2, 'SETTLE_SECONDS': 0}):
+            data = self.sync()
+            self.assertTrue(data['more'])
+            data = self.sync(data['checkpoint'])
+
+        self.assertFalse(data['more'])
+        self.assertEqual(len(data['ingredients']), 1)
+
+    def test_constant_queries(self):
+        """Test the sync costs the same for one or many changes"""
+        checkpoint = self.sync()['checkpoint']
+        for i in range(10):
+            reteta = Reteta.objects.create(
+                user=self.user, title='Supa %d' % i, time_minutes=5, price=1
+            )
+            reteta.tags.add(self.tag)
+            Ingredient.objects.create(user=self.user, name='Ceapa %d' % i)
+
+        # change log, retete, their ingredients and tags, tags, ingredients
+        with self.assertNumQueries(6):
+            data = self.sync(checkpoint)
+        self.assertEqual(len(data['retete']), 10)
+
+    def test_unsettled_entries(self):
+        """Test the checkpoint stays before the recent entries"""
+        with override_settings(SYNC={'PAGE_SIZE': 500,
+                                     'SETTLE_SECONDS': 60}):
+            data = self.sync()
+
+        self.assertEqual(len(data['retete']), 1)
+        self.assertEqual(changelog.decode_token(data['checkpoint']), 0)
+
+        ChangeLog.objects.update(
+            created_at=self.reteta.updated_at - timedelta(minutes=5)
+        )
+        with override_settings(SYNC={'PAGE_SIZE': 500,
+                                     'SETTLE_SECONDS': 60}):
+            data = self.sync()
+        self.assertEqual(changelog.decode_token(data['checkpoint']),
+                         ChangeLog.objects.latest('id').id)
+
+    def test_invalid_token(self):
+        """Test an invalid checkpoint is rejected"""
+        for token in ('nope', changelog.encode_token(-1), '!!'):
+            res = self.client.get(SYNC_URL, {'since': token})
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('since', res.data)
+
+    def test_user_deleted(self):
+        """Test the log of a deleted user is dropped with the user"""
+        self.user.delete()
+
+        self.assertFalse(ChangeLog.objects.exists())
@@ -0,0 +1,188 @@
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.test import TestCase
+from rest_framework import status
+from rest_framework.test import APIClient
+from accounts.models import Tag, Ingredient
+from reteta.tests.test_reteta import sample_reteta
+
+TAGS_URL = reverse('reteta:tag-list')
+INGREDIENTS_URL = reverse('reteta:ingredient-list')
+BULK_URL = reverse('reteta:reteta-bulk')
+
+
+class UsageCountTests(TestCase):
+    """Test usage_count follows the retete using a tag/ingredient"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@chris.com',
+            'password123'
+        )
+        self.reteta = sample_reteta(self.user, title='Ciorba')
+        self.other = sample_reteta(self.user, title='Supa')
+        self.vegan = Tag.objects.create(user=self.user, name='Vegan')
+        self.soup = Tag.objects.create(user=self.user, name='Soup')
+        self.onion = Ingredient.objects.create(user=self.user, name='Onion')
+
+    def counts(self, *objects):
+        for obj in objects:
+            obj.refresh_from_db()
+        return [obj.usage_count for obj in objects]
+
+    def test_add_remove_clear(self):
+        """Test adding, removing and clearing from the reteta side"""
+        self.reteta.tags.add(self.vegan, self.soup)
+        self.other.tags.add(self.vegan)
+        self.assertEqual(self.counts(self.vegan, self.soup), [2, 1])
+
+        # adding again and removing what is not linked change nothing
+        self.reteta.tags.add(self.vegan)
+        self.other.tags.remove(self.vegan, self.soup)
+        self.assertEqual(self.counts(self.vegan, self.soup), [1, 1])
+
+        self.reteta.tags.clear()
+        self.assertEqual(self.counts(self.vegan, self.soup), [0, 0])
+
+    def test_reverse_side(self):
+        """Test changes from the tag side"""
+        self.onion.reteta_set.add(self.reteta, self.other)
+        self.assertEqual(self.counts(self.onion), [2])
+
+        self.onion.reteta_set.remove(self.reteta, self.reteta)
+        self.assertEqual(self.counts(self.onion), [1])
+
+        self.onion.reteta_set.clear()
+        self.assertEqual(self.counts(self.onion), [0])
+
+    def test_set(self):
+        """Test set() counts the links it really replaces"""
+        self.reteta.tags.set([self.vegan])
+        self.reteta.tags.set([self.soup, self.vegan])
+        self.reteta.tags.set([self.soup])
+
+        self.assertEqual(self.counts(self.vegan, self.soup), [0, 1])
+
+    def test_reteta_deleted(self):
+        """Test deleting a reteta counts it out"""
+        self.reteta.tags.add(self.vegan)
+        self.reteta.ingredients.add(self.onion)
+        self.other.tags.add(self.vegan)
+
+        self.reteta.delete()
+
+        self.assertEqual(self.counts(self.vegan, self.onion), [1, 0])
+
+    def test_rename_keeps_count(self):
+        """Test saving a tag loaded before it was used keeps its count"""
+        self.reteta.tags.add(self.vegan)
+        self.assertEqual(self.vegan.usage_count, 0)
+
+        self.vegan.name = 'Vegetarian'
+        self.vegan.save()
+        self.assertEqual(self.counts(self.vegan), [1])
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        res = client.delete(
+            reverse('reteta:reteta-detail', args=[self.reteta.id])
+        )
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.counts(self.vegan), [0])
+
+    def test_count_not_below_zero(self):
+        """Test a count already off does not fail the writes"""
+        self.reteta.tags.add(self.vegan, self.soup)
+        Tag.objects.update(usage_count=0)
+
+        self.reteta.tags.remove(self.soup)
+        self.reteta.delete()
+
+        self.assertEqual(self.counts(self.vegan, self.soup), [0, 0])
+
+    def test_bulk(self):
+        """Test the bulk action counts the links it replaces"""
+        self.reteta.tags.add(self.vegan)
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        client.post(BULK_URL, [
+            {'id': self.reteta.id, 'title': 'Ciorba', 'time_minutes': 10,
+             'price': '5.00', 'tags': [self.soup.id]},
+            {'title': 'Salata', 'time_minutes': 5, 'price': '2.00',
+             'tags': [self.soup.id, 'Quick']},
+        ], format='json')
+
+        quick = Tag.objects.get(name='Quick')
+        self.assertEqual(self.counts(self.vegan, self.soup, quick),
+                         [0, 2, 1])
+
+
+class UsageCountApiTests(TestCase):
+    """Test filtering and ordering the tags on usage_count"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@chris.com',
+            'password123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        retete = [sample_reteta(self.user, title='R%d' % i)
+                  for i in range(3)]
+        self.tags = {}
+        for name, count in (('Vegan', 3), ('Soup', 1), ('Quick', 0),
+                            ('Dinner', 2)):
+            tag = Tag.objects.create(user=self.user, name=name)
+            tag.reteta_set.add(*retete[:count])
+            self.tags[name] = tag
+
+    def names(self, url=TAGS_URL, **params):
+        res = self.client.get(url, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [tag['name'] for tag in res.data['results']]
+
+    def test_ordering(self):
+        """Test ?ordering= on the usage count and the name"""
+        self.assertEqual(self.names(ordering='-usage_count'),
+                         ['Vegan', 'Dinner', 'Soup', 'Quick'])
+        self.assertEqual(self.names(ordering='usage_count'),
+                         ['Quick', 'Soup', 'Dinner', 'Vegan'])
+        self.assertEqual(self.names(ordering='name'),
+                         ['Dinner', 'Quick', 'Soup', 'Vegan'])
+        self.assertEqual(self.names(), ['Vegan', 'Soup', 'Quick', 'Dinner'])
+
+    def test_ordering_pages(self):
+        """Test the pages follow the usage count ordering"""
+        res = self.client.get(
+            TAGS_URL, {'ordering': '-usage_count', 'page_size': 3}
+        )
+        res = self.client.get(res.data['next'])
+
+        self.assertEqual([tag['name'] for tag in res.data['results']],
+                         ['Quick'])
+
+    def test_min_usage(self):
+        """Test ?min_usage= and ?assigned_only=1"""
+        self.assertEqual(self.names(min_usage=2), ['Vegan', 'Dinner'])
+        self.assertEqual(self.names(assigned_only=1),
+                         ['Vegan', 'Soup', 'Dinner'])
+
+    def test_usage_count_field(self):
+        """Test usage_count is sent when asked for"""
+        res = self.client.get(TAGS_URL, {
+            'fields': 'name,usage_count',
+            'ordering': '-usage_count',
+        })
+
+        self.assertEqual(res.data['results'][0],
+                         {'name': 'Vegan', 'usage_count': 3})
+        self.assertNotIn('usage_count',
+                         self.client.get(TAGS_URL).data['results'][0])
+
+    def test_invalid_params(self):
+        """Test unknown orderings and non integer counts are rejected"""
+        for params in ({'ordering': 'user'}, {'min_usage': 'many'}):
+            res = self.client.get(INGREDIENTS_URL, params)
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -12,5 +12,6 @@ router.register('retete', views.RetetaViewSet)
 app_name = 'reteta'
 
 urlpatterns = [
+    path('sync/', views.SyncView.as_view(), name='sync'),
     path('', include(router.urls))
 ]
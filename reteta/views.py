@@ -1,72 +1,244 @@
+import json
+
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
 from rest_framework import viewsets, mixins, status
-from rest_framework.authentication import TokenAuthentication
-from rest_framework.permissions import IsAuthenticated
-from accounts.models import Tag, Ingredient, Reteta
-from . import serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAuthenticated, SAFE_METHODS
+from rest_framework.views import APIView
+from accounts.models import ChangeLog, Tag, Ingredient, Reteta
+from setari.replicas import ReplicaReadMixin
+from user.authentication import CachedTokenAuthentication
+from . import (
+    changelog, filters, images, search, serializers, signals, similarity
+)
+from .bulk import bulk_upsert_retete, get_or_create_named
+from .cache import CachedListMixin, ConditionalGetMixin
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class SparseFieldsMixin:
+    """Pass ?fields= and ?expand= of read requests to the serializer
+
+    See serializers.DynamicFieldsMixin.
+    """
+
+    def requested_fields(self, param):
+        """Return the names listed in `param`, None when absent"""
+        value = self.request.query_params.get(param)
+        if value is None or self.request.method not in SAFE_METHODS:
+            return None
+        return [name.strip() for name in value.split(',') if name.strip()]
+
+    def sparse_fields(self):
+        """Return the serializer kwargs of the requested fields"""
+        if not issubclass(self.get_serializer_class(),
+                          serializers.DynamicFieldsMixin):
+            return {}
+        return {
+            'fields': self.requested_fields('fields'),
+            'expand': self.requested_fields('expand'),
+        }
+
+    def get_serializer(self, *args, **kwargs):
+        for name, value in self.sparse_fields().items():
+            kwargs.setdefault(name, value)
+        return super().get_serializer(*args, **kwargs)
+
+
+class WriteBatchMixin:
+    """Write the derived data of the objects changed by a request once
+
+    The write requests run in signals.batch(): the summary, search entry
+    and change log entry of each object are written at the end.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method in SAFE_METHODS:
+            return super().dispatch(request, *args, **kwargs)
+        with signals.batch():
+            return super().dispatch(request, *args, **kwargs)
+
+
+class BulkNameCreateMixin:
+    """Create many tags/ingredients from a list body, by name
+
+    POST [{"name": ...}, ...] returns the row of every name in the order
+    of the body, `created` or existing in any letter case, in one
+    round-trip. A single object is created as before.
+    """
+    # largest list accepted, the names are matched in one query
+    bulk_max_items = 500
+
+    def create(self, request, *args, **kwargs):
+        if not isinstance(request.data, list):
+            return super().create(request, *args, **kwargs)
+        if len(request.data) > self.bulk_max_items:
+            return Response(
+                {'non_field_errors': [
+                    'Ensure this list has no more than %d items.'
+                    % self.bulk_max_items
+                ]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        serializer = serializers.NameBulkItemSerializer(
+            data=request.data, many=True
+        )
+        serializer.is_valid(raise_exception=True)
+        names = [item['name'] for item in serializer.validated_data]
+
+        with transaction.atomic():
+            rows, created = get_or_create_named(
+                self.queryset.model, request.user, names
+            )
+        data = []
+        for name in names:
+            row = rows[name]
+            data.append({'id': row.id, 'name': row.name,
+                         'created': row.id in created})
+        return Response(
+            data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
+
+
+class UsageCountMixin:
+    """Filter and order tags/ingredients on their usage_count
 
+    ?assigned_only=1 keeps the ones used by a reteta, ?min_usage=n the
+    ones used by n retete or more, ?ordering= is one of `orderings`.
+    """
+    ordering = ('-name', 'id')
+    # ?ordering= -> the ordering, ending with the unique id for the
+    # keyset pagination
+    orderings = {
+        'name': ('name', 'id'),
+        '-name': ('-name', 'id'),
+        'usage_count': ('usage_count', '-id'),
+        '-usage_count': ('-usage_count', 'id'),
+    }
 
-class TagViewSet(viewsets.GenericViewSet,
+    def get_ordering(self):
+        value = self.request.query_params.get('ordering')
+        if value is None:
+            return self.ordering
+        if value not in self.orderings:
+            raise ValidationError({'ordering': [
+                'Expected one of: %s.' % ', '.join(self.orderings)
+            ]})
+        return self.orderings[value]
+
+    def get_min_usage(self):
+        value = self.request.query_params.get('min_usage')
+        try:
+            min_usage = int(value) if value is not None else 0
+        except ValueError:
+            raise ValidationError({'min_usage': ['Expected an integer.']})
+        if bool(int(self.request.query_params.get('assigned_only', 0))):
+            min_usage = max(min_usage, 1)
+        return min_usage
+
+    def get_queryset(self):
+        """Return objects for the current authenticated user only"""
+        queryset = self.queryset.filter(user=self.request.user)
+        min_usage = self.get_min_usage()
+        if min_usage > 0:
+            queryset = queryset.filter(usage_count__gte=min_usage)
+
+        ordering = self.get_ordering()
+        # the columns of the (user, name) index, unless asked for more
+        columns = {'id', 'name'} | {name.lstrip('-') for name in ordering}
+        if 'usage_count' in (self.requested_fields('fields') or ()):
+            columns.add('usage_count')
+        return queryset.only(*columns).order_by(*ordering)
+
+
+class TagViewSet(ReplicaReadMixin,
+                 WriteBatchMixin,
+                 SparseFieldsMixin,
+                 CachedListMixin,
+                 BulkNameCreateMixin,
+                 UsageCountMixin,
+                 viewsets.GenericViewSet,
                  mixins.ListModelMixin,
                  mixins.CreateModelMixin):
     """"Manage tags in the database"""
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     queryset = Tag.objects.all()
     serializer_class = serializers.TagSerializer
 
-    def get_queryset(self):
-        """Return objects for the current authenticated user only"""
-        assigned_only = bool(
-            int(self.request.query_params.get('assigned_only', 0))
-        )
-        queryset = self.queryset
-        if assigned_only:
-            queryset = queryset.filter(reteta__isnull=False).distinct()
-
-        return queryset.filter(
-            user=self.request.user
-        ).order_by('-name').distinct()
-
     def perform_create(self, serializer):
         """Create a new tag"""
         serializer.save(user=self.request.user)
 
 
-class IngredientViewSet(viewsets.GenericViewSet,
+class IngredientViewSet(ReplicaReadMixin,
+                        WriteBatchMixin,
+                        SparseFieldsMixin,
+                        CachedListMixin,
+                        BulkNameCreateMixin,
+                        UsageCountMixin,
+                        viewsets.GenericViewSet,
                         mixins.ListModelMixin,
                         mixins.CreateModelMixin):
     """"Manage ingredients in the database"""
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     queryset = Ingredient.objects.all()
     serializer_class = serializers.IngredientSerializer
 
-    def get_queryset(self):
-        """Return objects for the current authenticated user only"""
-        assigned_only = bool(
-            int(self.request.query_params.get('assigned_only', 0))
-        )
-        queryset = self.queryset
-        if assigned_only:
-            queryset = queryset.filter(reteta__isnull=False).distinct()
-
-        return queryset.filter(
-            user=self.request.user
-        ).order_by('-name').distinct()
-
     def perform_create(self, serializer):
         """Create a new ingredient"""
         serializer.save(user=self.request.user)
 
 
-class RetetaViewSet(viewsets.ModelViewSet):
+class RetetaViewSet(ReplicaReadMixin,
+                    WriteBatchMixin,
+                    SparseFieldsMixin,
+                    ConditionalGetMixin,
+                    viewsets.ModelViewSet):
     """"Manage retete in the database"""
     serializer_class = serializers.RetetaSerializer
     queryset = Reteta.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    ordering = ('-id',)
+    # retete serialized per round-trip by the export action
+    export_chunk_size = 500
+    # largest list accepted by the bulk action, and rows per INSERT
+    bulk_max_items = 5000
+    bulk_batch_size = 500
+    # retete listed by the similar action by default and at most
+    similar_limit = 10
+    similar_max_limit = 50
+    # largest ?pantry= list, its IDs are sent twice in the query
+    pantry_max_items = 400
+    # ?param= -> (column, lookup) of the range filters
+    range_filters = {
+        'max_time': ('time_minutes', 'lte'),
+        'min_price': ('price', 'gte'),
+        'max_price': ('price', 'lte'),
+    }
+    # ?ordering= -> the ordering, ending with the unique id for the
+    # keyset pagination and following a (user, key, id) index both ways
+    orderings = {
+        'time_minutes': ('time_minutes', 'id'),
+        '-time_minutes': ('-time_minutes', '-id'),
+        'price': ('price', 'id'),
+        '-price': ('-price', '-id'),
+        'title': ('title', 'id'),
+        '-title': ('-title', '-id'),
+    }
+    # model columns the serializer fields that are not columns read
+    field_columns = {
+        'thumbnail': ('image', 'image_status'),
+        'image_variants': ('image', 'image_status'),
+        'has_image': ('image',),
+    }
 
     def _params_to_ints(self, qs):
         """"Convert a list of string IDs to a list of integers"""
@@ -78,21 +250,154 @@ class RetetaViewSet(viewsets.ModelViewSet):
         # ####### This is for filtering #################
         tags = self.request.query_params.get('tags')
         ingredients = self.request.query_params.get('ingredients')
+        # match=any (default) or match=all of the given IDs
+        match = self.request.query_params.get('match', filters.MATCH_ANY)
         queryset = self.queryset
         if tags:
             tag_ids = self._params_to_ints(tags)
-            # return all the tags that are IN this list we provide
-            queryset = queryset.filter(tags__id__in=tag_ids)
+            # return the retete having any/all the tags of this list
+            queryset = filters.filter_related(
+                queryset, 'tags', tag_ids, match
+            )
         if ingredients:
             ingredient_ids = self._params_to_ints(ingredients)
-            # return all the ingredients that are IN this list we provide
-            queryset = queryset.filter(ingredients__id__in=ingredient_ids)
+            # same for the ingredients
+            queryset = filters.filter_related(
+                queryset, 'ingredients', ingredient_ids, match
+            )
+        pantry = self.get_pantry()
+        if pantry is not None:
+            # the retete cooked with what is in the pantry, or missing
+            # at most max_missing ingredients
+            queryset = filters.filter_pantry(queryset, *pantry)
+        queryset = self.filter_ranges(queryset)
+        query = self.request.query_params.get('search')
+        if query:
+            # ranked full-text search, see reteta.search
+            queryset = search.search(queryset, query)
         # ################# End Filtering ################
-        return queryset.filter(user=self.request.user).order_by('-id')
+        queryset = self._plan_queryset(queryset)
+        return queryset.filter(
+            user=self.request.user
+        ).order_by(*self.get_ordering())
+
+    def get_ordering(self):
+        """Order search results by rank, everything else newest first
+
+        Pantry results come fewest missing ingredients first, ?ordering=
+        (one of `orderings`) replaces all of it.
+        """
+        value = self.request.query_params.get('ordering')
+        if value is not None:
+            if value not in self.orderings:
+                raise ValidationError({'ordering': [
+                    'Expected one of: %s.' % ', '.join(self.orderings)
+                ]})
+            return self.orderings[value]
+        ordering = self.ordering
+        if self.request.query_params.get('search'):
+            ordering = ('search_rank',) + ordering
+        if self.request.query_params.get('pantry'):
+            ordering = ('missing_count',) + ordering
+        return ordering
+
+    def filter_ranges(self, queryset):
+        """Apply the `range_filters` given, validated like the columns"""
+        fields = None
+        for param, (name, lookup) in self.range_filters.items():
+            value = self.request.query_params.get(param)
+            if not value:
+                continue
+            if fields is None:
+                fields = serializers.RetetaSerializer().fields
+            try:
+                value = fields[name].run_validation(value)
+            except ValidationError as exc:
+                raise ValidationError({param: exc.detail})
+            queryset = queryset.filter(**{name + '__' + lookup: value})
+        return queryset
+
+    def requested_fields(self, param):
+        """Add missing_count to the default fields of a ?pantry= read"""
+        names = super().requested_fields(param)
+        if param != 'fields' or names is not None \
+                or self.request.method not in SAFE_METHODS \
+                or not self.request.query_params.get('pantry'):
+            return names
+        meta = self.get_serializer_class().Meta
+        if 'missing_count' not in meta.fields:
+            return None
+        optional = getattr(meta, 'optional_fields', ())
+        return [name for name in meta.fields
+                if name not in optional or name == 'missing_count']
+
+    def get_pantry(self):
+        """Return the (ingredient IDs, max_missing) of ?pantry=, or None"""
+        pantry = self.request.query_params.get('pantry')
+        if not pantry:
+            return None
+        try:
+            ids = self._params_to_ints(pantry)
+        except ValueError:
+            raise ValidationError({'pantry': ['Expected ingredient IDs.']})
+        if len(ids) > self.pantry_max_items:
+            raise ValidationError({'pantry': [
+                'Ensure this list has no more than %d items.'
+                % self.pantry_max_items
+            ]})
+        try:
+            max_missing = int(
+                self.request.query_params.get('max_missing', 0)
+            )
+        except ValueError:
+            max_missing = -1
+        if max_missing < 0:
+            raise ValidationError(
+                {'max_missing': ['Expected a positive integer.']}
+            )
+        return ids, max_missing
+
+    def _plan_queryset(self, queryset):
+        """Load only what the serializer of the current action reads
+
+        The columns and relations follow ?fields= and ?expand=, a list of
+        IDs and titles is a single query without joins.
+        """
+        if self.action not in ('list', 'retrieve', 'export', 'similar'):
+            return queryset
+        serializer_class = self.get_serializer_class()
+        names = self.requested_fields('fields')
+        if names is None:
+            names = set(serializer_class.Meta.fields) - set(
+                serializer_class.Meta.optional_fields
+            )
+        expand = self.requested_fields('expand') or ()
+
+        columns = {'id'} | {
+            name.lstrip('-') for name in self.get_ordering()
+        }
+        for name in names:
+            columns.update(self.field_columns.get(name, (name,)))
+        concrete = {field.name for field in Reteta._meta.concrete_fields}
+        queryset = queryset.only(*(columns & concrete))
+
+        for name, model in (('ingredients', Ingredient), ('tags', Tag)):
+            if name not in names:
+                continue
+            if name in expand or serializer_class is not \
+                    serializers.RetetaSerializer:
+                # nested objects
+                queryset = queryset.prefetch_related(name)
+            else:
+                # the serializer only reads the primary keys
+                queryset = queryset.prefetch_related(
+                    Prefetch(name, queryset=model.objects.only('id'))
+                )
+        return queryset
 
     def get_serializer_class(self):
         """Return appropriate serializer class"""
-        if self.action == 'retrieve':
+        if self.action in ('retrieve', 'export'):
             return serializers.RetetaDetailSerializer
         elif self.action == 'upload_image':
             return serializers.RetetaImageSerializer
@@ -111,7 +416,9 @@ class RetetaViewSet(viewsets.ModelViewSet):
             data=request.data
         )
         if serializer.is_valid():
-            serializer.save()
+            # variants are generated in the background, see reteta.images
+            reteta = serializer.save(image_status=Reteta.IMAGE_PENDING)
+            images.schedule(reteta)
             return Response(
                 serializer.data,
                 status=status.HTTP_200_OK
@@ -120,3 +427,140 @@ class RetetaViewSet(viewsets.ModelViewSet):
             serializer.errors,
             status=status.HTTP_400_BAD_REQUEST
         )
+
+    @action(methods=['GET'], detail=False)
+    def export(self, request):
+        """Stream all retete of the user as newline delimited JSON"""
+        # chunks are read in '-id' keyset order, search rank included
+        response = StreamingHttpResponse(
+            self._export_lines(self.get_queryset().order_by('-id')),
+            content_type='application/x-ndjson'
+        )
+        response['Content-Disposition'] = \
+            'attachment; filename="retete.ndjson"'
+        return response
+
+    def _export_lines(self, queryset):
+        """Yield one JSON line per reteta, reading them in chunks"""
+        # QuerySet.iterator() ignores prefetch_related, so walk the -id
+        # ordering in keyset chunks and prefetch the M2M rows per chunk
+        serializer_class = self.get_serializer_class()
+        last_id = None
+        while True:
+            chunk = queryset
+            if last_id is not None:
+                chunk = chunk.filter(id__lt=last_id)
+            chunk = list(chunk[:self.export_chunk_size])
+            if not chunk:
+                return
+            data = serializer_class(
+                chunk, many=True, context=self.get_serializer_context(),
+                **self.sparse_fields()
+            ).data
+            for item in data:
+                yield json.dumps(item, cls=JSONEncoder) + '\n'
+            last_id = chunk[-1].id
+
+    @action(methods=['GET'], detail=True)
+    def similar(self, request, pk=None):
+        """List the retete sharing the most tags and ingredients
+
+        Best first, with their Jaccard index as `similarity`, from the
+        index of reteta.similarity.
+        """
+        reteta = self.get_object()
+        matches = similarity.similar(
+            request.user, reteta.pk, self.get_similar_limit()
+        )
+        retete = self.get_queryset().in_bulk([pk for pk, score in matches])
+        matches = [(retete[pk], score) for pk, score in matches
+                   if pk in retete]
+        data = self.get_serializer(
+            [obj for obj, score in matches], many=True
+        ).data
+        for item, (obj, score) in zip(data, matches):
+            item['similarity'] = round(score, 4)
+        return Response(data)
+
+    def get_similar_limit(self):
+        value = self.request.query_params.get('limit')
+        try:
+            limit = int(value) if value is not None else self.similar_limit
+        except ValueError:
+            limit = None
+        if limit is None or not 1 <= limit <= self.similar_max_limit:
+            raise ValidationError({'limit': [
+                'Expected an integer between 1 and %d.'
+                % self.similar_max_limit
+            ]})
+        return limit
+
+    @action(methods=['POST'], detail=False)
+    def bulk(self, request):
+        """Create or update many retete in one request"""
+        items = request.data
+        if not isinstance(items, list):
+            return Response(
+                {'non_field_errors': ['Expected a list of items.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(items) > self.bulk_max_items:
+            return Response(
+                {'non_field_errors': [
+                    'Ensure this list has no more than %d items.'
+                    % self.bulk_max_items
+                ]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        report = bulk_upsert_retete(
+            request.user, items, batch_size=self.bulk_batch_size
+        )
+        return Response(report, status=status.HTTP_200_OK)
+
+
+class SyncView(APIView):
+    """Send the retete, tags and ingredients changed since a checkpoint
+
+    GET ?since=<checkpoint> returns the changed objects, the IDs of the
+    deleted ones and the next checkpoint. Without `since` everything is
+    sent. While `more` is true the client asks again right away.
+    """
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    # (response key, model, serializer, queryset of the changed objects)
+    sections = (
+        ('retete', ChangeLog.RETETA, serializers.RetetaSerializer,
+         Reteta.objects.prefetch_related(
+             Prefetch('ingredients', queryset=Ingredient.objects.only('id')),
+             Prefetch('tags', queryset=Tag.objects.only('id')),
+         )),
+        ('tags', ChangeLog.TAG, serializers.TagSerializer,
+         Tag.objects.only('id', 'name')),
+        ('ingredients', ChangeLog.INGREDIENT,
+         serializers.IngredientSerializer,
+         Ingredient.objects.only('id', 'name')),
+    )
+
+    def get(self, request):
+        since = changelog.decode_token(request.query_params.get('since'))
+        entries, checkpoint, more = changelog.changes(request.user, since)
+
+        data = {
+            'checkpoint': changelog.encode_token(checkpoint),
+            'more': more,
+            'deleted': {},
+        }
+        for key, model, serializer_class, queryset in self.sections:
+            changed = [entry.object_id for entry in entries
+                       if entry.model == model and not entry.deleted]
+            objects = queryset.filter(
+                user=request.user, id__in=changed
+            ).order_by('id') if changed else []
+            data[key] = serializer_class(
+                objects, many=True, context={'request': request}
+            ).data
+            data['deleted'][key] = [
+                entry.object_id for entry in entries
+                if entry.model == model and entry.deleted
+            ]
+        return Response(data)
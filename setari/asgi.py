@@ -0,0 +1,23 @@
+"""
+ASGI config for setari project.
+
+It exposes the ASGI callable as a module-level variable named ``application``,
+served for example with ``uvicorn setari.asgi:application``.
+
+Django 2.2 has no ASGI support, the WSGI application is adapted by
+setari.asgi_adapter: connections are handled by the event loop, views run in
+a pool of settings.ASGI_WORKERS threads.
+"""
+
+import os
+
+from django.conf import settings
+from django.core.wsgi import get_wsgi_application
+
+from setari.asgi_adapter import ASGIAdapter
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'setari.settings')
+
+application = ASGIAdapter(
+    get_wsgi_application(), workers=settings.ASGI_WORKERS
+)
@@ -0,0 +1,172 @@
+import asyncio
+import itertools
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# request bodies larger than this are spooled to disk
+SPOOL_SIZE = 1024 * 1024
+# streamed chunks buffered ahead of a slow client
+STREAM_BUFFER = 8
+
+
+class ASGIAdapter:
+    """Serve a WSGI application over ASGI
+
+    Django 2.2 has no ASGI handler nor async views, so the connection is
+    handled on the event loop and only the Django handler runs in a
+    bounded pool of `workers` threads:
+
+    - the request body is received on the loop before a thread is taken,
+      slow uploads do not hold one
+    - non streaming responses are rendered in the thread, which is then
+      released, and sent by the loop, slow readers do not hold one
+    - streaming responses are generated in one thread, their database
+      access stays on its connection, and handed to the loop through a
+      small queue; the thread only waits when the client falls behind
+
+    Keep-alive connections waiting for their next request cost no thread.
+    Every thread keeps its own database connection, closed after the
+    requests as usual (request_started/request_finished).
+    """
+
+    def __init__(self, application, workers=None):
+        self.application = application
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='asgi'
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+        else:
+            raise ValueError('Unsupported ASGI scope %r' % scope['type'])
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def http(self, scope, receive, send):
+        body = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+        try:
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                body.write(message.get('body', b''))
+                if not message.get('more_body', False):
+                    break
+            body.seek(0)
+
+            loop = asyncio.get_event_loop()
+            queue = asyncio.Queue(STREAM_BUFFER)
+            closed = threading.Event()
+            worker = loop.run_in_executor(
+                self.executor, self.run,
+                loop, queue, closed, environ(scope, body)
+            )
+            message = True
+            try:
+                while message is not None:
+                    message = await queue.get()
+                    if message is not None:
+                        await send(message)
+            finally:
+                # after a failed send the worker must not wait for room
+                # in the queue
+                closed.set()
+                while message is not None:
+                    message = await queue.get()
+            await worker
+        finally:
+            body.close()
+
+    def run(self, loop, queue, closed, environ):
+        """Call the WSGI application in a worker thread
+
+        The messages to send are put on `queue`, then None. A non
+        streaming body is rendered here, then the thread is released. A
+        streaming one is generated here, waiting for room in the queue as
+        the client reads it, until `closed` is set.
+        """
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [
+                (name.lower().encode('latin-1'), value.encode('latin-1'))
+                for name, value in headers
+            ]
+            return chunks.append
+
+        def put(message):
+            if closed.is_set():
+                raise ConnectionError('Client disconnected')
+            asyncio.run_coroutine_threadsafe(
+                queue.put(message), loop
+            ).result()
+
+        started = {}
+        chunks = []
+        result = None
+        try:
+            result = self.application(environ, start_response)
+            put({'type': 'http.response.start',
+                 'status': started['status'],
+                 'headers': started['headers']})
+            if getattr(result, 'streaming', False):
+                for chunk in itertools.chain(chunks, result):
+                    if chunk:
+                        put({'type': 'http.response.body', 'body': chunk,
+                             'more_body': True})
+                put({'type': 'http.response.body', 'body': b''})
+            else:
+                chunks.extend(result)
+                put({'type': 'http.response.body',
+                     'body': b''.join(chunks)})
+        finally:
+            if hasattr(result, 'close'):
+                # sends request_finished, closing the database connection
+                result.close()
+            asyncio.run_coroutine_threadsafe(queue.put(None), loop)
+
+
+def environ(scope, body):
+    """Build the WSGI environ of an ASGI HTTP scope"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    result = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        # WSGI strings are the latin-1 decoding of the raw bytes
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1]),
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        value = value.decode('latin-1')
+        if name in result:
+            value = result[name] + ',' + value
+        result[name] = value
+    return result
@@ -0,0 +1,116 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (
+    FileResponse, Http404, HttpResponse, HttpResponseNotModified,
+    StreamingHttpResponse
+)
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+# bytes read per write to the client
+CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class MediaFileResponse(FileResponse):
+    block_size = CHUNK_SIZE
+
+
+def serve(request, path):
+    """Serve a file of MEDIA_ROOT, or a byte range of it
+
+    With settings.MEDIA_ACCEL_REDIRECT the response is an empty
+    X-Accel-Redirect to the internal location of the front server, which
+    sends the file with sendfile() and answers the Range requests.
+    Otherwise the file is streamed in CHUNK_SIZE blocks, through the
+    wsgi.file_wrapper of the server when it has one.
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('"%s" does not exist' % path)
+    if not os.path.isfile(full_path):
+        raise Http404('"%s" does not exist' % path)
+
+    stat = os.stat(full_path)
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'),
+                              stat.st_mtime, stat.st_size):
+        return HttpResponseNotModified()
+    content_type = mimetypes.guess_type(full_path)[0] or \
+        'application/octet-stream'
+
+    accel = getattr(settings, 'MEDIA_ACCEL_REDIRECT', None)
+    if accel:
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = accel + quote(path)
+    else:
+        response = _file_response(request, full_path, stat.st_size,
+                                  content_type)
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def _file_response(request, full_path, size, content_type):
+    byte_range = request.META.get('HTTP_RANGE')
+    if byte_range is not None:
+        byte_range = _parse_range(byte_range, size)
+    if byte_range is None:
+        return MediaFileResponse(open(full_path, 'rb'),
+                                 content_type=content_type)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */%d' % size
+        return response
+
+    start, end = byte_range
+    f = open(full_path, 'rb')
+    f.seek(start)
+    response = StreamingHttpResponse(
+        _read(f, end - start + 1), status=206, content_type=content_type
+    )
+    response['Content-Length'] = str(end - start + 1)
+    response['Content-Range'] = 'bytes %d-%d/%d' % (start, end, size)
+    return response
+
+
+def _parse_range(header, size):
+    """Return (first, last) byte of a single range, False if unsatisfiable
+
+    None for what is ignored, such as many ranges: the whole file is
+    sent then.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # the last N bytes
+        length = int(last)
+        if not length:
+            return False
+        return max(size - length, 0), size - 1
+    first = int(first)
+    last = min(int(last), size - 1) if last else size - 1
+    if first > last:
+        return False
+    return first, last
+
+
+def _read(f, length):
+    with f:
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                return
+            length -= len(chunk)
+            yield chunk
@@ -0,0 +1,245 @@
+import cProfile
+import os
+import random
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.permissions import IsAdminUser
+from rest_framework.serializers import BaseSerializer
+from rest_framework.views import APIView
+
+from user.authentication import CachedTokenAuthentication
+
+TIME_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# name, help, buckets
+METRICS = (
+    ('http_request_duration_seconds',
+     'Wall time of the requests', TIME_BUCKETS),
+    ('http_request_db_queries',
+     'SQL queries run by a request', COUNT_BUCKETS),
+    ('http_request_db_duration_seconds',
+     'Time a request spent running SQL', TIME_BUCKETS),
+    ('http_request_serializer_duration_seconds',
+     'Time a request spent in serializer.data', TIME_BUCKETS),
+    ('http_response_size_bytes',
+     'Size of the (non streaming) response bodies', SIZE_BUCKETS),
+)
+
+
+def _setting(name, default):
+    return getattr(settings, 'PROFILING', {}).get(name, default)
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observed values"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Thread safe histograms of METRICS labeled by view and method"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def observe(self, name, labels, value):
+        buckets = next(b for metric, h, b in METRICS if metric == name)
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def render(self):
+        """Return the histograms in the Prometheus text format"""
+        lines = []
+        with self._lock:
+            for name, description, buckets in METRICS:
+                lines.append('# HELP %s %s' % (name, description))
+                lines.append('# TYPE %s histogram' % name)
+                for (metric, labels), histogram in sorted(
+                        self._histograms.items()):
+                    if metric != name:
+                        continue
+                    for bound, count in zip(buckets, histogram.counts):
+                        lines.append('%s_bucket%s %d' % (
+                            name, _labels(labels, le=_number(bound)), count
+                        ))
+                    lines.append('%s_bucket%s %d' % (
+                        name, _labels(labels, le='+Inf'), histogram.count
+                    ))
+                    lines.append('%s_sum%s %s' % (
+                        name, _labels(labels), _number(histogram.sum)
+                    ))
+                    lines.append('%s_count%s %d' % (
+                        name, _labels(labels), histogram.count
+                    ))
+        return '\n'.join(lines) + '\n'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _labels(labels, **extra):
+    pairs = list(labels) + sorted(extra.items())
+    return '{%s}' % ','.join(
+        '%s="%s"' % (name, str(value).replace('\\', r'\\')
+                     .replace('"', r'\"').replace('\n', r'\n'))
+        for name, value in pairs
+    )
+
+
+registry = Registry()
+
+_local = threading.local()
+
+
+class RequestStats:
+    """What a sampled request spent, filled in while it runs"""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0
+        self.serializer_time = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper() hook
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+
+
+def _timed_data(data):
+    def wrapper(serializer):
+        stats = getattr(_local, 'stats', None)
+        if stats is None:
+            return data.fget(serializer)
+        start = time.perf_counter()
+        try:
+            return data.fget(serializer)
+        finally:
+            stats.serializer_time += time.perf_counter() - start
+    wrapper._profiled = True
+    return property(wrapper)
+
+
+def _instrument_serializers():
+    # Serializer.data and ListSerializer.data both end in
+    # BaseSerializer.data, which runs to_representation()
+    if not getattr(BaseSerializer.data.fget, '_profiled', False):
+        BaseSerializer.data = _timed_data(BaseSerializer.data)
+
+
+class ProfilingMiddleware:
+    """Record where the time of a sample of the requests goes
+
+    Opt-in with PROFILING['ENABLED']. A PROFILING['SAMPLE_RATE'] share of
+    the requests records its wall time, SQL count and time, serializer
+    time and response size in `registry`, labeled by view name. With
+    PROFILING['PROFILE_DIR'] these requests also run under cProfile and
+    the ones slower than PROFILING['SLOW_REQUEST_MS'] are dumped there.
+
+    Streamed bodies are generated after the middleware returns, their
+    SQL and serialization are not recorded.
+    """
+
+    def __init__(self, get_response):
+        if not _setting('ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = _setting('SAMPLE_RATE', 1.0)
+        self.slow = _setting('SLOW_REQUEST_MS', 1000) / 1000
+        self.profile_dir = _setting('PROFILE_DIR', None)
+        if self.profile_dir:
+            os.makedirs(self.profile_dir, exist_ok=True)
+        _instrument_serializers()
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        stats = RequestStats()
+        profiler = cProfile.Profile() if self.profile_dir else None
+        _local.stats = stats
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(stats))
+                if profiler is not None:
+                    profiler.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    if profiler is not None:
+                        profiler.disable()
+        finally:
+            _local.stats = None
+        duration = time.perf_counter() - start
+
+        match = request.resolver_match
+        labels = {
+            'view': match.view_name if match else '<unresolved>',
+            'method': request.method,
+        }
+        registry.observe('http_request_duration_seconds', labels, duration)
+        registry.observe('http_request_db_queries', labels, stats.queries)
+        registry.observe('http_request_db_duration_seconds', labels,
+                         stats.db_time)
+        registry.observe('http_request_serializer_duration_seconds', labels,
+                         stats.serializer_time)
+        if not response.streaming:
+            registry.observe('http_response_size_bytes', labels,
+                             len(response.content))
+
+        if profiler is not None and duration >= self.slow:
+            name = '%d-%s-%s-%dms.prof' % (
+                time.time(), labels['method'],
+                labels['view'].replace(':', '-').strip('<>'),
+                duration * 1000,
+            )
+            profiler.dump_stats(os.path.join(self.profile_dir, name))
+        return response
+
+
+class MetricsView(APIView):
+    """Serve the recorded histograms to staff users"""
+    authentication_classes = (CachedTokenAuthentication,
+                              SessionAuthentication)
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return HttpResponse(
+            registry.render(),
+            content_type='text/plain; version=0.0.4; charset=utf-8'
+        )
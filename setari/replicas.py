@@ -0,0 +1,111 @@
+import random
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import request_started
+from django.db import connections, DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+
+RECENT_WRITE_KEY = 'db:recent-write:%s'
+
+_state = threading.local()
+
+
+def use_replica():
+    """Send the reads of this thread to one of settings.DATABASE_REPLICAS
+
+    The replica is picked once, so the queries of a request (rows and
+    their prefetches) see the same replication lag.
+    """
+    if settings.DATABASE_REPLICAS:
+        _state.alias = random.choice(settings.DATABASE_REPLICAS)
+
+
+def use_primary():
+    """Send the reads of this thread to the primary again"""
+    _state.alias = None
+
+
+def mark_write(user_id):
+    """Read from the primary for a while after a write of `user_id`"""
+    cache.set(RECENT_WRITE_KEY % user_id, True,
+              settings.REPLICA_READ_YOUR_WRITES)
+
+
+def wrote_recently(user_id):
+    return cache.get(RECENT_WRITE_KEY % user_id) is not None
+
+
+class ReplicaRouter:
+    """Route the reads selected by use_replica() to a replica
+
+    Other reads and the writes keep Django's default routing (the
+    database of the related instance, or the primary), except that rows
+    read from a replica are written to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        return getattr(_state, 'alias', None)
+
+    def db_for_write(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None \
+                and instance._state.db in settings.DATABASE_REPLICAS:
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same rows as the primary
+        aliases = {DEFAULT_DB_ALIAS} | set(settings.DATABASE_REPLICAS)
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+
+class ReplicaReadMixin:
+    """Serve the safe `replica_actions` of a viewset from a replica
+
+    Unless the user wrote through the API less than
+    settings.REPLICA_READ_YOUR_WRITES seconds ago, so that their own
+    changes are never missing from what they read next.
+    """
+    replica_actions = ('list', 'retrieve')
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            use_primary()
+
+    def initial(self, request, *args, **kwargs):
+        # authenticates the user, from the primary
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS \
+                and self.action in self.replica_actions \
+                and not wrote_recently(request.user.pk):
+            use_replica()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if request.method not in SAFE_METHODS \
+                and response.status_code < 400 \
+                and request.user.is_authenticated:
+            mark_write(request.user.pk)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+def check_connections(**kwargs):
+    """Close the persistent connections that stopped working
+
+    What CONN_HEALTH_CHECKS does from Django 4.1: the connections kept
+    open by CONN_MAX_AGE are checked when a request starts, so a replica
+    or primary restart does not fail the first query of the request.
+    """
+    for connection in connections.all():
+        if connection.settings_dict.get('CONN_HEALTH_CHECKS') \
+                and connection.connection is not None \
+                and not connection.is_usable():
+            connection.close()
+
+
+request_started.connect(check_connections)
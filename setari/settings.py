@@ -44,6 +44,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first, to time everything below it; unused unless PROFILING['ENABLED']
+    'setari.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -73,6 +75,10 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'setari.wsgi.application'
 
+# Threads running the views when served through setari.asgi, each keeps a
+# database connection
+ASGI_WORKERS = 16
+
 
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
@@ -81,10 +87,104 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # seconds a connection is reused between requests, 0 closes it
+        'CONN_MAX_AGE': 60,
+        # check reused connections when a request starts, see
+        # setari.replicas.check_connections
+        'CONN_HEALTH_CHECKS': True,
+    }
+}
+
+# Read replicas of 'default', aliases of DATABASES the list/retrieve
+# actions of the API read from, e.g.
+#   DATABASES['replica1'] = {..., 'TEST': {'MIRROR': 'default'}}
+#   DATABASE_REPLICAS = ['replica1']
+DATABASE_REPLICAS = []
+# Seconds a user reads from the primary after writing, longer than the
+# replication lag. Tracked in the cache, shared by all processes.
+REPLICA_READ_YOUR_WRITES = 5
+
+DATABASE_ROUTERS = ['setari.replicas.ReplicaRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+# Use a shared backend (memcached, redis) in production so the list
+# cache versions bumped by one process are seen by all of them
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
 
+# Token -> user lookups cached by user.authentication
+AUTH_TOKEN_CACHE = {
+    'MAX_SIZE': 10000,
+    # seconds a process may keep serving a token revoked elsewhere
+    'TTL': 30,
+    # also keep the entries in the default cache above
+    'SHARED': False,
+}
+
+
+# Password hashing, see user.hashing
+# https://docs.djangoproject.com/en/2.2/topics/auth/passwords/
+# The first hasher hashes the new passwords, the hashes of the others
+# (and of older costs) are replaced when their user logs in.
+
+PASSWORD_HASHERS = [
+    'user.hashing.Argon2PasswordHasher',
+    'user.hashing.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+]
+
+PASSWORD_HASHING = {
+    # hashes computed at once per process, the other requests keep
+    # the remaining CPU
+    'WORKERS': 4,
+    # hashes waiting for a worker, past them logins wait TIMEOUT
+    # seconds for a place and then get a 503
+    'QUEUE': 16,
+    'TIMEOUT': 5,
+    'ARGON2': {'time_cost': 2, 'memory_cost': 19456, 'parallelism': 1},
+    # with pip install bcrypt, BCryptSHA256PasswordHasher first
+    'BCRYPT_ROUNDS': 12,
+}
+
+AUTHENTICATION_BACKENDS = ['user.backends.ModelBackend']
+
+# Failed logins (per email and per client IP) after which
+# /api/user/token/ answers 429 for WINDOW seconds, see user.throttling
+LOGIN_RATE_LIMIT = {
+    'EMAIL_FAILURES': 5,
+    'IP_FAILURES': 50,
+    'WINDOW': 900,
+}
+
+# /api/reteta/sync/: change log entries per response, and the age under
+# which an entry may still be preceded by an uncommitted one, see
+# reteta.changelog
+SYNC = {
+    'PAGE_SIZE': 500,
+    'SETTLE_SECONDS': 5,
+}
+
+# /api/reteta/retete/<id>/similar/: one index file per user in
+# INDEX_DIR, memory mapped by the processes and patched from the change
+# log, see reteta.similarity
+SIMILAR = {
+    'INDEX_DIR': os.path.join(BASE_DIR, 'similar'),
+    # indexes a process keeps loaded, and for how many seconds
+    'MAX_USERS': 1000,
+    'TTL': 3600,
+    # changes applied to an index, it is rebuilt past them
+    'PATCH_LIMIT': 500,
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -132,3 +232,32 @@ STATIC_ROOT=os.path.join(os.path.dirname(BASE_DIR), 'static_cdn', 'static_root')
 MEDIA_ROOT=os.path.join(os.path.dirname(BASE_DIR), 'static_cdn', 'media_root')
 # MEDIA_ROOT='/static_cdn/media_root'
 AUTH_USER_MODEL = 'accounts.User'
+# Uploads and variants are written atomically, see reteta.storage
+DEFAULT_FILE_STORAGE = 'reteta.storage.MediaStorage'
+# Threads resizing uploaded images, see reteta.images
+IMAGE_PROCESSING_WORKERS = 2
+# Unused images younger than this are kept, an upload of the same photo
+# may be about to use them
+IMAGE_ORPHAN_GRACE_SECONDS = 3600
+# Prefix of the internal nginx location serving MEDIA_ROOT, e.g.
+# '/protected-media/'; without it the files are streamed by Django
+MEDIA_ACCEL_REDIRECT = None
+
+# Request profiling, see setari.profiling. The histograms are served to
+# staff users at /metrics/
+PROFILING = {
+    'ENABLED': False,
+    # share of the requests that are measured
+    'SAMPLE_RATE': 1.0,
+    # directory for the cProfile dumps of the slow sampled requests,
+    # profiling is off without it
+    'PROFILE_DIR': None,
+    'SLOW_REQUEST_MS': 1000,
+}
+
+REST_FRAMEWORK = {
+    'DEFAULT_PAGINATION_CLASS': 'reteta.pagination.KeysetPagination',
+    # Clients can ask for up to KeysetPagination.max_page_size rows
+    # with ?page_size=
+    'PAGE_SIZE': 50,
+}
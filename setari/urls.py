@@ -13,19 +13,29 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 
 # for uploads
 
 from django.conf import settings
 from django.conf.urls.static import static
 
+from setari import media
+from setari.profiling import MetricsView
+
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/user/', include('user.urls')),
     path('api/reteta/', include('reteta.urls')),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    # uploads, with Range support or through the front server, see
+    # setari.media
+    re_path(r'^%s(?P<path>.+)$' % re.escape(settings.MEDIA_URL.lstrip('/')),
+            media.serve, name='media'),
 ]
 
 if settings.DEBUG:
@@ -33,7 +43,3 @@ if settings.DEBUG:
         settings.STATIC_URL,
         document_root=settings.STATIC_ROOT
         )
-    urlpatterns = urlpatterns + static(
-        settings.MEDIA_URL,
-        document_root=settings.MEDIA_ROOT
-        )
@@ -0,0 +1,126 @@
+import asyncio
+import json
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TransactionTestCase
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from accounts.models import Tag
+from setari.asgi import application
+from setari.asgi_adapter import ASGIAdapter
+
+
+def call(app, scope, chunks=(b'',)):
+    """Run `app` on an HTTP request, return the messages it sent"""
+    scope = dict({
+        'type': 'http', 'method': 'GET', 'path': '/', 'query_string': b'',
+        'headers': [], 'http_version': '1.1',
+        'server': ('testserver', 80), 'client': ('127.0.0.1', 5000),
+    }, **scope)
+    received = [
+        {'type': 'http.request', 'body': chunk,
+         'more_body': i < len(chunks) - 1}
+        for i, chunk in enumerate(chunks)
+    ]
+    sent = []
+
+    async def receive():
+        return received.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    return sent
+
+
+def body(messages):
+    return b''.join(m.get('body', b'') for m in messages[1:])
+
+
+class ASGIAdapterTests(SimpleTestCase):
+    """Test serving a WSGI application over ASGI"""
+
+    def test_environ_and_body(self):
+        """Test the request is translated and its body reassembled"""
+        def echo(environ, start_response):
+            start_response('201 Created', [('Content-Type', 'text/plain')])
+            return [json.dumps({
+                'method': environ['REQUEST_METHOD'],
+                'path': environ['PATH_INFO'],
+                'query': environ['QUERY_STRING'],
+                'type': environ['CONTENT_TYPE'],
+                'accept': environ['HTTP_ACCEPT'],
+                'body': environ['wsgi.input'].read().decode(),
+            }).encode()]
+
+        sent = call(ASGIAdapter(echo), {
+            'method': 'POST', 'path': '/a b/', 'query_string': b'x=1',
+            'headers': [(b'content-type', b'text/plain'),
+                        (b'accept', b'a'), (b'accept', b'b')],
+        }, chunks=(b'one ', b'two'))
+
+        self.assertEqual(sent[0], {
+            'type': 'http.response.start', 'status': 201,
+            'headers': [(b'content-type', b'text/plain')],
+        })
+        self.assertEqual(json.loads(body(sent).decode()), {
+            'method': 'POST', 'path': '/a b/', 'query': 'x=1',
+            'type': 'text/plain', 'accept': 'a,b', 'body': 'one two',
+        })
+
+    def test_streaming(self):
+        """Test streaming responses are sent chunk by chunk"""
+        class Streaming(list):
+            streaming = True
+
+        def stream(environ, start_response):
+            start_response('200 OK', [])
+            return Streaming([b'%d\n' % i for i in range(20)])
+
+        sent = call(ASGIAdapter(stream), {})
+
+        self.assertEqual(len(sent), 22)
+        self.assertTrue(all(m['more_body'] for m in sent[1:-1]))
+        self.assertFalse(sent[-1].get('more_body', False))
+        self.assertEqual(body(sent).splitlines()[-1], b'19')
+
+    def test_lifespan(self):
+        """Test the startup and shutdown are acknowledged"""
+        received = [{'type': 'lifespan.startup'},
+                    {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return received.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        asyncio.run(ASGIAdapter(None)({'type': 'lifespan'}, receive, send))
+
+        self.assertEqual(sent, ['lifespan.startup.complete',
+                                'lifespan.shutdown.complete'])
+
+
+class ASGIApplicationTests(TransactionTestCase):
+    """Test the API served by setari.asgi"""
+
+    def test_list_tags(self):
+        """Test an authenticated list is served by a worker thread"""
+        user = get_user_model().objects.create_user(
+            'test@chris.com',
+            'password123'
+        )
+        token = Token.objects.create(user=user)
+        Tag.objects.create(user=user, name='Vegan')
+
+        sent = call(application, {
+            'path': reverse('reteta:tag-list'),
+            'headers': [(b'authorization', b'Token ' + token.key.encode())],
+        })
+
+        self.assertEqual(sent[0]['status'], 200)
+        results = json.loads(body(sent).decode())['results']
+        self.assertEqual([tag['name'] for tag in results], ['Vegan'])
@@ -0,0 +1,91 @@
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+
+CONTENT = bytes(range(256)) * 1024
+
+
+def media_url(path):
+    return reverse('media', args=[path])
+
+
+class MediaServeTests(TestCase):
+    """Test serving the uploads of MEDIA_ROOT"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        os.makedirs(os.path.join(media_root, 'photos'))
+        with open(os.path.join(media_root, 'photos', 'a.jpg'), 'wb') as f:
+            f.write(CONTENT)
+
+    def test_whole_file(self):
+        """Test a file is streamed with its type and length"""
+        res = self.client.get(media_url('photos/a.jpg'))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'image/jpeg')
+        self.assertEqual(res['Content-Length'], str(len(CONTENT)))
+        self.assertEqual(res['Accept-Ranges'], 'bytes')
+        self.assertEqual(b''.join(res.streaming_content), CONTENT)
+
+        res = self.client.get(media_url('photos/a.jpg'),
+                              HTTP_IF_MODIFIED_SINCE=res['Last-Modified'])
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_ranges(self):
+        """Test byte ranges are answered with 206"""
+        size = len(CONTENT)
+        for header, first, last in (('bytes=10-99', 10, 99),
+                                    ('bytes=70000-', 70000, size - 1),
+                                    ('bytes=-100', size - 100, size - 1),
+                                    ('bytes=0-9999999', 0, size - 1)):
+            res = self.client.get(media_url('photos/a.jpg'),
+                                  HTTP_RANGE=header)
+
+            self.assertEqual(res.status_code,
+                             status.HTTP_206_PARTIAL_CONTENT, header)
+            self.assertEqual(res['Content-Range'],
+                             'bytes %d-%d/%d' % (first, last, size))
+            self.assertEqual(b''.join(res.streaming_content),
+                             CONTENT[first:last + 1])
+
+    def test_unsatisfiable_range(self):
+        """Test a range past the end of the file gets a 416"""
+        res = self.client.get(media_url('photos/a.jpg'),
+                              HTTP_RANGE='bytes=999999-')
+
+        self.assertEqual(res.status_code,
+                         status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(res['Content-Range'], 'bytes */%d' % len(CONTENT))
+
+    def test_many_ranges_ignored(self):
+        """Test the whole file is sent for ranges it does not support"""
+        res = self.client.get(media_url('photos/a.jpg'),
+                              HTTP_RANGE='bytes=0-1,5-6')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_not_found(self):
+        """Test missing files and paths out of MEDIA_ROOT are not found"""
+        for path in ('photos/b.jpg', 'photos', '../secret.txt'):
+            res = self.client.get(media_url(path))
+
+            self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(MEDIA_ACCEL_REDIRECT='/protected-media/')
+    def test_accel_redirect(self):
+        """Test the front server is asked to send the file"""
+        res = self.client.get(media_url('photos/a.jpg'))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['X-Accel-Redirect'],
+                         '/protected-media/photos/a.jpg')
+        self.assertEqual(res.content, b'')
@@ -0,0 +1,120 @@
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from accounts.models import Tag
+from setari import profiling
+
+TAGS_URL = reverse('reteta:tag-list')
+METRICS_URL = reverse('metrics')
+
+
+def profiling_settings(**options):
+    return override_settings(PROFILING=dict(ENABLED=True, **options))
+
+
+class ProfilingMiddlewareTests(TestCase):
+    """Test the request profiling"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@chris.com',
+            'password123'
+        )
+        self.admin = get_user_model().objects.create_superuser(
+            'admin@chris.com',
+            'password123'
+        )
+        Tag.objects.create(user=self.user, name='Vegan')
+        profiling.registry.clear()
+        self.addCleanup(profiling.registry.clear)
+
+    def client_for(self, user):
+        # the middleware is loaded on the first request of a client
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def metrics(self):
+        res = self.client_for(self.admin).get(METRICS_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.content.decode()
+
+    def test_disabled_by_default(self):
+        """Test nothing is recorded unless enabled"""
+        self.client_for(self.user).get(TAGS_URL)
+
+        self.assertNotIn('reteta:tag-list', self.metrics())
+
+    @profiling_settings()
+    def test_request_recorded(self):
+        """Test the time, queries and size of a request are recorded"""
+        res = self.client_for(self.user).get(TAGS_URL)
+
+        metrics = self.metrics()
+        labels = '{method="GET",view="reteta:tag-list"'
+        self.assertIn('# TYPE http_request_duration_seconds histogram',
+                      metrics)
+        self.assertIn('http_request_duration_seconds_count%s} 1' % labels,
+                      metrics)
+        self.assertIn('http_request_db_queries_bucket%s,le="+Inf"} 1'
+                      % labels, metrics)
+        self.assertIn('http_request_db_queries_sum%s} 1' % labels, metrics)
+        self.assertIn('http_request_serializer_duration_seconds_count%s} 1'
+                      % labels, metrics)
+        self.assertIn('http_response_size_bytes_sum%s} %d'
+                      % (labels, len(res.content)), metrics)
+
+    @profiling_settings(SAMPLE_RATE=0)
+    def test_sampling(self):
+        """Test the requests left out of the sample are not recorded"""
+        self.client_for(self.user).get(TAGS_URL)
+
+        self.assertNotIn('reteta:tag-list', self.metrics())
+
+    def test_slow_requests_profiled(self):
+        """Test slow requests are dumped to PROFILE_DIR"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        with profiling_settings(PROFILE_DIR=directory, SLOW_REQUEST_MS=0):
+            self.client_for(self.user).get(TAGS_URL)
+
+        dumps = os.listdir(directory)
+        self.assertEqual(len(dumps), 1)
+        self.assertIn('GET-reteta-tag-list', dumps[0])
+
+    def test_metrics_staff_only(self):
+        """Test the metrics are not served to other users"""
+        res = self.client_for(self.user).get(METRICS_URL)
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+        res = APIClient().get(METRICS_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class RegistryTests(TestCase):
+    """Test the Prometheus rendering of the histograms"""
+
+    def test_render(self):
+        """Test the buckets are cumulative and labels escaped"""
+        registry = profiling.Registry()
+        labels = {'view': 'a"b', 'method': 'GET'}
+        registry.observe('http_request_db_queries', labels, 1)
+        registry.observe('http_request_db_queries', labels, 7)
+
+        text = registry.render()
+
+        labels = 'method="GET",view="a\\"b"'
+        self.assertIn('http_request_db_queries_bucket{%s,le="1"} 1'
+                      % labels, text)
+        self.assertIn('http_request_db_queries_bucket{%s,le="10"} 2'
+                      % labels, text)
+        self.assertIn('http_request_db_queries_sum{%s} 8' % labels, text)
+        self.assertIn('http_request_db_queries_count{%s} 2' % labels, text)
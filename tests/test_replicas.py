@@ -0,0 +1,164 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from accounts.models import Tag, Reteta
+from setari import replicas
+
+TAGS_URL = reverse('reteta:tag-list')
+RETETA_URL = reverse('reteta:reteta-list')
+REPLICAS = ('replica1', 'replica2')
+
+
+def detail_url(reteta_id):
+    return reverse('reteta:reteta-detail', args=[reteta_id])
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'],
+                   REPLICA_READ_YOUR_WRITES=5)
+class ReplicaRoutingTests(TestCase):
+    """Test the API reads from replicas, two SQLite files here"""
+    databases = {'default'} | set(REPLICAS)
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        for alias in REPLICAS:
+            connections.databases[alias] = dict(
+                connections.databases['default'],
+                NAME=os.path.join(cls.directory, alias + '.sqlite3'),
+                TEST={},
+            )
+            call_command('migrate', database=alias, verbosity=0)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        for alias in REPLICAS:
+            connections[alias].close()
+            del connections[alias]
+            del connections.databases[alias]
+        shutil.rmtree(cls.directory)
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'test@chris.com',
+            'password123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for alias in REPLICAS:
+            # the replica has not caught up with the last tag yet
+            get_user_model().objects.using(alias).create(
+                id=self.user.id, email=self.user.email
+            )
+            Tag.objects.using(alias).create(user_id=self.user.id,
+                                            name='Tag of ' + alias)
+
+    def tag_names(self):
+        res = self.client.get(TAGS_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [tag['name'] for tag in res.data['results']]
+
+    def test_list_reads_replica(self):
+        """Test the list actions read from the replica"""
+        Tag.objects.create(user=self.user, name='Primary')
+
+        self.assertEqual(self.tag_names(), ['Tag of replica1'])
+
+    def test_retrieve_reads_replica(self):
+        """Test a reteta missing from the replica is not found"""
+        reteta = Reteta.objects.create(
+            user=self.user, title='Primary', time_minutes=5, price=1
+        )
+
+        res = self.client.get(detail_url(reteta.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_read_your_writes(self):
+        """Test a user reads from the primary right after writing"""
+        res = self.client.post(TAGS_URL, {'name': 'Vegan'})
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Tag.objects.using('replica1').filter(
+            name='Vegan'
+        ).count(), 0)
+
+        self.assertEqual(self.tag_names(), ['Vegan'])
+
+        # other users are not affected
+        user2 = get_user_model().objects.create_user(
+            'other@chris.com',
+            'testpass'
+        )
+        self.client.force_authenticate(user2)
+        self.assertEqual(self.tag_names(), [])
+
+        # the window is over (and the cached lists expired)
+        cache.clear()
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.tag_names(), ['Tag of replica1'])
+
+    def test_failed_writes_not_tracked(self):
+        """Test invalid writes keep the user on the replicas"""
+        res = self.client.post(TAGS_URL, {'name': ''})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.assertEqual(self.tag_names(), ['Tag of replica1'])
+
+    def test_writes_go_to_primary(self):
+        """Test the writes and the other actions use the primary"""
+        res = self.client.post(RETETA_URL, {
+            'title': 'Ciorba', 'time_minutes': 30, 'price': '5.00',
+        })
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        cache.delete(replicas.RECENT_WRITE_KEY % self.user.id)
+
+        res = self.client.get(reverse('reteta:reteta-export'))
+        lines = b''.join(res.streaming_content).splitlines()
+
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(Reteta.objects.using('replica1').count(), 0)
+
+    @override_settings(DATABASE_REPLICAS=list(REPLICAS))
+    def test_one_replica_per_request(self):
+        """Test the replicas are picked per request"""
+        names = set()
+        for i in range(20):
+            cache.clear()
+            names.update(self.tag_names())
+
+        self.assertEqual(names, {'Tag of replica1', 'Tag of replica2'})
+
+
+class ConnectionHealthTests(TestCase):
+    """Test the persistent connections are checked per request"""
+
+    def test_unusable_connection_closed(self):
+        """Test a broken connection is closed when a request starts"""
+        connection = connections['default']
+        with mock.patch.object(connection, 'is_usable', return_value=False), \
+                mock.patch.object(connection, 'close') as close:
+            replicas.check_connections()
+
+        close.assert_called_once_with()
+
+    def test_usable_connection_kept(self):
+        """Test a working connection is reused"""
+        connection = connections['default']
+        with mock.patch.object(connection, 'close') as close:
+            replicas.check_connections()
+
+        close.assert_not_called()
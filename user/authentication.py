@@ -0,0 +1,102 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+
+SHARED_KEY = 'user:token:%s'
+
+
+def _setting(name, default):
+    return getattr(settings, 'AUTH_TOKEN_CACHE', {}).get(name, default)
+
+
+class LRUCache:
+    """Thread safe mapping keeping the most recently used entries
+
+    Entries older than `ttl` seconds are dropped when read.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                return None
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# token key -> (user, token) of this process
+token_cache = LRUCache(
+    max_size=_setting('MAX_SIZE', 10000),
+    ttl=_setting('TTL', 30),
+)
+
+
+def evict_tokens(keys):
+    """Forget the cached users of the given token keys"""
+    keys = list(keys)
+    for key in keys:
+        token_cache.delete(key)
+    if keys and _setting('SHARED', False):
+        cache.delete_many([SHARED_KEY % key for key in keys])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Token authentication caching the token -> user lookup
+
+    Users are kept in a per process LRU for AUTH_TOKEN_CACHE['TTL']
+    seconds and, with AUTH_TOKEN_CACHE['SHARED'], in the Django cache as
+    well. Entries are evicted by user.signals when the token is deleted
+    or the user is saved (deactivated, password changed...). Other
+    processes only see the eviction through the shared cache, their local
+    entries expire after the TTL.
+    """
+
+    def authenticate_credentials(self, key):
+        entry = token_cache.get(key)
+        if entry is None and _setting('SHARED', False):
+            entry = cache.get(SHARED_KEY % key)
+            if entry is not None:
+                token_cache.set(key, entry)
+        if entry is None:
+            # raises AuthenticationFailed for unknown keys or inactive users
+            entry = super().authenticate_credentials(key)
+            token_cache.set(key, entry)
+            if _setting('SHARED', False):
+                cache.set(SHARED_KEY % key, entry, _setting('TTL', 30))
+
+        user, token = entry
+        # requests must not share (and mutate) the same instance
+        return copy.copy(user), token
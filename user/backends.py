@@ -0,0 +1,35 @@
+from django.contrib.auth import backends, get_user_model
+
+from user import hashing
+
+
+class ModelBackend(backends.ModelBackend):
+    """Django's ModelBackend hashing in the pool of user.hashing
+
+    The hashes of older hashers (or costs) are replaced on a successful
+    login, so changing settings.PASSWORD_HASHERS upgrades the users as
+    they come back.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # hash anyway, the time taken does not tell the user exists
+            hashing.make_password(password)
+            return None
+
+        valid, must_update = hashing.verify(password, user.password)
+        if not valid:
+            return None
+        if must_update:
+            user.password = hashing.make_password(password)
+            user.save(update_fields=['password'])
+        if self.user_can_authenticate(user):
+            return user
+        return None
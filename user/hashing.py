@@ -0,0 +1,114 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+_executor = None
+_slots = None
+_executor_lock = threading.Lock()
+
+
+def _setting(name, default):
+    return getattr(settings, 'PASSWORD_HASHING', {}).get(name, default)
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    """Argon2 with the costs of settings.PASSWORD_HASHING['ARGON2']
+
+    Hashes made with other costs are upgraded when their user logs in.
+    """
+
+    def _cost(self, name):
+        return _setting('ARGON2', {}).get(
+            name, getattr(hashers.Argon2PasswordHasher, name)
+        )
+
+    @property
+    def time_cost(self):
+        return self._cost('time_cost')
+
+    @property
+    def memory_cost(self):
+        return self._cost('memory_cost')
+
+    @property
+    def parallelism(self):
+        return self._cost('parallelism')
+
+
+class BCryptSHA256PasswordHasher(hashers.BCryptSHA256PasswordHasher):
+    """bcrypt with settings.PASSWORD_HASHING['BCRYPT_ROUNDS']"""
+
+    @property
+    def rounds(self):
+        return _setting(
+            'BCRYPT_ROUNDS', hashers.BCryptSHA256PasswordHasher.rounds
+        )
+
+
+class HashingBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many logins at once, try again shortly.'
+    default_code = 'hashing_busy'
+
+
+def _get_pool():
+    global _executor, _slots
+    with _executor_lock:
+        if _executor is None:
+            workers = _setting('WORKERS', 4)
+            _executor = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix='user-hashing'
+            )
+            _slots = threading.BoundedSemaphore(
+                workers + _setting('QUEUE', 16)
+            )
+        return _executor, _slots
+
+
+def run(function, *args):
+    """Call `function` in the hashing pool of this process
+
+    At most WORKERS hashes run at once, so logins cannot take every CPU
+    from the other requests. Past QUEUE waiting hashes, the callers wait
+    up to TIMEOUT seconds for a place before HashingBusy (503).
+    """
+    executor, slots = _get_pool()
+    if not slots.acquire(timeout=_setting('TIMEOUT', 5)):
+        raise HashingBusy()
+    try:
+        return executor.submit(function, *args).result()
+    finally:
+        slots.release()
+
+
+def make_password(password):
+    """Hash `password` with the preferred hasher, in the pool"""
+    return run(hashers.make_password, password)
+
+
+def _verify(password, encoded):
+    if password is None or not hashers.is_password_usable(encoded):
+        return False, False
+    preferred = hashers.get_hasher('default')
+    try:
+        hasher = hashers.identify_hasher(encoded)
+    except ValueError:
+        return False, False
+    if not hasher.verify(password, encoded):
+        return False, False
+    return True, (hasher.algorithm != preferred.algorithm or
+                  preferred.must_update(encoded))
+
+
+def verify(password, encoded):
+    """Check `password` against a hash, in the pool
+
+    Returns (valid, must_update): whether the password matches, and
+    whether the hash is of an older hasher or cost and should be
+    replaced by make_password().
+    """
+    return run(_verify, password, encoded)
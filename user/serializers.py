@@ -1,6 +1,9 @@
 from django.contrib.auth import get_user_model, authenticate
 from django.utils.translation import ugettext_lazy as _
-from rest_framework import serializers
+from rest_framework import exceptions, serializers
+
+from user import hashing
+from user.throttling import LoginFailures
 
 
 # For Register
@@ -14,7 +17,16 @@ class UserSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         """Create a new user with encrypted pass and return it"""
-        return get_user_model().objects.create_user(**validated_data)
+        # hashed in the pool, see user.hashing
+        password = hashing.make_password(validated_data.pop('password'))
+        manager = get_user_model().objects
+        user = manager.model(
+            email=manager.normalize_email(validated_data.pop('email')),
+            password=password,
+            **validated_data
+        )
+        user.save()
+        return user
 
     def update(self, instance, validated_data):
         """Update a user, setting the password correctly and return it"""
@@ -22,7 +34,7 @@ class UserSerializer(serializers.ModelSerializer):
         user = super().update(instance, validated_data)
 
         if password:
-            user.set_password(password)
+            user.password = hashing.make_password(password)
             user.save()
 
         return user
@@ -41,15 +53,24 @@ class AuthTokenSerializer(serializers.Serializer):
         """Validate and authenticate the user"""
         email = attrs.get('email')
         password = attrs.get('password')
+        request = self.context.get('request')
+
+        # refused before hashing anything
+        failures = LoginFailures(request, email)
+        wait = failures.blocked()
+        if wait is not None:
+            raise exceptions.Throttled(wait)
 
         user = authenticate(
-            request=self.context.get('request'),
+            request=request,
             username=email,
             password=password
         )
         if not user:
+            failures.record()
             msg = _('Unable to authenticate with provided credentials')
             raise serializers.ValidationError(msg, code='authentication')
+        failures.reset()
 
         attrs['user'] = user
         return attrs
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from user.authentication import evict_tokens
+
+
+@receiver(post_delete, sender=Token)
+def evict_deleted_token(sender, instance, **kwargs):
+    """Stop authenticating with a deleted token right away"""
+    evict_tokens([instance.key])
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def evict_user_tokens(sender, instance, created, update_fields, **kwargs):
+    """Reload the user behind its tokens after it changes"""
+    # covers deactivation and password changes (UserSerializer.update)
+    if created or update_fields == frozenset(['last_login']):
+        return
+    evict_tokens(
+        Token.objects.filter(user=instance).values_list('key', flat=True)
+    )
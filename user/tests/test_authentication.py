@@ -0,0 +1,114 @@
+from unittest import mock
+
+from django.test import TestCase, SimpleTestCase
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from rest_framework import status
+from user.authentication import LRUCache, token_cache
+
+
+ME_URL = reverse('user:me')
+TAGS_URL = reverse('reteta:tag-list')
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Test caching the token lookup"""
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email='test@chris.com',
+            password='testpass',
+            name='name'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def test_token_lookup_cached(self):
+        """Test the token is looked up once"""
+        with self.assertNumQueries(1):
+            res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+        self.assertEqual(res.data['email'], self.user.email)
+
+    def test_invalid_token(self):
+        """Test unknown tokens are rejected and not cached"""
+        self.client.credentials(HTTP_AUTHORIZATION='Token nope')
+
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(len(token_cache), 0)
+
+    def test_deleted_token_rejected(self):
+        """Test a deleted token stops working immediately"""
+        self.client.get(ME_URL)
+
+        self.token.delete()
+
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_rejected(self):
+        """Test a deactivated user stops authenticating immediately"""
+        self.client.get(ME_URL)
+
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_change_evicts(self):
+        """Test changing the password reloads the cached user"""
+        self.client.get(ME_URL)
+
+        res = self.client.patch(ME_URL, {'password': 'newpassword'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        self.assertIsNone(token_cache.get(self.token.key))
+
+    def test_shared_cache(self):
+        """Test entries are read back from the shared cache"""
+        with self.settings(AUTH_TOKEN_CACHE={'SHARED': True}):
+            self.client.get(ME_URL)
+            token_cache.clear()
+
+            with self.assertNumQueries(0):
+                res = self.client.get(ME_URL)
+
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+
+class LRUCacheTests(SimpleTestCase):
+    """Test the in process LRU"""
+
+    def test_least_recently_used_evicted(self):
+        """Test the least recently used entry is dropped when full"""
+        lru = LRUCache(max_size=2, ttl=60)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+
+        lru.set('c', 3)
+
+        self.assertEqual(lru.get('a'), 1)
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(lru.get('c'), 3)
+
+    def test_expired_entry_dropped(self):
+        """Test entries expire after the TTL"""
+        lru = LRUCache(max_size=2, ttl=10)
+        with mock.patch('user.authentication.time.monotonic') as monotonic:
+            monotonic.return_value = 100
+            lru.set('a', 1)
+            monotonic.return_value = 111
+
+            self.assertIsNone(lru.get('a'))
+            self.assertEqual(len(lru), 0)
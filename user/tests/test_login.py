@@ -0,0 +1,150 @@
+import threading
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from user import hashing
+
+CREATE_USER_URL = reverse('user:create')
+TOKEN_URL = reverse('user:token')
+
+
+class PasswordHashingTests(TestCase):
+    """Test the hashers and the rehashing on login"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def login(self, password='testpass'):
+        return self.client.post(TOKEN_URL, {
+            'email': 'test@chris.com', 'password': password
+        })
+
+    def test_register_argon2(self):
+        """Test new passwords are hashed with Argon2"""
+        res = self.client.post(CREATE_USER_URL, {
+            'email': 'test@CHRIS.com', 'password': 'testpass', 'name': 'Test'
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        user = get_user_model().objects.get()
+        self.assertEqual(user.email, 'test@chris.com')
+        self.assertTrue(user.password.startswith('argon2$'))
+        self.assertIn('m=19456,t=2,p=1', user.password)
+        self.assertTrue(user.check_password('testpass'))
+
+    def test_rehash_older_hasher(self):
+        """Test a PBKDF2 hash is replaced on login"""
+        user = get_user_model().objects.create(
+            email='test@chris.com',
+            password=make_password('testpass', hasher='pbkdf2_sha256')
+        )
+
+        res = self.login()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('argon2$'))
+
+    def test_rehash_new_cost(self):
+        """Test the hashes of another Argon2 cost are replaced on login"""
+        user = get_user_model().objects.create_user(
+            'test@chris.com', 'testpass'
+        )
+        old = user.password
+
+        with override_settings(PASSWORD_HASHING={'ARGON2': {
+            'time_cost': 1, 'memory_cost': 1024, 'parallelism': 1
+        }}):
+            res = self.login()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        user.refresh_from_db()
+        self.assertNotEqual(user.password, old)
+        self.assertIn('m=1024,t=1,p=1', user.password)
+
+    def test_no_rehash_wrong_password(self):
+        """Test a failed login leaves the hash alone"""
+        user = get_user_model().objects.create(
+            email='test@chris.com',
+            password=make_password('testpass', hasher='pbkdf2_sha256')
+        )
+
+        res = self.login('wrong')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$'))
+
+    def test_hashing_busy(self):
+        """Test logins past the queue of the pool get a 503"""
+        get_user_model().objects.create_user('test@chris.com', 'testpass')
+        full = threading.BoundedSemaphore(1)
+        full.acquire()
+
+        with mock.patch.object(hashing, '_get_pool',
+                               return_value=(None, full)), \
+                override_settings(PASSWORD_HASHING={'TIMEOUT': 0.01}):
+            res = self.login()
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+@override_settings(LOGIN_RATE_LIMIT={
+    'EMAIL_FAILURES': 3, 'IP_FAILURES': 5, 'WINDOW': 60
+})
+class LoginRateLimitTests(TestCase):
+    """Test the failed logins are limited per email and per IP"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        get_user_model().objects.create_user('test@chris.com', 'testpass')
+
+    def login(self, email='test@chris.com', password='wrong', **extra):
+        return self.client.post(TOKEN_URL, {
+            'email': email, 'password': password
+        }, **extra)
+
+    def test_email_limit(self):
+        """Test an email is refused after its failures, without hashing"""
+        for i in range(3):
+            self.assertEqual(self.login().status_code,
+                             status.HTTP_400_BAD_REQUEST)
+
+        with mock.patch.object(hashing, 'run') as run:
+            res = self.login(email='TEST@chris.com ', password='testpass')
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(res['Retry-After'], '60')
+        run.assert_not_called()
+
+    def test_ip_limit(self):
+        """Test a client IP is refused after its failures"""
+        for i in range(5):
+            self.login(email='user%d@chris.com' % i)
+
+        res = self.login(password='testpass')
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+        res = self.login(password='testpass', REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_success_resets_email(self):
+        """Test a successful login forgets the failures of the email"""
+        for i in range(2):
+            self.login()
+        self.assertEqual(self.login(password='testpass').status_code,
+                         status.HTTP_200_OK)
+
+        for i in range(2):
+            self.login()
+        self.assertEqual(self.login(password='testpass').status_code,
+                         status.HTTP_200_OK)
@@ -1,3 +1,4 @@
+from django.core.cache import cache
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from django.urls import reverse
@@ -18,6 +19,8 @@ class PublicUserApiTests(TestCase):
     """Test the users API (public)"""
 
     def setUp(self):
+        # the failed logins are counted in the cache
+        cache.clear()
         self.client = APIClient()
 
     def test_create_valid_user_success(self):
@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.throttling import BaseThrottle
+
+EMAIL_KEY = 'user:login-failures:email:%s'
+IP_KEY = 'user:login-failures:ip:%s'
+
+
+def _setting(name, default):
+    return getattr(settings, 'LOGIN_RATE_LIMIT', {}).get(name, default)
+
+
+class LoginFailures:
+    """Count the failed logins of an email and of a client IP
+
+    The counters live in the default cache, shared by the processes, and
+    expire WINDOW seconds after the first failure. Once one of them
+    reaches its limit the logins are refused before any hashing.
+    """
+
+    def __init__(self, request, email):
+        self.keys = (
+            (EMAIL_KEY % email.strip().lower()[:254],
+             _setting('EMAIL_FAILURES', 5)),
+            (IP_KEY % BaseThrottle().get_ident(request),
+             _setting('IP_FAILURES', 50)),
+        )
+
+    def blocked(self):
+        """Return the seconds to wait before trying again, or None"""
+        counts = cache.get_many([key for key, limit in self.keys])
+        for key, limit in self.keys:
+            if counts.get(key, 0) >= limit:
+                return _setting('WINDOW', 900)
+        return None
+
+    def record(self):
+        window = _setting('WINDOW', 900)
+        for key, limit in self.keys:
+            # add() starts the window, incr() keeps its expiry
+            if not cache.add(key, 1, window):
+                try:
+                    cache.incr(key)
+                except ValueError:
+                    cache.set(key, 1, window)
+
+    def reset(self):
+        """Forget the failures of the email, after a successful login"""
+        cache.delete(self.keys[0][0])